@@ -0,0 +1,147 @@
+# Built-in modules
+import array
+import ipaddress
+import logging
+import socket
+import struct
+
+# Project modules
+import config
+from util import *
+
+# Networks never reachable as peers according to RFC 6890 and RFC 5735
+BOGONS = [
+	('0.0.0.0/8', Reason.unspecified),
+	('10.0.0.0/8', Reason.private),
+	('100.64.0.0/10', Reason.shared),
+	('127.0.0.0/8', Reason.loopback),
+	('169.254.0.0/16', Reason.link_local),
+	('172.16.0.0/12', Reason.private),
+	('192.0.0.0/24', Reason.reserved),
+	('192.0.2.0/24', Reason.documentation),
+	('192.168.0.0/16', Reason.private),
+	('198.18.0.0/15', Reason.benchmark),
+	('198.51.100.0/24', Reason.documentation),
+	('203.0.113.0/24', Reason.documentation),
+	('224.0.0.0/4', Reason.multicast),
+	('240.0.0.0/4', Reason.reserved),
+	('255.255.255.255/32', Reason.broadcast)]
+
+## Binary trie of IPv4 networks in flat arrays, longest prefix match wins
+class CIDRTrie:
+	def __init__(self):
+		# Node n has its children at 2n and 2n+1, zero marks a missing child as the root is never a child
+		self.children = array.array('l', [0, 0])
+		self.labels = [None]
+
+	## Add a network
+	#  @param network Network in CIDR notation
+	#  @param label Returned by lookup for addresses in the network
+	#  @exception ValueError
+	def insert(self, network, label):
+		network = ipaddress.IPv4Network(network, strict=False)
+		address = int(network.network_address)
+		node = 0
+		for depth in range(network.prefixlen):
+			bit = address >> (31 - depth) & 1
+			child = self.children[2 * node + bit]
+			if child == 0:
+				child = len(self.labels)
+				self.labels.append(None)
+				self.children.extend((0, 0))
+				self.children[2 * node + bit] = child
+			node = child
+		self.labels[node] = label
+
+	## Find the label of the most specific network containing an address
+	#  @param address IPv4 address as integer
+	#  @return Label or None
+	def lookup(self, address):
+		children, labels = self.children, self.labels
+		label = labels[0]
+		node = 0
+		for shift in range(31, -1, -1):
+			node = children[2 * node + (address >> shift & 1)]
+			if node == 0:
+				break
+			if labels[node] is not None:
+				label = labels[node]
+		return label
+
+## Decides which discovered endpoints are worth a connection attempt
+class AdmissionFilter:
+	## Compile built-in bogons and the user blocklist
+	#  @param blocklist_path File with one network in CIDR notation per line, # starts a comment
+	def __init__(self, blocklist_path):
+		self.blocklist_path = blocklist_path
+		self.compile()
+		self.own_addresses = own_addresses()
+		logging.info('Admission filter uses {} trie nodes, own addresses are {}'.format(len(self.trie.labels), self.own_addresses))
+
+	## Build the trie of dropped networks from the current configuration and replace the used one
+	def compile(self):
+		trie = CIDRTrie()
+		for network, reason in BOGONS:
+			if reason is not Reason.private or config.admission_drop_private:
+				trie.insert(network, reason)
+		self.load_blocklist(trie, self.blocklist_path)
+		self.trie = trie
+
+	## Add networks from a blocklist file
+	#  @param trie CIDRTrie to add to
+	#  @param path File path
+	def load_blocklist(self, trie, path):
+		try:
+			file = open(path)
+		except FileNotFoundError:
+			logging.info('Blocklist {} does not exist'.format(path))
+			return
+		except OSError as err:
+			logging.error('Could not read blocklist: {}'.format(err))
+			return
+		count = 0
+		with file:
+			for linenumber, line in enumerate(file, 1):
+				line = line.split('#')[0].strip()
+				if not line:
+					continue
+				try:
+					trie.insert(line, Reason.blocklist)
+				except ValueError as err:
+					logging.warning('Bad blocklist entry in line {}: {}'.format(linenumber, err))
+				else:
+					count += 1
+		logging.info('Loaded {} networks from blocklist {}'.format(count, path))
+
+	## Check an endpoint
+	#  @param ip_address IPv4 address as string
+	#  @param port Port number
+	#  @return Reason for dropping the endpoint or None to admit it
+	def check(self, ip_address, port):
+		if not 0 < port < 65536:
+			return Reason.bad_port
+		try:
+			address = struct.unpack('!I', socket.inet_aton(ip_address))[0]
+		except OSError:
+			return Reason.malformed_address
+		if ip_address in self.own_addresses and port == config.bittorrent_listen_port:
+			return Reason.own_address
+		return self.trie.lookup(address)
+
+## Collect IPv4 addresses of this host
+#  @return Set of address strings
+def own_addresses():
+	addresses = set(config.own_addresses)
+	try:
+		addresses.update(socket.gethostbyname_ex(socket.gethostname())[2])
+	except OSError as err:
+		logging.warning('Could not resolve own hostname: {}'.format(err))
+
+	# Address of the default route interface, connecting an UDP socket sends no packets
+	try:
+		with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+			sock.connect(('192.0.2.1', 9))
+			addresses.add(sock.getsockname()[0])
+	except OSError as err:
+		logging.warning('Could not determine default interface address: {}'.format(err))
+	return addresses
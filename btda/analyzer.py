@@ -7,8 +7,11 @@ import time
 import socketserver
 import socket
 import os
+import signal
 import telnetlib
 import gc
+import operator
+import urllib.parse
 
 # Project modules
 import tracker
@@ -16,6 +19,13 @@ import protocol
 import storage
 import torrent
 import dht
+import reachability
+import admission
+import checkpoint
+import control
+import metrics
+import eventlog
+import profiler
 import config
 from util import *
 
@@ -23,32 +33,39 @@ from util import *
 class SwarmAnalyzer:
 	## Initializes analyzer for peers of one torrent
 	#  @param debug Log to stdout and include debug messages
+	#  @param resume Output path with filename without file extension of an earlier analysis to continue, None for a new analysis
 	#  @exception AnalyzerError
-	def __init__(self, debug):
+	def __init__(self, debug, resume=None):
 		# Set output path
 		if not os.path.exists(config.output_path):
 			os.makedirs(config.output_path)
-		self.outfile = '{}{}_{}'.format(config.output_path, time.strftime('%Y-%m-%d_%H-%M-%S'), os.uname().nodename)
+		if resume is None:
+			self.outfile = '{}{}_{}'.format(config.output_path, time.strftime('%Y-%m-%d_%H-%M-%S'), os.uname().nodename)
+		elif os.path.exists(resume + '.sqlite'):
+			self.outfile = resume
+		else:
+			raise AnalyzerError('No database {}.sqlite to resume'.format(resume))
 
-		# Configure logging
-		logging_config = {'format': '[%(asctime)s:%(levelname)s:%(module)s:%(threadName)s] %(message)s', 'datefmt': '%dd%Hh%Mm%Ss'}
+		# Configure logging, records are written by a background thread
 		if debug:
-			logging_config['level'] = logging.DEBUG
+			eventlog.start_logging(None, logging.DEBUG)
 		else:
-			logging_config['level'] = logging.WARNING
 			logfile = '{}.log'.format(self.outfile)
 			print('Log is written to {}'.format(logfile))
-			logging_config['filename'] = logfile
-		logging.basicConfig(**logging_config)
+			eventlog.start_logging(logfile, logging.WARNING)
 
 		# Smart queue for peer management
-		self.peers = PrioritySetQueue()
-		self.visited_peers = queue.Queue()
-		self.all_incoming_ips = dict()
-		self.all_outgoing_ips = set()
+		self.peers = PrioritySetQueue(key=Peer.identity, shard=operator.attrgetter('torrent'), ready=Peer.is_due,
+				maxsize=config.peer_queue_size)
+		self.visited_peers = queue.Queue(config.visited_queue_size)
+		self.registry = PeerRegistry()
+
+		# Peers taken from the queue until they are put back or dropped, by identity, for checkpoints
+		self.in_flight = dict()
 
-		# Create torrent dictionary
+		# Create torrent dictionary, lock serializes registration of new torrents
 		self.torrents = dict()
+		self.torrents_lock = threading.Lock()
 
 		# Generate peer id
 		self.own_peer_id = protocol.generate_peer_id()
@@ -57,12 +74,21 @@ class SwarmAnalyzer:
 		self.active_success = SharedCounter()
 		self.incoming_total = DictCounter()
 		self.incoming_duplicate = DictCounter()
+		self.pex_total = DictCounter()
+		self.pex_duplicate = DictCounter()
 		if config.rec_dur_analysis:
 			self.eval_timer = list()
 		self.server_threads = SharedCounter()
 		self.evaluator_threads = SharedCounter()
-		self.peer_error = DictCounter()
-		self.tracker_error = DictCounter()
+		self.tracker_threads = SharedCounter()
+		self.magnet_threads = SharedCounter()
+		self.peer_error = ErrorCounter()
+		self.tracker_error = ErrorCounter()
+		self.pressure = StateTimer()
+		self.pressure_dropped = SharedCounter()
+
+		# Open sockets of evaluators, server threads and tracker requests, aborted at shutdown
+		self.connections = ConnectionGroup()
 
 		# Analysis parts, activated via starter methods
 		self.shutdown_request = threading.Event()
@@ -72,17 +98,114 @@ class SwarmAnalyzer:
 		self.peer_handler = False
 		self.dht_started = False
 		self.statistic_started = False
+		self.checkpoints_started = False
+		self.control_started = False
+		self.metrics_started = False
 
 		# Create database
 		self.database = storage.Database(self.outfile)
 
+		# Receive timeouts adapted to measured peer timing, one per peer source
+		self.receive_timeouts = {source: protocol.AdaptiveTimeout() for source in Source}
+
 		# Create thread activity timer
 		self.timer = ActivityTimer()
 
+		# Durations of evaluation phases by phase, source and outcome
+		self.latency = ThreadHistograms()
+
+		# Filter for discovered endpoints
+		self.admission = admission.AdmissionFilter(config.input_path + config.blocklist_file)
+
+		# Cache of already fetched info dicts of magnet links
+		self.metadata_cache = torrent.MetadataCache(os.path.join(config.input_path, config.metadata_cache))
+
+		# Sources and evaluations paused via the control interface, by name
+		self.paused = set()
+
+		# Torrent keys by real path of torrent files imported from the input directory and info hashes of the magnet file, to detect removed input
+		self.torrent_files = dict()
+		self.magnet_hashes = set()
+
+		# Learn which peers are likely reachable, persisted between runs
+		self.reachability = reachability.ReachabilityModel(config.output_path + config.reachability_file)
+
+		# Persist the revisit schedule and peer equality information to resume after crashes
+		self.checkpoint = checkpoint.Checkpoint(self.outfile, Peer)
+
+		# Stack sampling and memory tracing on demand
+		self.profiler = profiler.SamplingProfiler(self.outfile)
+		self.profiler_signals = queue.SimpleQueue()
+
+		# Metrics for scraping, recorded always and served via start_metrics
+		self.metrics = metrics.Registry()
+		self.metric_evaluations = self.metrics.counter('btda_evaluations_total', 'Finished peer evaluations', ('source', 'outcome'))
+		self.metric_connects = self.metrics.counter('btda_connects_total', 'Outcome of TCP connects to peers', ('result',))
+		self.metric_tracker = self.metrics.histogram('btda_tracker_request_seconds', 'Duration of tracker requests',
+				('host', 'request', 'result'))
+		self.metric_database = self.metrics.histogram('btda_database_write_seconds', 'Duration of database writes', ('operation',))
+		self._register_gauges()
+
 	## Resouces are allocated in starter methods
 	def __enter__(self):
 		return self
 
+	## Expose state as metrics read at scrape time
+	def _register_gauges(self):
+		gauge = self.metrics.gauge
+		gauge('btda_peer_queue', 'Peers in the main queue', lambda: len(self.peers))
+		gauge('btda_visited_queue', 'Evaluated peers waiting for the peer handler', self.visited_peers.qsize)
+		gauge('btda_handler_queue', 'Queue depth per peer handler stage',
+				lambda: {(stage.name,): stage.queue.qsize() for stage in self.handler_stages} if self.peer_handler else None, ('stage',))
+		gauge('btda_unique_incoming', 'Unique incoming peers', self.registry.incoming_count)
+		gauge('btda_active_success', 'Successful active evaluations since start', self.active_success.get)
+		gauge('btda_evaluator_threads', 'Evaluator threads in a peer evaluation', self.evaluator_threads.get)
+		gauge('btda_evaluator_limit', 'Current limit of active evaluators',
+				lambda: self.evaluator_limit.limit if self.active_evaluation else None)
+		gauge('btda_server_threads', 'Threads evaluating incoming peers', self.server_threads.get)
+		gauge('btda_torrents', 'Analyzed torrents', lambda: len(self.torrents))
+
+	## Restore torrents from the database and peers from the last checkpoint of an earlier analysis
+	#  @note Call before importing and requesting peers
+	#  @exception AnalyzerError
+	def resume(self):
+		# Torrents keep their database keys
+		input_path = os.path.join(os.path.realpath(config.input_path), '')
+		with self.torrents_lock:
+			for key, (new_torrent, path, name) in self.database.load_torrents().items():
+				self.torrents[key] = new_torrent
+				if path.endswith('.torrent') and os.path.realpath(path).startswith(input_path):
+					self.torrent_files[os.path.realpath(path)] = key
+				self.peers.configure(key,
+						weight=config.torrent_weights.get(new_torrent.info_hash_hex, 1),
+						cap=config.torrent_connection_caps.get(new_torrent.info_hash_hex, config.torrent_connection_cap))
+		logging.info('Resumed {} torrents'.format(len(self.torrents)))
+
+		# Queue and equality information
+		content, incoming, outgoing = self.checkpoint.load()
+		for key in list(content):
+			if key not in self.torrents:
+				logging.warning('Checkpoint contains peers of unknown torrent {}'.format(key))
+				del content[key]
+		self.peers.restore(content)
+		self.registry.restore(incoming, outgoing)
+		print('Resumed {} torrents, {} queued peers and {} incoming peers'.format(len(self.torrents), len(self.peers), len(incoming)))
+
+	## Check if a torrent is already analyzed, e.g. after resume
+	#  @param info_hash Info hash
+	#  @return True if known
+	def _is_known(self, info_hash):
+		return self._find_torrent(info_hash) is not None
+
+	## Look up a torrent by info hash
+	#  @param info_hash Info hash
+	#  @return Torrent key or None
+	def _find_torrent(self, info_hash):
+		for key, known in list(self.torrents.items()):
+			if known.info_hash == info_hash:
+				return key
+		return None
+
 	## Reads all torrent files from input directory
 	def import_torrents(self):
 		# Import all files
@@ -98,59 +221,130 @@ class SwarmAnalyzer:
 
 				# Read torrent file
 				path = os.path.join(dirname, filename)
-				torrent_file = torrent.TorrentFile(path)
-				announce_url = torrent_file.get_announce_url()
-				info_dict_bencoded = torrent_file.get_info_dict()
-				info_dict = torrent.InfoDict(info_dict_bencoded)
-				info_hash = info_dict.get_info_hash()
-				piece_size = info_dict.get_piece_length()
-				pieces_count = info_dict.get_pieces_count()
-				name = info_dict.get_name()
-
-				# Store in database and dictionary
-				info_hash_hex = bytes_to_hex(info_hash)
-				complete_threshold = protocol.get_complete_threshold(pieces_count)
-				new_torrent = Torrent(announce_url, info_hash, info_hash_hex, pieces_count, piece_size, complete_threshold)
-				key = self.database.store_torrent(new_torrent, path, name)
-				self.torrents[key] = new_torrent
+				key = self.import_torrent_file(path)
+				if key is not None:
+					self.torrent_files[os.path.realpath(path)] = key
 
-	## Read magnet links from file
-	#  @note Call start_dht_connection first
+	## Read one torrent file and start its analysis
+	#  @param path Path of the torrent file
+	#  @return Torrent key, None if the torrent is already analyzed
+	#  @exception AnalyzerError
+	def import_torrent_file(self, path):
+		torrent_file = torrent.TorrentFile(path)
+		announce_url = torrent_file.get_announce_url()
+		info_dict_bencoded = torrent_file.get_info_dict()
+		info_dict = torrent.InfoDict(info_dict_bencoded)
+		info_hash = info_dict.get_info_hash()
+		piece_size = info_dict.get_piece_length()
+		pieces_count = info_dict.get_pieces_count()
+		name = info_dict.get_name()
+		if self._is_known(info_hash):
+			logging.info('Skipping already analyzed torrent {}'.format(path))
+			return None
+
+		# Store in database and dictionary
+		info_hash_hex = bytes_to_hex(info_hash)
+		complete_threshold = protocol.get_complete_threshold(pieces_count)
+		new_torrent = Torrent(announce_url, info_hash, info_hash_hex, pieces_count, piece_size, complete_threshold)
+		return self._register_torrent(new_torrent, path, name)
+
+	## Read magnet links from file and resolve them concurrently in the background
+	#  @note Call start_tracker_requests first to contact trackers as soon as a magnet link is resolved
 	def import_magnets(self):
 		filename = os.path.join(config.input_path, config.magnet_file)
 		if not os.path.exists(filename):
 			logging.info('Magnet file {} does not exist, nothing to import'.format(filename))
 			return
+
+		# Parse all magnet links before any network activity
+		magnets = queue.Queue()
+		for item in self._read_magnet_file(filename):
+			magnets.put(item)
+			self.magnet_hashes.add(item[2])
+
+		# Start resolver threads
+		logging.info('Resolving {} magnet links in {} threads'.format(magnets.qsize(), config.magnet_import_threads))
+		self._start_magnet_resolvers(magnets, filename, min(config.magnet_import_threads, magnets.qsize()))
+
+	## Parse a magnet file
+	#  @param filename Path of the magnet file
+	#  @return List of line number, magnet link and info hash tuples
+	#  @exception FileError
+	def _read_magnet_file(self, filename):
+		magnets = list()
 		linenumber = 0
-		with open(filename) as file:
-			for magnet in file:
-				# Skip empty lines
-				linenumber += 1
-				logging.info('Parsing magnet link form {}, line {} ...'.format(filename, linenumber))
-				magnet = magnet.rstrip('\n')
-				if magnet == '':
-					continue
+		try:
+			with open(filename) as file:
+				for magnet in file:
+					# Skip empty lines
+					linenumber += 1
+					logging.info('Parsing magnet link form {}, line {} ...'.format(filename, linenumber))
+					magnet = magnet.rstrip('\n')
+					if magnet == '':
+						continue
+					info_hash = torrent.hash_from_magnet(magnet)
+					magnets.append((linenumber, magnet, info_hash))
+		except OSError as err:
+			raise FileError('Could not read magnet file: {}'.format(err))
+		return magnets
+
+	## Resolve a single magnet link in the background and start its analysis
+	#  @param magnet Magnet link
+	#  @param origin Description of the origin for log messages
+	#  @exception FileError
+	def add_magnet(self, magnet, origin='control'):
+		magnets = queue.Queue()
+		magnets.put((1, magnet, torrent.hash_from_magnet(magnet)))
+		self._start_magnet_resolvers(magnets, origin, 1)
+
+	## Start threads resolving magnet links
+	#  @param magnets Queue of line number, magnet link and info hash tuples
+	#  @param filename Path of the magnet file
+	#  @param number Number of threads
+	def _start_magnet_resolvers(self, magnets, filename, number):
+		for i in range(number):
+			self.magnet_threads.increment()
+			thread = threading.Thread(target=self._magnet_resolver, args=(magnets, filename))
+			thread.daemon = True
+			thread.start()
+
+	## Fetch metadata for queued magnet links and register the resulting torrents
+	#  @param magnets Queue of line number, magnet link and info hash tuples
+	#  @param filename Path of the magnet file
+	#  @note This is a worker method to be started as a thread
+	def _magnet_resolver(self, magnets, filename):
+		dht_conn = None
+		while not self.shutdown_request.is_set():
+			try:
+				linenumber, magnet, info_hash = magnets.get_nowait()
+			except queue.Empty:
+				break
+			if self._is_known(info_hash):
+				logging.info('Skipping already analyzed magnet link in line {}'.format(linenumber))
+				continue
 
+			# Use cached metadata if available
+			info_dict_bencoded = self.metadata_cache.get(info_hash)
+			if info_dict_bencoded is None:
 				# Get peers for metadata aquisition
-				info_hash = torrent.hash_from_magnet(magnet)
-				dht_conn = dht.DHT()
-				metadata_peers = dht_conn.get_peers(info_hash)
-				dht_conn.close()
-
-				# Fetch metadata from a peer
-				own_peer_id = protocol.generate_peer_id()
-				for peer in metadata_peers:
-					logging.info('Trying to fetch metadata from peer ...')
-					try:
-						info_dict_bencoded = protocol.get_ut_metadata(info_hash, peer, own_peer_id)
-					except (PeerError, UtilError) as err:
-						logging.warning('Failed to fetch metadata: {}'.format(err))
-					else:
-						break
-				else:
-					raise AnalyzerError('Could not fetch metadata from any peer')
+				try:
+					if dht_conn is None:
+						dht_conn = dht.DHT()
+					metadata_peers = dht_conn.get_peers(info_hash)
+				except DHTError as err:
+					logging.error('No metadata peers for magnet link in line {}: {}'.format(linenumber, err))
+					continue
 
-				# Decode info dict
+				# Fetch metadata from the first responding peers
+				try:
+					info_dict_bencoded = protocol.fetch_metadata(info_hash, metadata_peers, self.own_peer_id)
+				except PeerError as err:
+					logging.error('Magnet link in line {}: {}'.format(linenumber, err))
+					continue
+				self.metadata_cache.put(info_hash, info_dict_bencoded)
+
+			# Decode info dict
+			try:
 				tracker = torrent.tracker_from_magnet(magnet)
 				info_dict = torrent.InfoDict(info_dict_bencoded)
 				info_hash_hex = bytes_to_hex(info_hash)
@@ -158,28 +352,210 @@ class SwarmAnalyzer:
 				piece_size = info_dict.get_piece_length()
 				complete_threshold = protocol.get_complete_threshold(pieces_count)
 				name = info_dict.get_name()
+			except FileError as err:
+				logging.error('Magnet link in line {}: {}'.format(linenumber, err))
+				continue
 
-				# Store in database and dictionary
-				new_torrent = Torrent(tracker, info_hash, info_hash_hex, pieces_count, piece_size, complete_threshold)
-				key = self.database.store_torrent(new_torrent, filename, name)
-				self.torrents[key] = new_torrent
+			# Store in database and dictionary, starts analysis of this torrent
+			new_torrent = Torrent(tracker, info_hash, info_hash_hex, pieces_count, piece_size, complete_threshold)
+			try:
+				self._register_torrent(new_torrent, filename, name)
+			except AnalyzerError as err:
+				logging.error('Magnet link in line {}: {}'.format(linenumber, err))
+
+		# Release resources
+		if dht_conn is not None:
+			dht_conn.close()
+		self.magnet_threads.decrement()
+
+	## Store a torrent in database and dictionary and start its tracker requests if enabled
+	#  @param new_torrent Torrent named tuple
+	#  @param path File system path the torrent was read from
+	#  @param name Display name of the torrent
+	#  @return Database id
+	#  @exception AnalyzerError
+	def _register_torrent(self, new_torrent, path, name):
+		with self.torrents_lock:
+			for id, known in self.torrents.items():
+				if known.info_hash == new_torrent.info_hash:
+					raise AnalyzerError('Duplicate torrent: id {}, hash {}'.format(id, new_torrent.info_hash_hex))
+			key = self.database.store_torrent(new_torrent, path, name)
+			if key >= 2 ** 16:
+				raise AnalyzerError('Torrent key {} exceeds packed peer identity'.format(key))
+			self.torrents[key] = new_torrent
+			self.peers.configure(key,
+					weight=config.torrent_weights.get(new_torrent.info_hash_hex, 1),
+					cap=config.torrent_connection_caps.get(new_torrent.info_hash_hex, config.torrent_connection_cap))
+			if self.tracker_requests:
+				self._start_tracker_requestor(key)
+		return key
+
+	## Poll the input directory and the magnet file, analyze new torrents and stop removed ones
+	def start_input_watcher(self):
+		thread = threading.Thread(target=self._input_watcher)
+		thread.daemon = True
+		thread.start()
 
-	## Raise exception when duplicate torrents found
-	def torrent_duplicates(self):
-		info_hashes = set()
-		for id, torrent in self.torrents.items():
-			if torrent.info_hash in info_hashes:
-				raise AnalyzerError('Duplicate torrent: id {}, hash {}'.format(id, torrent.info_hash_hex))
-			info_hashes.add(torrent.info_hash)
+	## Compare the input with the last poll
+	#  @note This is a worker method to be started as a thread
+	def _input_watcher(self):
+		magnet_filename = os.path.join(config.input_path, config.magnet_file)
+		magnet_mtime = get_mtime(magnet_filename)
+		ignored = dict() # real path -> mtime of unusable or duplicate torrent files
+		while not self.shutdown_request.wait(config.watch_interval):
+			# Torrent files, only those imported from the input directory are tracked
+			present = dict()
+			for dirname, dirnames, filenames in os.walk(config.input_path):
+				for filename in filenames:
+					if filename.endswith('.torrent'):
+						path = os.path.realpath(os.path.join(dirname, filename))
+						present[path] = get_mtime(path)
+			for path, mtime in present.items():
+				if path in self.torrent_files or ignored.get(path) == mtime:
+					continue
+				logging.info('Found new torrent file {}'.format(path))
+				try:
+					key = self.import_torrent_file(path)
+					if key is None:
+						ignored[path] = mtime
+					else:
+						self.torrent_files[path] = key
+				except AnalyzerError as err:
+					logging.error('Could not import {}: {}'.format(path, err))
+					ignored[path] = mtime
+			for path in list(self.torrent_files):
+				if path not in present:
+					logging.info('Torrent file {} was removed'.format(path))
+					key = self.torrent_files.pop(path)
+					try:
+						self.remove_torrent(key)
+					except AnalyzerError as err:
+						logging.warning(err)
+			for path in list(ignored):
+				if path not in present:
+					del ignored[path]
+
+			# Magnet file
+			mtime = get_mtime(magnet_filename)
+			if mtime == magnet_mtime:
+				continue
+			magnet_mtime = mtime
+			try:
+				magnets = self._read_magnet_file(magnet_filename) if mtime is not None else list()
+			except FileError as err:
+				logging.error('Magnet file changed: {}'.format(err))
+				continue
+			hashes = set(info_hash for linenumber, magnet, info_hash in magnets)
+			added = queue.Queue()
+			for item in magnets:
+				if item[2] not in self.magnet_hashes:
+					added.put(item)
+			for info_hash in self.magnet_hashes - hashes:
+				key = self._find_torrent(info_hash)
+				if key is not None:
+					logging.info('Magnet link of torrent {} was removed'.format(key))
+					try:
+						self.remove_torrent(key)
+					except AnalyzerError as err:
+						logging.warning(err)
+			self.magnet_hashes = hashes
+			if added.qsize():
+				logging.info('Resolving {} new magnet links'.format(added.qsize()))
+				self._start_magnet_resolvers(added, magnet_filename, min(config.magnet_import_threads, added.qsize()))
+
+	## Stop the analysis of a torrent, its requestors end on their next iteration and queued peers are dropped
+	#  @param key Torrent key
+	#  @exception AnalyzerError
+	def remove_torrent(self, key):
+		with self.torrents_lock:
+			try:
+				removed = self.torrents.pop(key)
+			except KeyError:
+				raise AnalyzerError('Unknown torrent key {}'.format(key))
+			dropped = self.peers.remove_shard(key)
+		logging.info('Removed torrent {} with {} queued peers'.format(removed.info_hash_hex, dropped))
+		return removed
+
+	## Apply a configuration value changed at runtime to running subsystems
+	#  @note Most values are read on each use and need no action
+	#  @param name Name of the configuration value
+	def config_changed(self, name):
+		if name in ('peer_evaluation_threads', 'peer_evaluation_threads_min') and self.active_evaluation:
+			self.set_evaluator_limit(self.evaluator_limit.limit)
+		elif name == 'peer_queue_size':
+			self.peers.maxsize = config.peer_queue_size
+		elif name == 'timeout_quantile':
+			for receive_timeout in self.receive_timeouts.values():
+				receive_timeout.set_quantile(config.timeout_quantile)
+		elif name == 'admission_drop_private':
+			self.admission.compile()
+		elif name in ('torrent_weights', 'torrent_connection_cap', 'torrent_connection_caps'):
+			with self.torrents_lock:
+				for key, known in self.torrents.items():
+					self.peers.configure(key,
+							weight=config.torrent_weights.get(known.info_hash_hex, 1),
+							cap=config.torrent_connection_caps.get(known.info_hash_hex, config.torrent_connection_cap))
+
+	## Current state without resetting any statistic
+	#  @return Dict of JSON serializable values
+	def read_status(self):
+		status = {
+			'torrents': {key: known.info_hash_hex for key, known in list(self.torrents.items())},
+			'paused': sorted(self.paused),
+			'peer_queue': len(self.peers),
+			'visited_queue': self.visited_peers.qsize(),
+			'unique_incoming': self.registry.incoming_count(),
+			'success_active': self.active_success.get(),
+			'evaluator_threads': self.evaluator_threads.get(),
+			'server_threads': self.server_threads.get(),
+			'tracker_threads': self.tracker_threads.get(),
+			'magnet_threads': self.magnet_threads.get()}
+		if self.active_evaluation:
+			status['evaluator_limit'] = self.evaluator_limit.limit
+		if self.peer_handler:
+			status['handler_stages'] = {stage.name: stage.queue.qsize() for stage in self.handler_stages}
+		return status
 
-	## Evaluates all peers in the queue
+	## Evaluates all peers in the queue with an adaptive number of threads
 	def start_active_evaluation(self):
 		# Concurrency management
-		self.active_shutdown_done = threading.Barrier(config.peer_evaluation_threads + 1)
+		self.evaluator_limit = ConcurrencyLimit(config.peer_evaluation_threads_initial)
+		self.evaluator_workers = SharedCounter()
+		self.limit_decisions = DictCounter()
+		self.connect_attempts = SharedCounter()
+		self.connect_success = SharedCounter()
+		self.evaluation_latency = WindowStatistic()
+
+		# Create initial threads, the controller adds more up to the hard cap
+		logging.info('Connecting to peers in {} of at most {} threads'.format(config.peer_evaluation_threads_initial,
+				config.peer_evaluation_threads))
+		self.evaluators_started = 0
+		self.evaluators_lock = threading.Lock()
+		self.set_evaluator_limit(config.peer_evaluation_threads_initial)
+		thread = threading.Thread(target=self._concurrency_controller)
+		thread.daemon = True
+		thread.start()
 
-		# Create thread pool
-		logging.info('Connecting to peers in {} threads'.format(config.peer_evaluation_threads))
-		for i in range(config.peer_evaluation_threads):
+		# Remember activation to enable shutdown
+		self.active_evaluation = True
+
+	## Change the number of active evaluators and start missing threads
+	#  @param limit New limit, clamped to the configured bounds
+	#  @return Applied limit
+	def set_evaluator_limit(self, limit):
+		limit = min(max(limit, config.peer_evaluation_threads_min), config.peer_evaluation_threads)
+		with self.evaluators_lock:
+			if limit > self.evaluators_started:
+				self._add_evaluators(limit - self.evaluators_started)
+				self.evaluators_started = limit
+		self.evaluator_limit.set_limit(limit)
+		return limit
+
+	## Start additional evaluator threads
+	#  @param number Number of threads
+	def _add_evaluators(self, number):
+		for i in range(number):
+			self.evaluator_workers.increment()
 			# Create a thread with worker callable
 			thread = threading.Thread(target=self._evaluator)
 			# Thread dies when main thread exits
@@ -187,8 +563,49 @@ class SwarmAnalyzer:
 			# Start thread
 			thread.start()
 
-		# Remember activation to enable shutdown
-		self.active_evaluation = True
+	## Adapt the number of active evaluators by additive increase and multiplicative decrease
+	#  @note This is a worker method to be started as a thread
+	def _concurrency_controller(self):
+		baseline_success = None
+		while not self.shutdown_request.wait(config.concurrency_interval):
+			# Measure interval
+			attempts = self.connect_attempts.take()
+			success_rate = self.connect_success.take() / attempts if attempts else None
+			evaluations, latency = self.evaluation_latency.take()
+			backlog = self.visited_peers.qsize()
+			try:
+				load = os.getloadavg()[0] / os.cpu_count()
+			except OSError:
+				load = 0
+			limit = self.evaluator_limit.limit
+
+			# Decide on new limit
+			if backlog > config.concurrency_max_backlog:
+				decision = 'decrease:backlog'
+			elif load > config.concurrency_max_load:
+				decision = 'decrease:load'
+			elif latency is not None and latency > config.concurrency_target_latency:
+				decision = 'decrease:latency'
+			elif success_rate is not None and baseline_success is not None and success_rate < baseline_success * config.concurrency_success_drop:
+				decision = 'decrease:success'
+			elif self.evaluator_threads.get() >= limit * 0.9:
+				decision = 'increase'
+			else:
+				decision = 'hold'
+			if decision == 'increase':
+				new_limit = limit + config.concurrency_step
+			elif decision.startswith('decrease'):
+				new_limit = int(limit * config.concurrency_backoff)
+			else:
+				new_limit = limit
+			if success_rate is not None:
+				baseline_success = success_rate if baseline_success is None else (baseline_success * 3 + success_rate) / 4
+
+			# Apply limit and start missing threads
+			new_limit = self.set_evaluator_limit(new_limit)
+			logging.info('Evaluator limit {} -> {} ({}, success {}, latency {}, backlog {}, load {})'.format(
+					limit, new_limit, decision, success_rate, latency, backlog, load))
+			self.limit_decisions.count(decision)
 
 	## Evaluate peers from main queue
 	#  @note This is a worker method to be started as a thread
@@ -199,153 +616,256 @@ class SwarmAnalyzer:
 
 		# Start main loop
 		while not self.shutdown_request.is_set():
-			# Get new peer, wait on empty queue
+			# Park while the controller limits concurrency
+			self.timer.inactive(thread)
+			permitted = self.evaluator_limit.acquire()
+			self.timer.active(thread)
+			if not permitted:
+				break
 			try:
-				peer = self.peers.get()
-			except PrioritySetQueueEmpty:
-				self.timer.inactive(thread)
-				self.shutdown_request.wait(config.evaluator_reaction)
-				self.timer.active(thread)
-				continue
-			if peer.source is Source.incoming:
-				logging.critical('Trying to visit incoming peer')
-
-			# Delay evaluation
-			delay = peer.revisit - time.perf_counter()
-			if delay > 0:
-				logging.info('Delaying peer evaluation for {} seconds, target is {} minutes ...'.format(config.evaluator_reaction, delay/60))
-				self.timer.inactive(thread)
-				self.shutdown_request.wait(config.evaluator_reaction)
-				self.timer.active(thread)
-				self.peers.force_put(peer)
-				continue
+				# Slow down while evaluated peers are not stored fast enough
+				if self.visited_peers.full():
+					self.pressure.set('visited', True)
+					self.timer.inactive(thread)
+					self.shutdown_request.wait(config.evaluator_reaction)
+					self.timer.active(thread)
+					continue
+				self.pressure.set('visited', False)
 
-			# Establish connection
-			self.evaluator_threads.increment()
-			if peer.key is None:
-				logging.info('Connecting to new peer ...')
-			else:
-				logging.info('Reconnecting to peer {} ...'.format(peer.key))
-			try:
-				sock = socket.create_connection((peer.ip_address, peer.port), config.network_timeout)
-			except OSError as err:
-				if peer.key is None:
-					self.peer_error.count('First contact,{}'.format(err))
-				else:
-					self.peer_error.count('Later contact,{}'.format(err))
-				self.evaluator_threads.decrement()
-				continue
-			logging.debug('Connection established')
+				# Park while paused via the control interface
+				if 'active' in self.paused:
+					self.timer.inactive(thread)
+					self.shutdown_request.wait(config.evaluator_reaction)
+					self.timer.active(thread)
+					continue
 
-			# Contact peer
-			dht_port = config.dht_node_port if self.dht_started else None
-			try:
-				result = protocol.evaluate_peer(sock, self.own_peer_id, self.dht_started, self.torrents[peer.torrent].info_hash)
+				# Get a due peer, wait while none is due
+				try:
+					peer = self.peers.get()
+				except PrioritySetQueueEmpty:
+					self.timer.inactive(thread)
+					self.shutdown_request.wait(config.evaluator_reaction)
+					self.timer.active(thread)
+					continue
 
-			# Handle bad peers
-			except PeerError as err:
-				if peer.key is None:
-					self.peer_error.count('First contact,{}'.format(err))
-				else:
-					self.peer_error.count('Later contact,{}'.format(err))
-				self.evaluator_threads.decrement()
-				continue
+				# Evaluate peer, release its torrent's connection slot afterwards
+				self.in_flight[peer.identity()] = peer
+				try:
+					if not self._visit(peer):
+						self.in_flight.pop(peer.identity(), None)
+				finally:
+					self.peers.task_done(peer)
+			finally:
+				self.evaluator_limit.release()
 
-			# Catch all exceptions to enable ongoing analysis, should never happen
-			except Exception as err:
-				tb = traceback.format_tb(err.__traceback__)
-				logging.critical('{} during peer evaluation: {}\n{}'.format(type(err).__name__, err, ''.join(tb)))
+		# Propagate shutdown finish
+		self.timer.unregister(thread)
+		self.evaluator_workers.decrement()
+
+	## Evaluate one peer taken from the main queue
+	#  @param peer The peer
+	#  @return True if the peer was passed to the peer handler, False if it was dropped
+	def _visit(self, peer):
+		if peer.source is Source.incoming:
+			logging.critical('Trying to visit incoming peer')
+		current = self.torrents.get(peer.torrent)
+		if current is None:
+			logging.info('Dropping peer of removed torrent %s', peer.torrent)
+			return False
+
+		# Establish connection
+		self.evaluator_threads.increment()
+		self.connect_attempts.increment()
+		start = time.perf_counter()
+		if peer.key is None:
+			logging.info('Connecting to new peer ...')
+		else:
+			logging.info('Reconnecting to peer %s ...', peer.key)
+		try:
+			sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.connections.add(sock)
+		except (OSError, UtilError):
+			self.evaluator_threads.decrement()
+			return False
+		try:
+			sock.settimeout(config.network_timeout)
+			sock.connect((peer.ip_address, peer.port))
+			rtt = time.perf_counter() - start
+		except OSError as err:
+			self._release_connection(sock)
+			if self.shutdown_request.is_set():
 				self.evaluator_threads.decrement()
-				continue
+				return False
+			self.latency.record(('connect', peer.source.name, 'fail'), time.perf_counter() - start)
+			eventlog.event('evaluation', ip=peer.ip_address, port=peer.port, torrent=peer.torrent, source=peer.source.name,
+					outcome='connect fail', error=str(err), seconds=time.perf_counter() - start)
+			reason = classify_error(err, Reason.other_network)
+			self.metric_connects.inc(reason.name)
+			self.metric_evaluations.inc(peer.source.name, 'connect fail')
+			if peer.key is None:
+				self.peer_error.count('First contact', reason)
+			else:
+				self.peer_error.count('Later contact', reason)
+			self.reachability.observe(peer, False)
+			self.evaluator_threads.decrement()
+			return False
+		logging.debug('Connection established')
+		self.connect_success.increment()
+		self.metric_connects.inc('success')
+		self.latency.record(('connect', peer.source.name, 'success'), rtt)
+
+		# Contact peer
+		phases = dict()
+		try:
+			result = protocol.evaluate_peer(sock, self.own_peer_id, self.dht_started, current.info_hash,
+					self.receive_timeouts[peer.source], rtt, phases)
 
-			# Close connection
-			try:
-				sock.close()
-			except OSError as err:
-				logging.warning('Closing of connectioin failed: {}'.format(err))
+		# Handle bad peers, errors caused by aborted connections at shutdown are no peer errors
+		except PeerError as err:
+			self._release_connection(sock)
+			if self.shutdown_request.is_set():
+				self.evaluator_threads.decrement()
+				return False
+			self.metric_evaluations.inc(peer.source.name, 'protocol fail')
+			record_phases(self.latency, phases, peer.source.name, 'fail')
+			eventlog.event('evaluation', ip=peer.ip_address, port=peer.port, torrent=peer.torrent, source=peer.source.name,
+					outcome='protocol fail', error=str(err), seconds=time.perf_counter() - start)
+			reason = classify_error(err, Reason.other_protocol)
+			if peer.key is None:
+				self.peer_error.count('First contact', reason)
 			else:
-				logging.debug('Connection closed')
+				self.peer_error.count('Later contact', reason)
+			self.reachability.observe(peer, False)
+			self.evaluator_threads.decrement()
+			return False
 
-			# Put in visited queue
-			peer.revisit = time.perf_counter() + config.peer_revisit_delay
-			self.visited_peers.put((peer, result))
-			self.active_success.increment()
+		# Catch all exceptions to enable ongoing analysis, should never happen
+		except Exception as err:
+			self._release_connection(sock)
+			tb = traceback.format_tb(err.__traceback__)
+			logging.critical('%s during peer evaluation: %s\n%s', type(err).__name__, err, ''.join(tb))
 			self.evaluator_threads.decrement()
+			return False
+
+		# Close connection
+		self._release_connection(sock)
+
+		# Put in visited queue
+		self.reachability.observe(peer, True)
+		peer.visited = time.perf_counter()
+		self.evaluation_latency.add(peer.visited - start)
+		record_phases(self.latency, phases, peer.source.name, 'success')
+		eventlog.event('evaluation', ip=peer.ip_address, port=peer.port, torrent=peer.torrent, source=peer.source.name,
+				outcome='success', messages=len(result[2]), seconds=peer.visited - start)
+		self.visited_peers.put((peer, result))
+		self.active_success.increment()
+		self.metric_evaluations.inc(peer.source.name, 'success')
+		self.evaluator_threads.decrement()
+		return True
 
-		# Propagate shutdown finish
-		self.active_shutdown_done.wait()
+	## Remove a socket from the connection group and close it
+	#  @param sock Socket
+	def _release_connection(self, sock):
+		self.connections.discard(sock)
+		try:
+			sock.close()
+		except OSError as err:
+			logging.warning('Closing of connectioin failed: {}'.format(err))
+		else:
+			logging.debug('Connection closed')
 
 	## Continuously asks the tracker server for new peers
 	#  @note Start passive evaluation first to ensure port propagation
+	#  @note Torrents registered later get their tracker requests started on registration
 	def start_tracker_requests(self):
-		# Extract torrents with tracker
-		torrents_with_tracker = list()
-		for torrent_id in self.torrents:
-			if self.torrents[torrent_id].announce_url is not None:
-				torrents_with_tracker.append(torrent_id)
-
-		# Concurrency management
-		self.tracker_shutdown_done = threading.Barrier(len(torrents_with_tracker) + 1)
-
-		# Create tracker request threads
-		for torrent_id in torrents_with_tracker:
-			thread = threading.Thread(target=self._tracker_requestor, args=(torrent_id,))
-			thread.daemon = True
-			thread.start()
-
-		# Remember activation to enable shutdown
-		self.tracker_requests = True
+		with self.torrents_lock:
+			# Create tracker request threads
+			for torrent_id in self.torrents:
+				self._start_tracker_requestor(torrent_id)
+
+			# Remember activation to enable shutdown and to start threads for new torrents
+			self.tracker_requests = True
+
+	## Start the tracker request thread of one torrent
+	#  @param torrent_id Torrent key
+	def _start_tracker_requestor(self, torrent_id):
+		if self.torrents[torrent_id].announce_url is None:
+			return
+		self.tracker_threads.increment()
+		thread = threading.Thread(target=self._tracker_requestor, args=(torrent_id,))
+		thread.daemon = True
+		thread.start()
 
 	## Issues GET request to tracker, puts received peers in queue, wait an interval
 	#  @param torrent_key Torrent key specifying the target torrent and tracker
 	#  @note This is a worker method to be started as a thread
 	def _tracker_requestor(self, torrent_key):
 		while not self.shutdown_request.is_set():
+			# End when the torrent was removed, skip requests while paused
+			current = self.torrents.get(torrent_key)
+			if current is None:
+				logging.info('Stopping tracker requests for removed torrent %s', torrent_key)
+				break
+			announce_urls = current.announce_url if 'tracker' not in self.paused else list()
+
 			is_first_announce_url = True
-			for announce_url in self.torrents[torrent_key].announce_url:
+			for announce_url in announce_urls:
+				# Break out on termination
+				if self.shutdown_request.is_set():
+					break
+
 				# Create tracker connection
-				tracker_conn = tracker.TrackerCommunicator(self.own_peer_id, announce_url, self.torrents[torrent_key].pieces_count)
+				tracker_conn = tracker.TrackerCommunicator(self.own_peer_id, announce_url, current.pieces_count, self.connections)
+				host = urllib.parse.urlparse(announce_url).hostname
 
 				# Try scrape request
 				if is_first_announce_url:
 					is_first_announce_url = False
+					start = time.perf_counter()
 					try:
-						seeders, completed, leechers = tracker_conn.scrape_request(self.torrents[torrent_key].info_hash)
-						self.tracker_error.count('{},{},scrape success,'.format(torrent_key, announce_url))
+						seeders, completed, leechers = tracker_conn.scrape_request(current.info_hash)
+						self.tracker_error.count((torrent_key, announce_url, 'scrape success'), Reason.none)
+						self.metric_tracker.observe(time.perf_counter() - start, host, 'scrape', 'success')
+						eventlog.event('tracker', torrent=torrent_key, url=announce_url, request='scrape', result='success',
+								seeders=seeders, completed=completed, leechers=leechers, seconds=time.perf_counter() - start)
 					except TrackerError as err:
 						seeders = completed = leechers = None
-						self.tracker_error.count('{},{},scrape fail,{}'.format(torrent_key, announce_url, err))
+						if self.shutdown_request.is_set():
+							break
+						self.tracker_error.count((torrent_key, announce_url, 'scrape fail'), classify_error(err))
+						self.metric_tracker.observe(time.perf_counter() - start, host, 'scrape', 'fail')
+						eventlog.event('tracker', torrent=torrent_key, url=announce_url, request='scrape', result='fail',
+								error=str(err), seconds=time.perf_counter() - start)
 				else:
 					seeders = completed = leechers = None
 
 				# Ask tracker
-				logging.info('Contacting tracker for torrent with id {}'.format(torrent_key))
+				logging.info('Contacting tracker for torrent with id %s', torrent_key)
 				try:
 					start = time.perf_counter()
-					tracker_interval, peer_ips = tracker_conn.announce_request(self.torrents[torrent_key].info_hash)
+					tracker_interval, peer_ips = tracker_conn.announce_request(current.info_hash)
 					end = time.perf_counter()
-					self.tracker_error.count('{},{},announce success,'.format(torrent_key, announce_url))
+					self.tracker_error.count((torrent_key, announce_url, 'announce success'), Reason.none)
+					self.metric_tracker.observe(end - start, host, 'announce', 'success')
+					eventlog.event('tracker', torrent=torrent_key, url=announce_url, request='announce', result='success',
+							peers=len(peer_ips), interval=tracker_interval, seconds=end - start)
 				except TrackerError as err:
-					self.tracker_error.count('{},{},announce fail,{}'.format(torrent_key, announce_url, err))
+					if self.shutdown_request.is_set():
+						break
+					self.tracker_error.count((torrent_key, announce_url, 'announce fail'), classify_error(err))
+					self.metric_tracker.observe(time.perf_counter() - start, host, 'announce', 'fail')
+					eventlog.event('tracker', torrent=torrent_key, url=announce_url, request='announce', result='fail',
+							error=str(err), seconds=time.perf_counter() - start)
 				else:
 					# Log recommended interval
 					if config.tracker_request_interval > tracker_interval:
-						logging.warning('Tracker wished interval of {} but we are using {} minutes'.format(tracker_interval/60,
-								config.tracker_request_interval/60))
+						logging.warning('Tracker wished interval of %s but we are using %s minutes', tracker_interval/60,
+								config.tracker_request_interval/60)
 					else:
-						logging.info('Tracker recommended interval of {} minutes'.format(tracker_interval/60))
+						logging.info('Tracker recommended interval of %s minutes', tracker_interval/60)
 
 					# Put peers in queue
-					duplicate_counter = 0
-					for peer_ip in peer_ips:
-						new_peer = Peer()
-						new_peer.revisit = 0
-						new_peer.ip_address = peer_ip[0]
-						new_peer.port = peer_ip[1]
-						new_peer.source = Source.tracker
-						new_peer.torrent = torrent_key
-						if not self.peers.put(new_peer):
-							duplicate_counter += 1
+					duplicate_counter = self._queue_new_peers(peer_ips, Source.tracker, torrent_key)
 					try:
 						self.database.store_request(Source.tracker, len(peer_ips), duplicate_counter,
 								seeders, completed, leechers, end-start, torrent_key)
@@ -353,11 +873,50 @@ class SwarmAnalyzer:
 						logging.critical(err)
 
 			# Wait interval
-			logging.info('Waiting {} minutes until next tracker request ...'.format(config.tracker_request_interval/60))
+			logging.info('Waiting %s minutes until next tracker request ...', config.tracker_request_interval/60)
 			self.shutdown_request.wait(config.tracker_request_interval)
 
 		# Propagate thread termination
-		self.tracker_shutdown_done.wait()
+		self.tracker_threads.decrement()
+
+	## Put newly discovered peers in the main queue, ordered by predicted reachability
+	#  @note Peers rejected by the admission filter are counted in the peer error statistic
+	#  @note Peers are dropped while the main queue is full, they are queued again when rediscovered later
+	#  @param peer_ips List of ip port tuples
+	#  @param source Source enum of the discovery
+	#  @param torrent_key Torrent key
+	#  @return Number of duplicate peers
+	def _queue_new_peers(self, peer_ips, source, torrent_key):
+		duplicate_counter = 0
+		if source.name in self.paused or torrent_key not in self.torrents:
+			return duplicate_counter
+		for index, peer_ip in enumerate(peer_ips):
+			# Drop unreachable and blocked endpoints
+			reason = self.admission.check(*peer_ip)
+			if reason is not None:
+				self.peer_error.count('Admission', reason)
+				continue
+
+			new_peer = Peer()
+			new_peer.ip_address = peer_ip[0]
+			new_peer.port = peer_ip[1]
+			new_peer.source = source
+			new_peer.torrent = torrent_key
+			if config.reachability_prediction:
+				new_peer.revisit = -self.reachability.predict(new_peer)
+			else:
+				new_peer.revisit = 0
+			try:
+				if not self.peers.put(new_peer):
+					duplicate_counter += 1
+			except PrioritySetQueueFull:
+				self.pressure.set('peers', True)
+				dropped = len(peer_ips) - index
+				self.pressure_dropped.increment(dropped)
+				logging.warning('Main queue is full, dropped {} {} peers'.format(dropped, source.name))
+				return duplicate_counter
+		self.pressure.set('peers', False)
+		return duplicate_counter
 
 	## Starts a multithreaded TCP server to analyze incoming peers
 	#  @exception AnalyzerError
@@ -372,11 +931,16 @@ class SwarmAnalyzer:
 				peer_error=self.peer_error,
 				dht_enabled=self.dht_started,
 				server_threads=self.server_threads,
-				all_outgoing_ips=self.all_outgoing_ips)
+				registry=self.registry,
+				receive_timeout=self.receive_timeouts[Source.incoming],
+				connections=self.connections,
+				paused=self.paused,
+				metric_evaluations=self.metric_evaluations,
+				latency=self.latency)
 		logging.info('Listening on {}:{} for incomming peer connections'.format(*address))
 
 		# Activate the server in it's own thread
-		server_thread = threading.Thread(target=self.server.serve_forever)
+		server_thread = threading.Thread(target=self.server.serve_forever, args=(config.server_poll_interval,))
 		server_thread.daemon = True
 		server_thread.start()
 
@@ -385,84 +949,188 @@ class SwarmAnalyzer:
 
 	## Comsumes peers from database queue and put back in main queue
 	def start_peer_handler(self):
-		# Start handler thread
-		thread = threading.Thread(target=self._peer_handler)
-		thread.daemon = True
-		thread.start()
+		# Create stages, each feeding the next one
+		requeue = PipelineStage('requeue', self._requeue_stage, config.handler_requeue_threads, config.handler_stage_size)
+		persist = PipelineStage('persist', self._persist_stage, 1, config.handler_stage_size, config.handler_persist_batch, requeue)
+		enrich = PipelineStage('enrich', self._enrich_stage, config.handler_enrich_threads, config.handler_stage_size, output=persist)
+		decode = PipelineStage('decode', self._decode_stage, config.handler_decode_threads, output=enrich, input_queue=self.visited_peers)
+		self.handler_stages = [decode, enrich, persist, requeue]
+
+		# Start handler threads
+		for stage in self.handler_stages:
+			stage.start()
 
 		# Remember activation to enable shutdown
 		self.peer_handler = True
 
-	## Consumes peers and stores them in the database
-	#  @note This is a worker method to be started as a thread
-	def _peer_handler(self):
-		# Log thread id
-		logging.info('The identifier for this peer handler thread is {}'.format(threading.get_ident()))
-
-		while True:
-			# Get new peer to store
-			peer, result = self.visited_peers.get()
+	## Calculate downloaded pieces from received messages
+	#  @param items List of peer and evaluation result tuples
+	#  @return List of Visit objects
+	def _decode_stage(self, items):
+		visits = list()
+		for peer, result in items:
 			rec_peer_id, rec_info_hash, messages, duration = result
+			current = self.torrents.get(peer.torrent)
+			if current is None:
+				self.in_flight.pop(peer.identity(), None)
+				continue
 
 			# Store duration
 			if config.rec_dur_analysis and duration:
 				self.eval_timer.append(duration)
 
 			# Evaluate messages
-			bitfield = protocol.bitfield_from_messages(messages, self.torrents[peer.torrent].pieces_count)
+			bitfield = protocol.bitfield_from_messages(messages, current.pieces_count)
 
 			# Evaluate bitfield
 			downloaded_pieces = protocol.count_bits(bitfield)
-			percentage = int(downloaded_pieces * 100 / self.torrents[peer.torrent].pieces_count)
-			remaining = self.torrents[peer.torrent].pieces_count - downloaded_pieces
-			logging.debug('Peer reports to have {} pieces, {} remaining, equals {}%'.format(downloaded_pieces, remaining, percentage))
+			percentage = int(downloaded_pieces * 100 / current.pieces_count)
+			remaining = current.pieces_count - downloaded_pieces
+			logging.debug('Peer reports to have %s pieces, %s remaining, equals %s%%', downloaded_pieces, remaining, percentage)
 
-			# Recognize reconnecting peers, port may differ
-			equality = (peer.ip_address, peer.torrent)
+			# Update peer with results
+			peer.id = rec_peer_id
+			peer.record_visit(downloaded_pieces)
+			visits.append(Visit(peer, protocol.peers_from_pex(messages)))
+		return visits
+
+	## Geolocate peers which are probably new
+	#  @param visits List of Visit objects
+	#  @return The visits
+	def _enrich_stage(self, visits):
+		for visit in visits:
+			peer = visit.peer
+			if peer.source is Source.incoming and self.registry.incoming_key(peer.ip_address, peer.torrent) is not None:
+				continue
+			if peer.key is None:
+				visit.location = self.database.get_place_by_ip(peer.ip_address)
+		return visits
+
+	## Store peers in the database with one commit per batch and remember their equality information
+	#  @param visits List of Visit objects
+	#  @return Visits of committed peers, peers whose rows could not be stored are dropped
+	#  @note Runs in a single thread, which serializes duplicate detection of incoming peers
+	def _persist_stage(self, visits):
+		# Count incoming peers, reconnecting ones are recognized by address as the port may differ
+		batch_incoming = set()
+		for visit in visits:
+			peer = visit.peer
 			if peer.source is Source.incoming:
 				self.incoming_total.count(peer.torrent)
-				try:
-					peer.key = self.all_incoming_ips[equality]
-				except KeyError:
-					pass
-				else:
+				address = (peer.ip_address, peer.torrent)
+				if address in batch_incoming or self.registry.incoming_key(*address) is not None:
 					self.incoming_duplicate.count(peer.torrent)
+				batch_incoming.add(address)
+		keys = [visit.peer.key for visit in visits]
 
-			# Update peer with results
-			peer.id = rec_peer_id
-			peer.pieces = downloaded_pieces
+		# Store the batch with one commit, on failure store each peer with its own commit
+		try:
+			self._store_visits(visits)
+			stored = visits
+		except DatabaseError as err:
+			logging.critical('Storing batch of {} peers failed, retrying each peer: {}'.format(len(visits), err))
+			self.database.rollback()
+			stored = list()
+			for visit, key in zip(visits, keys):
+				visit.peer.key = key
+				visit.new_key = None
+				try:
+					self._store_visits([visit])
+				except DatabaseError as err:
+					logging.critical(err)
+					self.database.rollback()
+					self.in_flight.pop(visit.peer.identity(), None)
+					continue
+				self._register_stored([visit])
+				stored.append(visit)
+			return stored
+
+		self._register_stored(stored)
+		return stored
+
+	## Store visits in the database and commit them
+	#  @param visits List of Visit objects, new_key is set for new peers
+	#  @note Incoming peers are matched by address to committed ones and to new ones earlier in the list
+	#  @exception DatabaseError
+	def _store_visits(self, visits):
+		pending = dict()
+		for visit in visits:
+			peer = visit.peer
+			if peer.source is Source.incoming:
+				address = (peer.ip_address, peer.torrent)
+				peer.key = self.registry.incoming_key(*address)
+				if peer.key is None and address in pending:
+					peer.key = pending[address]
 
 			# Store evaluated peer and receive database key
+			start = time.perf_counter()
 			try:
-				new_peer_key = self.database.store_peer(peer)
+				visit.new_key = self.database.store_peer(peer, visit.location, commit=False)
 			except Exception as err:
-				self.visited_peers.task_done()
-				logging.critical(err)
+				self.latency.record(('persist', peer.source.name, 'fail'), time.perf_counter() - start)
+				raise DatabaseError(str(err)) from err
+			duration = time.perf_counter() - start
+			self.metric_database.observe(duration, 'store peer')
+			self.latency.record(('persist', peer.source.name, 'success'), duration)
+			if peer.key is None and visit.new_key is None:
+				raise DatabaseError('No peer id from database')
+			if visit.new_key and peer.source is Source.incoming:
+				pending[(peer.ip_address, peer.torrent)] = visit.new_key
+
+		# Commit batch
+		start = time.perf_counter()
+		self.database.commit()
+		self.metric_database.observe(time.perf_counter() - start, 'commit')
+
+	## Remember equality information and checkpoint new peers after their commit
+	#  @param visits List of committed Visit objects
+	def _register_stored(self, visits):
+		for visit in visits:
+			if not visit.new_key:
 				continue
-			if peer.key is None and new_peer_key is None:
-				logging.critical('No peer id from database')
-
-
-			# Remember equality information of new incoming peers
-			if new_peer_key:
-				if peer.source is Source.incoming:
-					self.all_incoming_ips[equality] = new_peer_key
-				else:
-					self.all_outgoing_ips.add(equality)
-
-			# Discard all incoming
+			peer = visit.peer
+			if peer.source is Source.incoming:
+				self.registry.add_incoming(peer.ip_address, peer.torrent, visit.new_key)
+				if config.checkpoint_enabled:
+					self.checkpoint.record_incoming(peer.ip_address, peer.torrent, visit.new_key)
+			else:
+				self.registry.add_outgoing(peer.ip_address, peer.torrent)
+				if config.checkpoint_enabled:
+					self.checkpoint.record_outgoing(peer.ip_address, peer.torrent)
+
+	## Put unfinished peers back in the main queue and queue peers received via peer exchange
+	#  @param visits List of Visit objects
+	#  @return Empty list, last stage
+	def _requeue_stage(self, visits):
+		for visit in visits:
+			peer = visit.peer
+
+			# Queue peers received via peer exchange
+			if visit.pex_peers:
+				self.pex_total.count(peer.torrent, len(visit.pex_peers))
+				self.pex_duplicate.count(peer.torrent, self._queue_new_peers(visit.pex_peers, Source.pex, peer.torrent))
+
+			# Discard all incoming and peers of removed torrents
+			current = self.torrents.get(peer.torrent)
 			if peer.source is Source.incoming:
-				self.visited_peers.task_done()
+				continue
+			if current is None:
+				self.in_flight.pop(peer.identity(), None)
 				continue
 
 			# Write back peer when not finished and add key if necessary
-			if peer.pieces < self.torrents[peer.torrent].complete_threshold:
+			if peer.pieces < current.complete_threshold:
 				if peer.key is None:
-					peer.key = new_peer_key
+					peer.key = visit.new_key
+				peer.revisit = peer.visited + peer.revisit_delay(current)
+				peer.scheduled = True
 				self.peers.force_put(peer)
-
-			# Allow waiting for all peers to be stored at shutdown
-			self.visited_peers.task_done()
+				if config.checkpoint_enabled:
+					self.checkpoint.record_peer(peer)
+			elif config.checkpoint_enabled:
+				self.checkpoint.record_known(peer.identity())
+			self.in_flight.pop(peer.identity(), None)
+		return list()
 
 	## Extract new peers from DHT
 	#  @exception AnalyzerError
@@ -485,12 +1153,16 @@ class SwarmAnalyzer:
 	## Requests new peers from the node for all torrents repeatingly
 	def _dht_requestor(self):
 		while not self.shutdown_request.is_set():
-			for key in self.torrents:
+			for key, current in list(self.torrents.items()):
+				# Skip requests while paused
+				if 'dht' in self.paused:
+					break
+
 				# Request peers
 				start = time.perf_counter()
 				dht_peers = list()
 				try:
-					dht_peers = self.dht_conn.get_peers(self.torrents[key].info_hash)
+					dht_peers = self.dht_conn.get_peers(current.info_hash)
 				except DHTError as err:
 					logging.error('Could not receive DHT peers: {}'.format(err))
 				except Exception as err:
@@ -499,16 +1171,7 @@ class SwarmAnalyzer:
 				end = time.perf_counter()
 
 				# Put in queue
-				duplicate_counter = 0
-				for peer in dht_peers:
-					new_peer = Peer()
-					new_peer.revisit = 0
-					new_peer.ip_address = peer[0]
-					new_peer.port = peer[1]
-					new_peer.source = Source.dht
-					new_peer.torrent = key
-					if not self.peers.put(new_peer):
-						duplicate_counter += 1
+				duplicate_counter = self._queue_new_peers(dht_peers, Source.dht, key)
 				try:
 					self.database.store_request(Source.dht, len(dht_peers), duplicate_counter,
 							None, None, None, end-start, key)
@@ -539,33 +1202,147 @@ class SwarmAnalyzer:
 		# Remember activation to enable shutdown
 		self.statistic_started = True
 
+	## Accept commands to change settings, torrents and sources at runtime
+	#  @exception AnalyzerError
+	def start_control(self):
+		self.control = control.ControlServer(config.output_path + config.control_socket, self)
+		self.control.start()
+		print('Control socket is {}'.format(self.control.path))
+
+		# Remember activation to enable shutdown
+		self.control_started = True
+
+	## Write evaluations, tracker requests and failed database writes to a structured event log
+	def start_event_log(self):
+		filename = '{}.events.jsonl'.format(self.outfile)
+		eventlog.start_events(filename)
+		print('Events are written to {}'.format(filename))
+
+	## Toggle the sampling profiler on SIGUSR1 and write memory growth reports on SIGUSR2
+	#  @note Must be called from the main thread
+	def start_profiler_signals(self):
+		thread = threading.Thread(target=self._profiler_controller, name='profiler-control')
+		thread.daemon = True
+		thread.start()
+		signal.signal(signal.SIGUSR1, self._profiler_signal)
+		signal.signal(signal.SIGUSR2, self._profiler_signal)
+		logging.info('Toggle profiling with "kill -SIGUSR1 {0}", trace memory with "kill -SIGUSR2 {0}"'.format(os.getpid()))
+
+	## Signal handler of the profiler signals, only hands the signal to the profiler controller
+	#  @note The interrupted main thread may hold the profiler lock, so the handler must not act itself
+	#  @param signum Signal number
+	#  @param frame Interrupted frame
+	def _profiler_signal(self, signum, frame):
+		self.profiler_signals.put(signum)
+
+	## Act on received profiler signals until None is received
+	#  @note This is a worker method to be started as a thread
+	def _profiler_controller(self):
+		for signum in iter(self.profiler_signals.get, None):
+			try:
+				if signum == signal.SIGUSR1:
+					self.profiler.toggle()
+				else:
+					self.profiler.memory_diff()
+			except FileError as err:
+				logging.error(err)
+
+	## Serve metrics over HTTP in the Prometheus text format
+	#  @exception AnalyzerError
+	def start_metrics(self):
+		self.metrics_server = metrics.MetricsServer((config.metrics_host, config.metrics_port), self.metrics)
+		self.metrics_server.start()
+		print('Metrics are served on http://{}:{}/metrics'.format(config.metrics_host, config.metrics_port))
+
+		# Remember activation to enable shutdown
+		self.metrics_started = True
+
+	## Write peer and tracker error counts to CSV files
+	def write_error_stats(self):
+		self.peer_error.write_csv(self.outfile+'_peer-error.txt')
+		self.tracker_error.write_csv(self.outfile+'_tracker-error.txt')
+
+	## Periodically write checkpoints
+	def start_checkpoints(self):
+		if not config.checkpoint_enabled:
+			return
+		thread = threading.Thread(target=self._checkpoint_writer)
+		thread.daemon = True
+		thread.start()
+
+		# Remember activation to enable shutdown
+		self.checkpoints_started = True
+
+	## Append the checkpoint log and replace the snapshot in intervals
+	#  @note This is a worker method to be started as a thread
+	def _checkpoint_writer(self):
+		last_snapshot = time.perf_counter()
+		while not self.shutdown_request.wait(config.checkpoint_interval):
+			try:
+				if time.perf_counter() - last_snapshot > config.checkpoint_snapshot_interval:
+					last_snapshot = time.perf_counter()
+					self.checkpoint.write_snapshot(self.peers, self.registry, self.in_flight.copy().values())
+				else:
+					self.checkpoint.flush()
+			except FileError as err:
+				logging.error(err)
+
 	## Store connection statistics to database
 	def _statistic_logger(self):
 		first = True
+		last_success = 0
+		last_time = time.perf_counter()
 		while not self.shutdown_request.is_set():
 			if first:
 				first = False
 			else:
 				self.shutdown_request.wait(config.statistic_interval)
 			logging.info('Logging analysis statistics to database ...')
+
+			# Rate of successful active evaluations since last statistic
+			success = self.active_success.get()
+			now = time.perf_counter()
+			success_per_minute = (success - last_success) * 60 / (now - last_time)
+			last_success, last_time = success, now
+			workload, workload_distribution = self.timer.read()
+
 			try:
 				self.database.store_statistic(
 						peer_queue=len(self.peers),
 						visited_queue=self.visited_peers.qsize(),
-						unique_incoming=len(self.all_incoming_ips),
-						success_active=self.active_success.get(),
-						thread_workload=self.timer.read(),
+						unique_incoming=self.registry.incoming_count(),
+						success_active=success,
+						success_per_minute=success_per_minute,
+						thread_workload=workload,
+						workload_distribution=workload_distribution,
+						torrent_share=self.peers.read_shares(),
 						server_threads=self.server_threads.get(),
-						evaluator_threads=self.evaluator_threads.get())
+						evaluator_threads=self.evaluator_threads.get(),
+						evaluator_limit=self.evaluator_limit.limit if self.active_evaluation else None,
+						limit_decisions=self.limit_decisions.take() if self.active_evaluation else dict(),
+						handler_stages=[stage.read() for stage in self.handler_stages] if self.peer_handler else list(),
+						peer_queue_fill=len(self.peers) / config.peer_queue_size if config.peer_queue_size else None,
+						visited_queue_fill=self.visited_peers.qsize() / config.visited_queue_size if config.visited_queue_size else None,
+						backpressure=self.pressure.take(),
+						pressure_dropped=self.pressure_dropped.take())
 			except Exception as err:
 				logging.critical(err)
 
-			# Store peer connection errors
-			self.peer_error.write_csv(self.outfile+'_peer-error.txt')
-			self.tracker_error.write_csv(self.outfile+'_tracker-error.txt')
+			# Store latency percentiles of the evaluation phases since last statistic
+			try:
+				self.database.store_latency(self.latency.take())
+			except Exception as err:
+				logging.critical(err)
+
+			# Persist learned reachability
+			self.reachability.save()
+
+			# Store peer connection errors, only at shutdown while metrics are served
+			if not self.metrics_started:
+				self.write_error_stats()
 
 			# Store incoming peer statistics
-			for id in self.torrents:
+			for id in list(self.torrents):
 				try:
 					self.database.store_request(
 						source = Source.incoming,
@@ -576,6 +1353,17 @@ class SwarmAnalyzer:
 				except Exception as err:
 					logging.critical(err)
 
+				# Store peer exchange statistics
+				try:
+					self.database.store_request(
+						source = Source.pex,
+						received_peers = self.pex_total.reset(id),
+						duplicate_peers = self.pex_duplicate.reset(id),
+						seeders=None, completed=None, leechers=None, duration=None,
+						torrent = id)
+				except Exception as err:
+					logging.critical(err)
+
 		# Propagate thread termination
 		self.statistic_shutdown.set()
 
@@ -598,49 +1386,106 @@ class SwarmAnalyzer:
 				tb_lines = traceback.format_tb(tb)
 				logging.critical('{}: {}\n{}'.format(exc_type.__name__, exc_value, ''.join(tb_lines)))
 
-		# Propagate shutdown request
+		# Propagate shutdown request, wake sleeping threads and abort all network communication
 		self.shutdown_request.set()
+		if self.control_started:
+			self.control.close()
+		self.connections.cancel()
+		if self.dht_started:
+			self.dht_conn.interrupt()
+		if self.active_evaluation:
+			self.evaluator_limit.close()
+		deadline = time.perf_counter() + config.shutdown_timeout
+		remaining = lambda: max(deadline - time.perf_counter(), 0)
 
 		# Plot message receive durations for timeout calibration
 		if config.rec_dur_analysis:
 			plot_receive_duration(self.eval_timer, self.outfile)
 
 		# Wait for termination
+		if self.magnet_threads.get() > 0:
+			print('Waiting for magnet link resolvers to finish ...', end='', flush=True)
+			print_wait_result(self.magnet_threads.wait(remaining()))
 		if self.dht_started:
 			print('Waiting for DHT requests to finish ...', end='', flush=True)
-			self.dht_shutdown_done.wait()
-			self.dht_conn.close()
-			print(' Done.', flush=True)
+			if print_wait_result(self.dht_shutdown_done.wait(remaining())):
+				self.dht_conn.close()
 		if self.active_evaluation:
 			print('Waiting for current evaluations to finish ...', end='', flush=True)
-			self.active_shutdown_done.wait()
-			print(' Done.', flush=True)
+			print_wait_result(self.evaluator_workers.wait(remaining()))
 		if self.tracker_requests:
 			print('Waiting for current tracker requests to finish ...', end='', flush=True)
-			self.tracker_shutdown_done.wait()
-			print(' Done.', flush=True)
+			print_wait_result(self.tracker_threads.wait(remaining()))
 		if self.passive_evaluation:
 			print('Waiting for server threads to terminate ...', end='', flush=True)
 			self.server.shutdown()
-			self.server_threads.wait()
-			print(' Done.', flush=True)
+			print_wait_result(self.server_threads.wait(remaining()))
 		if self.peer_handler:
 			print('Waiting for peers to be written to database ...', end='', flush=True)
-			self.visited_peers.join()
-			print(' Done.', flush=True)
+			print_wait_result(all(stage.join(remaining()) for stage in self.handler_stages))
 		if self.statistic_started:
 			print('Waiting for analysis statistics to be written to database ...', end='', flush=True)
-			self.statistic_shutdown.wait()
+			print_wait_result(self.statistic_shutdown.wait(remaining()))
+		if self.checkpoints_started:
+			print('Writing checkpoint ...', end='', flush=True)
+			try:
+				self.checkpoint.write_snapshot(self.peers, self.registry, self.in_flight.copy().values())
+			except FileError as err:
+				logging.error(err)
 			print(' Done.', flush=True)
+		if self.metrics_started:
+			self.metrics_server.close()
+			self.write_error_stats()
+		self.profiler_signals.put(None)
+		try:
+			self.profiler.stop()
+		except FileError as err:
+			logging.error(err)
+		self.profiler.memory_stop()
+		self.reachability.save()
 		self.database.close()
 
 		# Do not reraise incoming exceptions, as it is already logged above
 		logging.info('Finished')
+		eventlog.stop()
 		return True
 
+## Finish a shutdown progress line
+#  @param done Result of the wait call, False on timeout
+#  @return The result
+def print_wait_result(done):
+	if done:
+		print(' Done.', flush=True)
+	else:
+		print(' Timeout.', flush=True)
+		logging.error('Shutdown deadline exceeded, continuing without waiting')
+	return done
+
+## Record the durations of reached evaluation phases
+#  @param latency ThreadHistograms
+#  @param phases Dict of phase name and duration in seconds, filled by protocol.evaluate_peer
+#  @param source Source name
+#  @param outcome Outcome name
+def record_phases(latency, phases, source, outcome):
+	for phase, duration in phases.items():
+		latency.record((phase, source, outcome), duration)
+
+## Modification time of a file
+#  @param path File path
+#  @return Modification time or None if the file does not exist
+def get_mtime(path):
+	try:
+		return os.stat(path).st_mtime
+	except OSError:
+		return None
+
 class Peer(RichComparisonMixin):
+	__slots__ = ('revisit', 'scheduled', 'ip_address', 'port', 'id', 'pieces', 'source', 'torrent', 'key', 'visited', 'last_visit', 'speed')
+
 	def __init__(self):
+		# perf_counter time of the next visit if scheduled, else priority of a new peer
 		self.revisit = None
+		self.scheduled = False
 		self.ip_address = None
 		self.port = None
 		self.id = None
@@ -648,6 +1493,9 @@ class Peer(RichComparisonMixin):
 		self.source = None
 		self.torrent = None
 		self.key = None
+		self.visited = None
+		self.last_visit = None
+		self.speed = None
 
 	def __lt__(self, other):
 		return self.revisit < other.revisit
@@ -656,11 +1504,49 @@ class Peer(RichComparisonMixin):
 		return self.revisit == other.revisit
 
 	def __hash__(self):
-		return hash((self.ip_address, self.port, self.torrent))
+		return hash(self.identity())
+
+	## Update pieces and the smoothed download speed after a visit
+	#  @param pieces Number of downloaded pieces reported in this visit
+	def record_visit(self, pieces):
+		if self.pieces is not None and self.last_visit is not None and self.visited > self.last_visit:
+			speed = (pieces - self.pieces) / (self.visited - self.last_visit)
+			self.speed = speed if self.speed is None else (self.speed + speed) / 2
+		self.pieces = pieces
+		self.last_visit = self.visited
+
+	## Predict the delay until the peer reaches the complete threshold
+	#  @param torrent Torrent named tuple of the peer
+	#  @return Delay in seconds, the default revisit delay if no progress is known
+	def revisit_delay(self, torrent):
+		if not self.speed or self.speed <= 0:
+			return config.peer_revisit_delay
+		delay = (torrent.complete_threshold - self.pieces) / self.speed
+		return min(max(delay, config.peer_revisit_min), config.peer_revisit_max)
+
+	## Check if the revisit time is reached
+	#  @return True if the peer may be contacted now
+	def is_due(self):
+		return self.revisit <= time.perf_counter()
+
+	## Collision free integer identifying this endpoint in this torrent
+	#  @return Integer below 2**64
+	def identity(self):
+		return pack_endpoint(self.ip_address, self.port, self.torrent)
 
 	def __str__(self):
 		return 'Peer {}'.format(self.key)
 
+## Intermediate result of a visited peer passed between peer handler stages
+class Visit:
+	__slots__ = ('peer', 'pex_peers', 'location', 'new_key')
+
+	def __init__(self, peer, pex_peers):
+		self.peer = peer
+		self.pex_peers = pex_peers
+		self.location = None
+		self.new_key = None
+
 ## Subclass of library class to change parameters, add attributes and add multithreading mix-in class
 class PeerEvaluationServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
 	## Extended init
@@ -685,33 +1571,46 @@ class PeerHandler(socketserver.BaseRequestHandler):
 		# self.client_address is tuple of incoming client address and port
 		# self.request is incoming connection socket
 		# self.server is own server instance
+		if 'incoming' in self.server.paused:
+			return
 		self.server.server_threads.increment()
 		try:
 			self.request.settimeout(config.network_timeout)
+			self.server.connections.add(self.request)
 		except OSError as err:
-			self.server.peer_error.count('Incoming peer,Failed to set timeout')
+			self.server.peer_error.count('Incoming peer', Reason.timeout_setup)
+			self.server.server_threads.decrement()
+			return
+		except UtilError:
 			self.server.server_threads.decrement()
 			return
 		logging.info('Evaluating an incoming peer ...')
+		phases = dict()
 		try:
-			result = protocol.evaluate_peer(self.request, self.server.own_peer_id, self.server.dht_enabled)
+			result = protocol.evaluate_peer(self.request, self.server.own_peer_id, self.server.dht_enabled,
+					timeout=self.server.receive_timeout, phases=phases)
 		except PeerError as err:
-			self.server.peer_error.count('Incoming peer,{}'.format(err))
+			if not self.server.connections.cancelled.is_set():
+				self.server.peer_error.count('Incoming peer', classify_error(err, Reason.other_protocol))
+				self.server.metric_evaluations.inc(Source.incoming.name, 'protocol fail')
+				record_phases(self.server.latency, phases, Source.incoming.name, 'fail')
+				eventlog.event('evaluation', ip=self.client_address[0], port=self.client_address[1], torrent=None,
+						source=Source.incoming.name, outcome='protocol fail', error=str(err), seconds=phases.get('session'))
 		else:
+			record_phases(self.server.latency, phases, Source.incoming.name, 'success')
 			# Search received info hash in torrents dict
 			torrent_id = None
-			for key in self.server.torrents:
-				if result[1] == self.server.torrents[key].info_hash:
+			for key, known in list(self.server.torrents.items()):
+				if result[1] == known.info_hash:
 					torrent_id = key
 			if torrent_id is None:
-				self.server.peer_error.count('Incoming peer,Unknown info hash')
+				self.server.peer_error.count('Incoming peer', Reason.unknown_info_hash)
 				self.server.server_threads.decrement()
 				return
 
 			# Discard incoming peers, when they were actively contacted before, to prevent double counting
-			equality = (self.client_address[0], torrent_id)
-			if equality in self.server.all_outgoing_ips:
-				self.server.peer_error.count('Incoming peer,Already in outgoing')
+			if self.server.registry.is_outgoing(self.client_address[0], torrent_id):
+				self.server.peer_error.count('Incoming peer', Reason.already_outgoing)
 				self.server.server_threads.decrement()
 				return
 
@@ -722,4 +1621,12 @@ class PeerHandler(socketserver.BaseRequestHandler):
 			new_peer.source = Source.incoming
 			new_peer.torrent = torrent_id
 			self.server.visited_peers.put((new_peer, result))
+			self.server.metric_evaluations.inc(Source.incoming.name, 'success')
+			eventlog.event('evaluation', ip=new_peer.ip_address, port=new_peer.port, torrent=torrent_id,
+					source=Source.incoming.name, outcome='success', messages=len(result[2]), seconds=phases.get('session'))
 		self.server.server_threads.decrement()
+
+	## Forget the connection before the server closes it
+	#  @note Overrides parent method
+	def finish(self):
+		self.server.connections.discard(self.request)
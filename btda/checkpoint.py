@@ -0,0 +1,275 @@
+# Built-in modules
+import logging
+import math
+import os
+import struct
+import threading
+import time
+import array
+
+# Project modules
+from util import *
+
+# Snapshot file header
+MAGIC = b'BTDACP02'
+# Queued peer: identity, flags, revisit, database key, pieces, source, last visit, speed
+PEER = struct.Struct('<QBdqiBdd')
+# Peer flag: revisit is a wall clock time, else the priority of a new peer
+SCHEDULED = 1
+# Section sizes
+COUNT = struct.Struct('<I')
+SHARD = struct.Struct('<HII')
+# Log records, a type byte followed by the payload
+INCOMING = struct.Struct('<QQ')
+KEY = struct.Struct('<Q')
+
+## Persists the revisit schedule and peer equality information as snapshot plus append log
+#  @note Times are stored as wall clock time because perf_counter values are meaningless after restart
+class Checkpoint:
+	## Prepare checkpoint files, nothing is read or written yet
+	#  @param path Output path with filename without file extension
+	#  @param peer_class Class of queued peers, created without arguments on load
+	def __init__(self, path, peer_class):
+		self.snapshot_path = path + '.checkpoint'
+		self.log_path = path + '.checkpoint-log'
+		self.peer_class = peer_class
+		self.buffer = bytearray()
+		self.buffer_lock = threading.Lock()
+		self.file_lock = threading.Lock()
+
+	## Remember a queued peer after its visit
+	#  @param peer The peer
+	def record_peer(self, peer):
+		record = b'P' + pack_peer(peer)
+		with self.buffer_lock:
+			self.buffer += record
+
+	## Remember a peer which is not queued anymore, so it is not contacted as new peer after resume
+	#  @param identity Peer identity
+	def record_known(self, identity):
+		record = b'K' + KEY.pack(identity)
+		with self.buffer_lock:
+			self.buffer += record
+
+	## Remember a new incoming peer
+	#  @param ip_address IPv4 address as string
+	#  @param torrent Torrent key
+	#  @param key Database key
+	def record_incoming(self, ip_address, torrent, key):
+		record = b'I' + INCOMING.pack(pack_address(ip_address, torrent), key)
+		with self.buffer_lock:
+			self.buffer += record
+
+	## Remember a new outgoing peer
+	#  @param ip_address IPv4 address as string
+	#  @param torrent Torrent key
+	def record_outgoing(self, ip_address, torrent):
+		record = b'O' + KEY.pack(pack_address(ip_address, torrent))
+		with self.buffer_lock:
+			self.buffer += record
+
+	## Append buffered records to the log file
+	#  @exception FileError
+	def flush(self):
+		with self.file_lock:
+			self._append(self._take_buffer())
+
+	## Write a full snapshot and truncate the log
+	#  @param peers PrioritySetQueue of peers
+	#  @param registry PeerRegistry
+	#  @param in_flight Peers taken from the queue and not yet put back, which the queue copy misses
+	#  @exception FileError
+	def write_snapshot(self, peers, registry, in_flight=()):
+		start = time.perf_counter()
+		with self.file_lock:
+			# Records buffered before the copy are contained in it, persist them until the snapshot replaces the log
+			self._append(self._take_buffer())
+			content = peers.snapshot()
+			for peer in in_flight:
+				content.setdefault(peer.torrent, (list(), list()))[1].append(peer)
+			incoming, outgoing = registry.dump()
+
+			# Serialize
+			data = bytearray(MAGIC)
+			data += COUNT.pack(len(content))
+			for name, (keys, items) in content.items():
+				data += SHARD.pack(name, len(keys), len(items))
+				data += array.array('Q', keys).tobytes()
+				for peer in items:
+					data += pack_peer(peer)
+			data += COUNT.pack(len(incoming))
+			data += array.array('Q', [value for item in incoming for value in item]).tobytes()
+			data += COUNT.pack(len(outgoing))
+			data += array.array('Q', outgoing).tobytes()
+
+			# Replace atomically, then start an empty log
+			try:
+				with open(self.snapshot_path + '.tmp', 'wb') as file:
+					file.write(data)
+					file.flush()
+					os.fsync(file.fileno())
+				os.replace(self.snapshot_path + '.tmp', self.snapshot_path)
+				open(self.log_path, 'wb').close()
+			except OSError as err:
+				raise FileError('Could not write checkpoint: {}'.format(err))
+		logging.info('Wrote checkpoint of {} bytes in {} seconds'.format(len(data), time.perf_counter() - start))
+
+	## Read snapshot and log
+	#  @return Tuple of dict of torrent key and tuple of known identities and queued peers,
+	#  list of packed address and key tuples of incoming peers and list of packed addresses of outgoing peers
+	#  @exception FileError
+	def load(self):
+		known = dict()
+		queued = dict()
+		incoming = dict()
+		outgoing = list()
+
+		# Read snapshot
+		try:
+			with open(self.snapshot_path, 'rb') as file:
+				data = file.read()
+		except FileNotFoundError:
+			data = None
+		except OSError as err:
+			raise FileError('Could not read checkpoint: {}'.format(err))
+		if data is not None:
+			if not data.startswith(MAGIC):
+				raise FileError('Invalid checkpoint file {}'.format(self.snapshot_path))
+			try:
+				offset = len(MAGIC)
+				shards, = COUNT.unpack_from(data, offset)
+				offset += COUNT.size
+				for i in range(shards):
+					name, keys_count, peers_count = SHARD.unpack_from(data, offset)
+					offset += SHARD.size
+					keys = array.array('Q')
+					keys.frombytes(data[offset:offset + 8 * keys_count])
+					offset += 8 * keys_count
+					known.setdefault(name, set()).update(keys)
+					for j in range(peers_count):
+						peer = self._unpack_peer(data, offset)
+						offset += PEER.size
+						queued[peer.identity()] = peer
+				incoming_count, = COUNT.unpack_from(data, offset)
+				offset += COUNT.size
+				values = array.array('Q')
+				values.frombytes(data[offset:offset + 16 * incoming_count])
+				offset += 16 * incoming_count
+				incoming.update(zip(values[0::2], values[1::2]))
+				outgoing_count, = COUNT.unpack_from(data, offset)
+				offset += COUNT.size
+				values = array.array('Q')
+				values.frombytes(data[offset:offset + 8 * outgoing_count])
+				outgoing.extend(values)
+			except (struct.error, ValueError) as err:
+				raise FileError('Truncated checkpoint file {}: {}'.format(self.snapshot_path, err))
+
+		# Replay log, a record cut off by a crash ends it
+		try:
+			with open(self.log_path, 'rb') as file:
+				data = file.read()
+		except FileNotFoundError:
+			data = b''
+		except OSError as err:
+			raise FileError('Could not read checkpoint log: {}'.format(err))
+		offset = 0
+		records = 0
+		try:
+			while offset < len(data):
+				kind = data[offset:offset + 1]
+				offset += 1
+				if kind == b'P':
+					peer = self._unpack_peer(data, offset)
+					offset += PEER.size
+					queued[peer.identity()] = peer
+				elif kind == b'K':
+					identity, = KEY.unpack_from(data, offset)
+					offset += KEY.size
+					queued.pop(identity, None)
+					known.setdefault(identity >> 48, set()).add(identity)
+				elif kind == b'I':
+					equality, key = INCOMING.unpack_from(data, offset)
+					offset += INCOMING.size
+					incoming[equality] = key
+				elif kind == b'O':
+					equality, = KEY.unpack_from(data, offset)
+					offset += KEY.size
+					outgoing.append(equality)
+				else:
+					logging.warning('Unknown record in checkpoint log at byte {}, ignoring rest'.format(offset - 1))
+					break
+				records += 1
+		except struct.error:
+			logging.warning('Checkpoint log ends with an incomplete record')
+		logging.info('Replayed {} checkpoint log records'.format(records))
+
+		# Group by torrent
+		content = {name: (keys, list()) for name, keys in known.items()}
+		for identity, peer in queued.items():
+			content.setdefault(peer.torrent, (set(), list()))[1].append(peer)
+		return content, list(incoming.items()), outgoing
+
+	## Swap the record buffer
+	#  @return Buffered records
+	def _take_buffer(self):
+		with self.buffer_lock:
+			data = self.buffer
+			self.buffer = bytearray()
+		return data
+
+	## Append records to the log file and force them to disk
+	#  @param data Records
+	#  @exception FileError
+	def _append(self, data):
+		if not data:
+			return
+		try:
+			with open(self.log_path, 'ab') as file:
+				file.write(data)
+				file.flush()
+				os.fsync(file.fileno())
+		except OSError as err:
+			raise FileError('Could not write checkpoint log: {}'.format(err))
+
+	## Create a peer from a packed record
+	#  @param data Buffer
+	#  @param offset Offset of the record
+	#  @return Peer of the configured class, revisit times passed during downtime are now
+	def _unpack_peer(self, data, offset):
+		identity, flags, revisit, key, pieces, source, last_visit, speed = PEER.unpack_from(data, offset)
+		peer = self.peer_class()
+		peer.ip_address, peer.port, peer.torrent = unpack_endpoint(identity)
+		peer.scheduled = bool(flags & SCHEDULED)
+		peer.revisit = max(from_wall_time(revisit), time.perf_counter()) if peer.scheduled else revisit
+		peer.key = None if key < 0 else key
+		peer.pieces = None if pieces < 0 else pieces
+		peer.source = Source(source)
+		peer.last_visit = None if math.isnan(last_visit) else from_wall_time(last_visit)
+		peer.speed = None if math.isnan(speed) else speed
+		return peer
+
+## Pack a queued peer
+#  @param peer The peer
+#  @return Bytes of the PEER structure
+#  @note Revisit times of scheduled peers are perf_counter values, others are priorities of new peers
+def pack_peer(peer):
+	return PEER.pack(peer.identity(),
+			SCHEDULED if peer.scheduled else 0,
+			to_wall_time(peer.revisit) if peer.scheduled else peer.revisit,
+			-1 if peer.key is None else peer.key,
+			-1 if peer.pieces is None else peer.pieces,
+			peer.source.value,
+			math.nan if peer.last_visit is None else to_wall_time(peer.last_visit),
+			math.nan if peer.speed is None else peer.speed)
+
+## Convert a perf_counter value to wall clock time
+#  @param value perf_counter value
+#  @return Seconds since epoch
+def to_wall_time(value):
+	return value - time.perf_counter() + time.time()
+
+## Convert wall clock time to a perf_counter value
+#  @param value Seconds since epoch
+#  @return perf_counter value
+def from_wall_time(value):
+	return value - time.time() + time.perf_counter()
@@ -1,5 +1,22 @@
-# Number of threads used to contact peers in queue
+# Maximum number of threads used to contact peers in queue
 peer_evaluation_threads = 1024
+# Number of evaluator threads at start and lower bound for the concurrency controller
+peer_evaluation_threads_initial = 64
+peer_evaluation_threads_min = 16
+# Time delay between adjustments of the number of active evaluators in seconds
+concurrency_interval = 10
+# Evaluators added per adjustment if all are busy
+concurrency_step = 16
+# Factor applied to the number of evaluators on congestion
+concurrency_backoff = 0.75
+# Congestion if more evaluated peers than this wait for the peer handler
+concurrency_max_backlog = 1000
+# Congestion if the one minute load average per CPU exceeds this
+concurrency_max_load = 2.0
+# Congestion if the mean duration of successful evaluations in seconds exceeds this
+concurrency_target_latency = 20
+# Congestion if the connect success rate drops below this factor of its moving average
+concurrency_success_drop = 0.7
 # Amount of downloaded pieces reported to the tracker
 fake_downloaded_stat = 0.5
 # Amount of left pieces reported to the tracker
@@ -8,8 +25,17 @@ fake_left_stat = 0.5
 fake_uploaded_stat = 0.2
 # Consider peers to have completely downloaded the torrent at this pieces amount
 torrent_complete_threshold = 0.98
-# Timeout for network connections in seconds
+# Timeout for network connections in seconds, initial receive timeout for peers
 network_timeout = 6
+# Bounds of the receive timeout adapted to peer timing in seconds
+network_timeout_min = 2
+network_timeout_max = 30
+# Quantile of message inter-arrival times used for the receive timeout
+timeout_quantile = 0.99
+# Factor applied to the inter-arrival quantile for the receive timeout
+timeout_margin = 1.5
+# The receive timeout is at least this multiple of the connect round trip time
+timeout_rtt_factor = 8
 # Integrate an already running DHT node with this UDP port
 dht_node_port = 17000
 # Uses an already running DHT node over the given localhost telnet port
@@ -18,14 +44,43 @@ dht_control_port = 17001
 dht_request_interval = 5 * 60
 # Time delay between asking the tracker for new peers in seconds
 tracker_request_interval = 5 * 60
-# Time delay for revisiting unfinished peers in seconds
+# Relative share of evaluations per torrent by info hash hex string, defaults to 1
+torrent_weights = dict()
+# Maximum number of simultaneous evaluations per torrent, None for no limit
+torrent_connection_cap = None
+# Maximum number of simultaneous evaluations for single torrents by info hash hex string
+torrent_connection_caps = dict()
+# Order first contacts by the connect success predicted from earlier evaluations
+reachability_prediction = True
+# Filename of the persisted reachability model, relative to output_path
+reachability_file = 'reachability.json'
+# Weight of the overall success rate when estimating the rate of rarely seen features
+reachability_smoothing = 4
+# Maximum number of features in the reachability model before pruning
+reachability_max_features = 500000
+# Time delay for revisiting unfinished peers in seconds, used until a download speed is known
 peer_revisit_delay = 5 * 60
+# Bounds of the revisit delay predicted from a peer's download speed in seconds
+peer_revisit_min = 60
+peer_revisit_max = 60 * 60
 # When collecting all messages from a peer, cancel after this amount
 receive_message_max = 256
 # Truncate raw BitTorrent Protocol messages in logs to length
 bittorrent_message_log_length = 80
 # ut_metadata Extension Protocol message id
 extension_ut_metadata_id = 4
+# Advertise ut_pex in evaluations and queue peers received via peer exchange
+pex_enabled = True
+# ut_pex Extension Protocol message id
+extension_ut_pex_id = 1
+# Number of peers asked for metadata of a magnet link at the same time
+metadata_parallel_peers = 8
+# Number of outstanding ut_metadata block requests per peer
+metadata_block_pipeline = 4
+# Largest metadata_size in bytes accepted from peers
+metadata_size_max = 8 * 2**20
+# Number of magnet links resolved concurrently
+magnet_import_threads = 16
 # Evaluate incoming peers at the specified port number
 bittorrent_listen_port = 6884
 # Output path for log and database, with trailing slash
@@ -34,6 +89,53 @@ output_path = 'output/'
 input_path = 'input/'
 # Filename for magnet files, relative to input_path, one magnet link per line
 magnet_file = 'magnet.txt'
+# Directory for cached info dicts of magnet links, relative to input_path
+metadata_cache = 'metadata/'
+# Filename for the blocklist, relative to input_path, one network in CIDR notation per line
+blocklist_file = 'blocklist.txt'
+# Drop discovered peers with private addresses, disable for analyses in a local network
+admission_drop_private = True
+# Additional addresses of this host, peers with these addresses and the listen port are dropped
+own_addresses = []
+# Time delay between polls of the input directory and magnet file for added and removed torrents
+watch_interval = 10
+# Filename of the UNIX control socket, relative to output_path
+control_socket = 'control.sock'
+# Local address of the HTTP metrics endpoint
+metrics_host = '127.0.0.1'
+metrics_port = 9713
+# Maximum seconds to wait for threads at shutdown, threads still running afterwards are abandoned
+shutdown_timeout = 5
+# Seconds between shutdown checks of the incoming connection server
+server_poll_interval = 0.1
+# Number of queued peers above which newly discovered peers are dropped, 0 for no bound
+peer_queue_size = 2000000
+# Number of evaluated peers waiting for the peer handler above which evaluators pause, 0 for no bound
+visited_queue_size = 10000
+# Number of threads per peer handler stage, storing in the database always uses one thread
+handler_decode_threads = 2
+handler_enrich_threads = 2
+handler_requeue_threads = 1
+# Bound of the queues between peer handler stages
+handler_stage_size = 10000
+# Maximum number of peers stored in the database with one commit
+handler_persist_batch = 100
+# Write checkpoints of the peer queue and peer equality information to resume crashed analyses
+checkpoint_enabled = True
+# Time delay between appending changes to the checkpoint log
+checkpoint_interval = 60
+# Time delay between full checkpoint snapshots, which truncate the log
+checkpoint_snapshot_interval = 30 * 60
+# Stack samples per second of the profiler toggled by SIGUSR1 or the control socket
+profiler_rate = 50
+# Number of frames stored per memory allocation while tracing memory via SIGUSR2 or the control socket
+tracemalloc_frames = 10
+# Number of allocation sites listed in memory growth reports
+tracemalloc_top = 50
+# Size in bytes after which the event log is rotated and compressed
+event_log_max_bytes = 64 * 1024 * 1024
+# Number of compressed event log files kept
+event_log_backups = 20
 # Time delay between logging peer statistics to database
 statistic_interval = 5 * 60
 # Evaluator reaction time on empty queue and delayed peers
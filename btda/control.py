@@ -0,0 +1,240 @@
+# Built-in modules
+import json
+import logging
+import os
+import socketserver
+import threading
+
+# Project modules
+import config
+from util import *
+
+## Setting value checks, each returns a description of the accepted values if the value is not accepted, else None
+#  @param value New value of the right type
+def positive(value):
+	return None if value > 0 else 'a positive number'
+
+def non_negative(value):
+	return None if value >= 0 else 'a number not below zero'
+
+def fraction(value):
+	return None if 0 < value < 1 else 'a number between 0 and 1'
+
+def factor(value):
+	return None if value >= 1 else 'a number of at least 1'
+
+def optional_positive(value):
+	return None if value is None or value > 0 else 'null or a positive integer'
+
+def weights(value):
+	if all(isinstance(key, str) and type(item) in (int, float) and item > 0 for key, item in value.items()):
+		return None
+	return 'an object of info hashes and positive numbers'
+
+def caps(value):
+	if all(isinstance(key, str) and type(item) is int and item > 0 for key, item in value.items()):
+		return None
+	return 'an object of info hashes and positive integers'
+
+def anything(value):
+	return None
+
+# Configuration values changeable at runtime, their accepted types and value check
+TUNABLE = {
+	'peer_evaluation_threads': ((int,), positive),
+	'peer_evaluation_threads_min': ((int,), positive),
+	'concurrency_interval': ((int, float), positive),
+	'concurrency_step': ((int,), positive),
+	'concurrency_backoff': ((float,), fraction),
+	'concurrency_max_backlog': ((int,), non_negative),
+	'concurrency_max_load': ((int, float), positive),
+	'concurrency_target_latency': ((int, float), positive),
+	'concurrency_success_drop': ((float,), fraction),
+	'network_timeout': ((int, float), positive),
+	'network_timeout_min': ((int, float), positive),
+	'network_timeout_max': ((int, float), positive),
+	'timeout_quantile': ((float,), fraction),
+	'timeout_margin': ((int, float), factor),
+	'timeout_rtt_factor': ((int, float), positive),
+	'dht_request_interval': ((int, float), positive),
+	'tracker_request_interval': ((int, float), positive),
+	'torrent_weights': ((dict,), weights),
+	'torrent_connection_cap': ((int, type(None)), optional_positive),
+	'torrent_connection_caps': ((dict,), caps),
+	'reachability_prediction': ((bool,), anything),
+	'peer_revisit_delay': ((int, float), positive),
+	'peer_revisit_min': ((int, float), positive),
+	'peer_revisit_max': ((int, float), positive),
+	'receive_message_max': ((int,), positive),
+	'pex_enabled': ((bool,), anything),
+	'admission_drop_private': ((bool,), anything),
+	'peer_queue_size': ((int,), non_negative),
+	'statistic_interval': ((int, float), positive),
+	'evaluator_reaction': ((int, float), positive),
+	'checkpoint_interval': ((int, float), positive),
+	'checkpoint_snapshot_interval': ((int, float), positive),
+	'profiler_rate': ((int, float), positive),
+}
+
+# Pairs of settings where the first must not exceed the second
+ORDERED = (
+	('peer_evaluation_threads_min', 'peer_evaluation_threads'),
+	('network_timeout_min', 'network_timeout_max'),
+	('peer_revisit_min', 'peer_revisit_max'))
+
+# Names accepted by the pause and resume commands
+PAUSABLE = ('tracker', 'dht', 'pex', 'incoming', 'active')
+
+## Local control interface speaking line-delimited JSON over a UNIX socket
+#  @note Requests are objects with a command key, responses are objects with an ok key and a result or error key
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+	## Bind the socket, removing a stale one
+	#  @param path File system path of the socket
+	#  @param analyzer Running SwarmAnalyzer
+	#  @exception AnalyzerError
+	def __init__(self, path, analyzer):
+		self.path = path
+		self.analyzer = analyzer
+		self.lock = threading.Lock()
+		try:
+			if os.path.exists(path):
+				os.unlink(path)
+			super().__init__(path, ControlHandler)
+			os.chmod(path, 0o600)
+		except OSError as err:
+			raise AnalyzerError('Could not open control socket {}: {}'.format(path, err))
+
+	## Serve in a background thread
+	def start(self):
+		thread = threading.Thread(target=self.serve_forever, args=(config.server_poll_interval,))
+		thread.daemon = True
+		thread.start()
+		logging.info('Listening for control commands on {}'.format(self.path))
+
+	## Stop serving and remove the socket
+	def close(self):
+		self.shutdown()
+		self.server_close()
+		try:
+			os.unlink(self.path)
+		except OSError:
+			pass
+
+	## Execute one request
+	#  @param request Decoded request object
+	#  @return Result, JSON serializable
+	#  @exception AnalyzerError
+	def execute(self, request):
+		if not isinstance(request, dict):
+			raise AnalyzerError('Request must be an object')
+		command = request.get('command')
+		if not isinstance(command, str):
+			raise AnalyzerError('Command must be a string')
+		for field in ('name', 'source', 'action'):
+			if request.get(field) is not None and not isinstance(request[field], str):
+				raise AnalyzerError('{} must be a string'.format(field.capitalize()))
+
+		# Configuration
+		if command == 'get':
+			name = request.get('name')
+			if name is None:
+				return {tunable: getattr(config, tunable) for tunable in TUNABLE}
+			if name not in TUNABLE:
+				raise AnalyzerError('Unknown or read-only setting {}'.format(name))
+			return getattr(config, name)
+		if command == 'set':
+			name = request.get('name')
+			value = request.get('value')
+			if name not in TUNABLE:
+				raise AnalyzerError('Unknown or read-only setting {}'.format(name))
+			types, check = TUNABLE[name]
+			if float in types and type(value) is int:
+				value = float(value)
+			if type(value) not in types:
+				raise AnalyzerError('Setting {} expects {}'.format(name, ' or '.join(t.__name__ for t in types)))
+			expected = check(value)
+			if expected is not None:
+				raise AnalyzerError('Setting {} expects {}'.format(name, expected))
+			with self.lock:
+				for lower, upper in ORDERED:
+					if name in (lower, upper):
+						low = value if name == lower else getattr(config, lower)
+						high = value if name == upper else getattr(config, upper)
+						if low > high:
+							raise AnalyzerError('Setting {} must not exceed {}'.format(lower, upper))
+				old = getattr(config, name)
+				setattr(config, name, value)
+				try:
+					self.analyzer.config_changed(name)
+				except Exception as err:
+					setattr(config, name, old)
+					self.analyzer.config_changed(name)
+					raise AnalyzerError('Could not apply setting {}: {}'.format(name, err))
+			logging.warning('Changed setting {} from {} to {}'.format(name, old, value))
+			return old
+
+		# Torrents
+		if command == 'add_torrent':
+			if 'path' in request:
+				return self.analyzer.import_torrent_file(str(request['path']))
+			if 'magnet' in request:
+				self.analyzer.add_magnet(str(request['magnet']))
+				return None
+			raise AnalyzerError('add_torrent expects path or magnet')
+		if command == 'remove_torrent':
+			key = request.get('key')
+			if type(key) is not int:
+				raise AnalyzerError('remove_torrent expects an integer key')
+			return self.analyzer.remove_torrent(key).info_hash_hex
+
+		# Sources
+		if command in ('pause', 'resume'):
+			source = request.get('source')
+			if source not in PAUSABLE:
+				raise AnalyzerError('Source must be one of {}'.format(', '.join(PAUSABLE)))
+			if command == 'pause':
+				self.analyzer.paused.add(source)
+			else:
+				self.analyzer.paused.discard(source)
+			logging.warning('Control command {} {}'.format(command, source))
+			return sorted(self.analyzer.paused)
+
+		# Profiling
+		if command == 'profile':
+			action = request.get('action', 'toggle')
+			if action == 'start':
+				return self.analyzer.profiler.start()
+			if action == 'stop':
+				return self.analyzer.profiler.stop()
+			if action == 'toggle':
+				return self.analyzer.profiler.toggle()
+			if action == 'memory':
+				return self.analyzer.profiler.memory_diff()
+			if action == 'memory_stop':
+				return self.analyzer.profiler.memory_stop()
+			if action == 'status':
+				return self.analyzer.profiler.status()
+			raise AnalyzerError('Action must be one of start, stop, toggle, memory, memory_stop, status')
+
+		# Statistics
+		if command == 'stats':
+			return self.analyzer.read_status()
+		raise AnalyzerError('Unknown command {}'.format(command))
+
+## Answers requests of one control connection
+class ControlHandler(socketserver.StreamRequestHandler):
+	## Answer each line with one line
+	#  @note Overrides parent method
+	def handle(self):
+		for line in self.rfile:
+			try:
+				result = self.server.execute(json.loads(line.decode()))
+				response = {'ok': True, 'result': result}
+			except (ValueError, AnalyzerError, FileError) as err:
+				response = {'ok': False, 'error': str(err)}
+			try:
+				self.wfile.write(json.dumps(response).encode() + b'\n')
+			except OSError:
+				break
@@ -1,5 +1,6 @@
 # Built-in modules
 import telnetlib
+import socket
 import threading
 import logging
 
@@ -54,6 +55,14 @@ class DHT:
 		logging.info('DHT lookup ended with {} peers'.format(len(peers)))
 		return peers
 
+	## Abort a running lookup from another thread, close must still be called
+	def interrupt(self):
+		self.is_shutdown = True
+		try:
+			self.dht.sock.shutdown(socket.SHUT_RD)
+		except (OSError, AttributeError):
+			pass
+
 	## Send STATS command for debug purposes
 	def print_stats(self):
 		try:
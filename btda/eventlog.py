@@ -0,0 +1,102 @@
+# Built-in modules
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+
+# Project modules
+import config
+
+# Format of the text log
+LOG_FORMAT = '[%(asctime)s:%(levelname)s:%(module)s:%(threadName)s] %(message)s'
+LOG_DATEFMT = '%dd%Hh%Mm%Ss'
+
+# Logger of structured events, kept out of the text log
+events = logging.getLogger('btda.events')
+events.propagate = False
+events.setLevel(logging.INFO)
+
+# Running queue listeners and the handler each one feeds, by name
+listeners = dict()
+
+## Queue handler which leaves formatting to the listener thread
+#  @note Arguments are formatted when written, so they should not be changed after logging
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+	## Pass the record unformatted
+	#  @note Overrides parent method
+	def prepare(self, record):
+		return record
+
+## Formats event records as one JSON object per line
+class JsonLineFormatter(logging.Formatter):
+	## Serialize time, event name and fields
+	#  @note Overrides parent method
+	def format(self, record):
+		item = {'time': round(record.created, 3), 'event': record.msg}
+		item.update(record.fields)
+		return json.dumps(item, separators=(',', ':'), default=str)
+
+## Route the text log through a queue to a single writer thread
+#  @param filename Log file, None to write to stderr
+#  @param level Minimum level of logged messages
+def start_logging(filename, level):
+	if filename is None:
+		handler = logging.StreamHandler()
+	else:
+		handler = logging.FileHandler(filename)
+	handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATEFMT))
+	root = logging.getLogger()
+	root.setLevel(level)
+	_start_listener('log', root, handler)
+
+## Write structured events to a rotating JSON lines file, rotated files are compressed with gzip
+#  @param filename Event log file
+def start_events(filename):
+	handler = logging.handlers.RotatingFileHandler(filename, maxBytes=config.event_log_max_bytes,
+			backupCount=config.event_log_backups)
+	handler.namer = lambda name: name + '.gz'
+	handler.rotator = compress_file
+	handler.setFormatter(JsonLineFormatter())
+	_start_listener('events', events, handler)
+	logging.info('Writing events to %s', filename)
+
+## Record a structured event, does nothing while the event log is not started
+#  @param name Event name
+#  @param **fields JSON serializable values
+def event(name, **fields):
+	if 'events' in listeners:
+		events.info(name, extra={'fields': fields})
+
+## Write all queued records and let loggers write directly again
+def stop():
+	for name, (logger, queue_handler, listener, handler) in list(listeners.items()):
+		listener.stop()
+		logger.removeHandler(queue_handler)
+		if name == 'events':
+			handler.close()
+		else:
+			logger.addHandler(handler)
+		del listeners[name]
+
+## Attach a queue handler to a logger and start writing its records in a background thread
+#  @param name Listener name
+#  @param logger Logger
+#  @param handler Handler writing the records
+def _start_listener(name, logger, handler):
+	log_queue = queue.SimpleQueue()
+	queue_handler = DeferredQueueHandler(log_queue)
+	listener = logging.handlers.QueueListener(log_queue, handler)
+	listener.start()
+	logger.addHandler(queue_handler)
+	listeners[name] = (logger, queue_handler, listener, handler)
+
+## Compress a rotated log file
+#  @param source Path of the rotated file
+#  @param destination Path of the compressed file
+def compress_file(source, destination):
+	with open(source, 'rb') as infile, gzip.open(destination, 'wb') as outfile:
+		shutil.copyfileobj(infile, outfile)
+	os.remove(source)
@@ -11,6 +11,11 @@ parser = argparse.ArgumentParser(description='BitTorrent Download Analyzer', epi
 parser.add_argument('-a', '--active', action='store_true', help='Actively contact peers in multiple threads')
 parser.add_argument('-p', '--passive', action='store_true', help='Passive peer evaluation by listening for incoming connections')
 parser.add_argument('-d', '--dht', action='store_true', help='Integrate an already running DHT node')
+parser.add_argument('-w', '--watch', action='store_true', help='Analyze torrents added to the input directory or magnet file at runtime, stop removed ones')
+parser.add_argument('-c', '--control', action='store_true', help='Accept runtime commands on a UNIX socket in the output directory')
+parser.add_argument('-m', '--metrics', action='store_true', help='Serve metrics in the Prometheus text format over local HTTP')
+parser.add_argument('-e', '--events', action='store_true', help='Write evaluations, tracker requests and failed database writes to a rotating JSON lines event log')
+parser.add_argument('-r', '--resume', metavar='OUTFILE', help='Continue an earlier analysis, given as output path without file extension, e.g. output/2015-06-01_12-00-00_host')
 parser.add_argument('-g', '--debug', action='store_true', help='Write log messages to stdout instead of a file and include debug messages')
 args = parser.parse_args()
 
@@ -19,20 +24,32 @@ if not args.active and not args.passive:
 	parser.error('Please enable active and/or passive peer evaluation')
 
 # Analysis routine
-with analyzer.SwarmAnalyzer(args.debug) as app:
+with analyzer.SwarmAnalyzer(args.debug, args.resume) as app:
 	# Indicate initialization process
 	print('Initialize evaluation process ...')
 
+	# Profile on demand
+	app.start_profiler_signals()
+
+	# Record structured events
+	if args.events:
+		app.start_event_log()
+
+	# Restore torrents and peers of an earlier analysis
+	if args.resume:
+		app.resume()
+
 	# Import torrents
-	app.import_magnets()
 	app.import_torrents()
-	app.torrent_duplicates()
 
 	# Requesting new peers
 	app.start_tracker_requests()
 	if args.dht:
 		app.start_dht_requests()
 
+	# Resolve magnet links in the background, resolved torrents are analyzed immediately
+	app.import_magnets()
+
 	# Actively contact and evaluate peers
 	if args.active:
 		app.start_active_evaluation()
@@ -44,6 +61,21 @@ with analyzer.SwarmAnalyzer(args.debug) as app:
 	# Store evaluated peers in database
 	app.start_peer_handler()
 
+	# Write checkpoints to resume after crashes
+	app.start_checkpoints()
+
+	# Follow changes of the input
+	if args.watch:
+		app.start_input_watcher()
+
+	# Serve metrics
+	if args.metrics:
+		app.start_metrics()
+
+	# Accept runtime commands
+	if args.control:
+		app.start_control()
+
 	# Store connection statistics in database
 	app.log_connection_stats()
 
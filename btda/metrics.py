@@ -0,0 +1,206 @@
+# Built-in modules
+import bisect
+import http.server
+import logging
+import socketserver
+import threading
+
+# Project modules
+import config
+from util import *
+
+# Default histogram bucket bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+## Collection of metrics rendered in the Prometheus text exposition format
+class Registry:
+	def __init__(self):
+		self.metrics = list()
+		self.lock = threading.Lock()
+
+	## Create and register a counter
+	#  @param name Metric name
+	#  @param help Description
+	#  @param labels Tuple of label names
+	#  @return Counter
+	def counter(self, name, help, labels=()):
+		return self._register(Counter(name, help, labels))
+
+	## Create and register a gauge read at scrape time
+	#  @param name Metric name
+	#  @param help Description
+	#  @param function Callable returning a number or a dict of label value tuples and numbers
+	#  @param labels Tuple of label names if function returns a dict
+	#  @return Gauge
+	def gauge(self, name, help, function, labels=()):
+		return self._register(Gauge(name, help, function, labels))
+
+	## Create and register a histogram
+	#  @param name Metric name
+	#  @param help Description
+	#  @param labels Tuple of label names
+	#  @param buckets Sorted upper bounds of the buckets
+	#  @return Histogram
+	def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+		return self._register(Histogram(name, help, labels, buckets))
+
+	def _register(self, metric):
+		with self.lock:
+			self.metrics.append(metric)
+		return metric
+
+	## Render all metrics
+	#  @return Text in the Prometheus exposition format
+	def render(self):
+		lines = list()
+		with self.lock:
+			metrics = list(self.metrics)
+		for metric in metrics:
+			lines.append('# HELP {} {}'.format(metric.name, metric.help))
+			lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+			try:
+				lines.extend(metric.render())
+			except Exception as err:
+				logging.error('Failed to render metric {}: {}'.format(metric.name, err))
+		lines.append('')
+		return '\n'.join(lines)
+
+## Monotonically increasing count per label combination
+class Counter:
+	type = 'counter'
+
+	def __init__(self, name, help, labels):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self.values = dict()
+		self.lock = threading.Lock()
+
+	## Increase the count
+	#  @param label_values Values of the labels in order
+	#  @param amount Increase
+	def inc(self, *label_values, amount=1):
+		with self.lock:
+			try:
+				self.values[label_values] += amount
+			except KeyError:
+				self.values[label_values] = amount
+
+	def render(self):
+		with self.lock:
+			values = list(self.values.items())
+		return ['{}{} {}'.format(self.name, format_labels(self.labels, label_values), value) for label_values, value in sorted(values)]
+
+## Current value computed at scrape time, costs nothing between scrapes
+class Gauge:
+	type = 'gauge'
+
+	def __init__(self, name, help, function, labels):
+		self.name = name
+		self.help = help
+		self.function = function
+		self.labels = labels
+
+	def render(self):
+		value = self.function()
+		if value is None:
+			return list()
+		if not isinstance(value, dict):
+			return ['{} {}'.format(self.name, value)]
+		return ['{}{} {}'.format(self.name, format_labels(self.labels, label_values), item) for label_values, item in sorted(value.items())]
+
+## Bucketed distribution per label combination
+class Histogram:
+	type = 'histogram'
+
+	def __init__(self, name, help, labels, buckets):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self.buckets = tuple(buckets)
+		self.values = dict() # label values -> [bucket counts..., sum]
+		self.lock = threading.Lock()
+
+	## Add an observation
+	#  @param value Observed value
+	#  @param label_values Values of the labels in order
+	def observe(self, value, *label_values):
+		index = bisect.bisect_left(self.buckets, value)
+		with self.lock:
+			try:
+				counts = self.values[label_values]
+			except KeyError:
+				counts = self.values[label_values] = [0] * (len(self.buckets) + 2)
+			counts[index] += 1
+			counts[-1] += value
+
+	def render(self):
+		with self.lock:
+			values = [(label_values, list(counts)) for label_values, counts in self.values.items()]
+		lines = list()
+		for label_values, counts in sorted(values):
+			cumulative = 0
+			for bound, count in zip(self.buckets + ('+Inf',), counts):
+				cumulative += count
+				lines.append('{}_bucket{} {}'.format(self.name, format_labels(self.labels + ('le',), label_values + (bound,)), cumulative))
+			lines.append('{}_sum{} {}'.format(self.name, format_labels(self.labels, label_values), counts[-1]))
+			lines.append('{}_count{} {}'.format(self.name, format_labels(self.labels, label_values), cumulative))
+		return lines
+
+## Serves the registry over HTTP
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+	daemon_threads = True
+
+	## Bind the server
+	#  @param address Tuple of host and port
+	#  @param registry Registry to serve
+	#  @exception AnalyzerError
+	def __init__(self, address, registry):
+		self.registry = registry
+		try:
+			super().__init__(address, MetricsHandler)
+		except OSError as err:
+			raise AnalyzerError('Could not open metrics endpoint {}:{}: {}'.format(*address, err))
+
+	## Serve in a background thread
+	def start(self):
+		thread = threading.Thread(target=self.serve_forever, args=(config.server_poll_interval,))
+		thread.daemon = True
+		thread.start()
+		logging.info('Serving metrics on http://{}:{}/metrics'.format(*self.server_address))
+
+	## Stop serving
+	def close(self):
+		self.shutdown()
+		self.server_close()
+
+## Answers scrapes
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+	## Send the rendered registry
+	#  @note Overrides parent method
+	def do_GET(self):
+		if self.path.split('?')[0] != '/metrics':
+			self.send_error(404)
+			return
+		body = self.server.registry.render().encode()
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	## Keep scrapes out of the analysis log
+	#  @note Overrides parent method
+	def log_message(self, format, *args):
+		pass
+
+## Format a label set
+#  @param names Label names
+#  @param values Label values
+#  @return String like {a="1",b="2"} or empty string
+def format_labels(names, values):
+	if not names:
+		return ''
+	pairs = ('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+			for name, value in zip(names, values))
+	return '{' + ','.join(pairs) + '}'
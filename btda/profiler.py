@@ -0,0 +1,155 @@
+# Built-in modules
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Project modules
+import config
+from util import *
+
+## Samples the stacks of all threads and writes them as collapsed stacks for flame graphs
+#  @note Each line of the output is a semicolon separated stack from the thread root to the sampled frame and its count
+class SamplingProfiler:
+	## Prepare profiling, nothing is sampled yet
+	#  @param path Output path with filename without file extension
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.thread = None
+		self.stopped = threading.Event()
+		self.stacks = dict()
+		self.samples = 0
+		self.labels = dict()
+		self.profiles = 0
+		self.memory_snapshot = None
+		self.memory_reports = 0
+
+	## Start sampling in a background thread
+	#  @return True if started, False if already running
+	def start(self):
+		with self.lock:
+			if self.thread is not None:
+				return False
+			self.stopped.clear()
+			self.stacks = dict()
+			self.samples = 0
+			self.thread = threading.Thread(target=self._sampler, name='profiler')
+			self.thread.daemon = True
+			self.thread.start()
+		logging.warning('Started sampling profiler with {} samples per second'.format(config.profiler_rate))
+		return True
+
+	## Stop sampling and write the collapsed stacks
+	#  @return Filename of the written profile, None if not running
+	#  @exception FileError
+	def stop(self):
+		with self.lock:
+			if self.thread is None:
+				return None
+			self.stopped.set()
+			self.thread.join()
+			self.thread = None
+			self.profiles += 1
+			filename = '{}_profile-{}.collapsed'.format(self.path, self.profiles)
+			stacks = self.stacks
+			samples = self.samples
+		try:
+			with open(filename, 'w') as file:
+				for stack, count in sorted(stacks.items()):
+					file.write('{} {}\n'.format(stack, count))
+		except OSError as err:
+			raise FileError('Could not write profile: {}'.format(err))
+		logging.warning('Wrote {} samples of {} distinct stacks to {}'.format(samples, len(stacks), filename))
+		return filename
+
+	## Start or stop sampling
+	#  @return Filename of the written profile when stopped, None when started
+	#  @exception FileError
+	def toggle(self):
+		if self.start():
+			return None
+		return self.stop()
+
+	## Trace memory allocations and write the growth since the last call
+	#  @note The first call only starts tracing
+	#  @return Filename of the written report, None if tracing was started
+	#  @exception FileError
+	def memory_diff(self):
+		with self.lock:
+			if not tracemalloc.is_tracing():
+				tracemalloc.start(config.tracemalloc_frames)
+				self.memory_snapshot = tracemalloc.take_snapshot()
+				logging.warning('Started tracing memory allocations')
+				return None
+			snapshot = tracemalloc.take_snapshot()
+			differences = snapshot.compare_to(self.memory_snapshot, 'traceback')
+			self.memory_snapshot = snapshot
+			self.memory_reports += 1
+			filename = '{}_memory-{}.txt'.format(self.path, self.memory_reports)
+		try:
+			with open(filename, 'w') as file:
+				current, peak = tracemalloc.get_traced_memory()
+				file.write('Traced memory: {} bytes, peak {} bytes\n\n'.format(current, peak))
+				for difference in differences[:config.tracemalloc_top]:
+					file.write('{:+d} bytes in {:+d} blocks, now {} bytes in {} blocks\n'.format(difference.size_diff,
+							difference.count_diff, difference.size, difference.count))
+					for line in difference.traceback.format():
+						file.write('{}\n'.format(line))
+					file.write('\n')
+		except OSError as err:
+			raise FileError('Could not write memory report: {}'.format(err))
+		logging.warning('Wrote memory growth report to {}'.format(filename))
+		return filename
+
+	## Stop tracing memory allocations
+	#  @return True if tracing was active
+	def memory_stop(self):
+		with self.lock:
+			if not tracemalloc.is_tracing():
+				return False
+			tracemalloc.stop()
+			self.memory_snapshot = None
+		logging.warning('Stopped tracing memory allocations')
+		return True
+
+	## Status for the control interface
+	#  @return Dict of profiler states
+	def status(self):
+		return {'sampling': self.thread is not None, 'samples': self.samples, 'tracing_memory': tracemalloc.is_tracing()}
+
+	## Sample all other threads until stopped
+	#  @note This is a worker method to be started as a thread
+	def _sampler(self):
+		own = threading.get_ident()
+		stacks = self.stacks
+		next_sample = time.perf_counter()
+		while not self.stopped.wait(max(next_sample - time.perf_counter(), 0)):
+			next_sample = max(next_sample + 1 / config.profiler_rate, time.perf_counter())
+			for ident, frame in sys._current_frames().items():
+				if ident == own:
+					continue
+				stack = self._collapse(frame)
+				try:
+					stacks[stack] += 1
+				except KeyError:
+					stacks[stack] = 1
+			self.samples += 1
+
+	## Join the frames of a stack
+	#  @param frame Innermost frame
+	#  @return Semicolon separated frame labels, outermost first
+	def _collapse(self, frame):
+		labels = list()
+		while frame is not None:
+			code = frame.f_code
+			try:
+				label = self.labels[code]
+			except KeyError:
+				label = self.labels[code] = '{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+			labels.append(label)
+			frame = frame.f_back
+		labels.reverse()
+		return ';'.join(labels)
@@ -7,6 +7,10 @@ import socket
 import hashlib
 import string
 import random
+import queue
+import threading
+import collections
+import itertools
 
 # Project modules
 import config
@@ -35,7 +39,7 @@ class PeerSession:
 		try:
 			self.sock.sendall(data)
 		except OSError as err:
-			raise PeerError(str(err))
+			raise PeerError(str(err)) from err
 
 	## Receives bytes blocking according to https://stackoverflow.com/a/17508900
 	#  @param required_bytes Nuber of bytes to be returned
@@ -52,11 +56,11 @@ class PeerSession:
 				try:
 					buffer = self.sock.recv(1024)
 				except OSError as err:
-					raise PeerError(str(err))
+					raise PeerError(str(err)) from err
 				if buffer == b'':
 					attempts_after_fail += 1
 				if attempts_after_fail >= 20:
-					raise PeerError('Socket connection broken')
+					raise PeerError('Socket connection broken', Reason.connection_closed)
 				data_parts.append(buffer)
 				received_bytes += len(buffer)
 			self.received_bytes_buffer = b''.join(data_parts)
@@ -84,21 +88,21 @@ class PeerSession:
 		# Parse protocol string
 		pstr = handshake_tuple[0]
 		if pstr != b'BitTorrent protocol':
-			raise PeerError('Peer speaks unknown protocol')
+			raise PeerError('Peer speaks unknown protocol', Reason.unknown_protocol)
 
 		# Parse reserved bytes for protocol extensions according to https://wiki.theory.org/BitTorrentSpecification#Reserved_Bytes
 		reserved = handshake_tuple[1]
-		reserved_bitmap = bytes_to_bitmap(reserved)
-		logging.debug('Reserved bytes in received handshake: {}'.format(reserved_bitmap))
+		if logging.getLogger().isEnabledFor(logging.DEBUG):
+			logging.debug('Reserved bytes in received handshake: %s', bytes_to_bitmap(reserved))
 
 		# Parse info hash
 		received_info_hash = handshake_tuple[2]
 		if not expected_hash is None and received_info_hash != expected_hash:
-			raise PeerError('Mismatch on received info hash')
+			raise PeerError('Mismatch on received info hash', Reason.info_hash_mismatch)
 
 		# Parse peer id
 		received_peer_id = handshake_tuple[3]
-		logging.debug('ID of connected peer is ' + str(received_peer_id))
+		logging.debug('ID of connected peer is %s', received_peer_id)
 
 		return received_peer_id, reserved, received_info_hash
 
@@ -116,8 +120,8 @@ class PeerSession:
 			reserved[7] |= 0x01
 		if extension_enabled:
 			reserved[5] |= 0x10
-		reserved_bitmap = bytes_to_bitmap(reserved)
-		logging.debug('Reserved bytes in sent handshake: {}'.format(reserved_bitmap))
+		if logging.getLogger().isEnabledFor(logging.DEBUG):
+			logging.debug('Reserved bytes in sent handshake: %s', bytes_to_bitmap(reserved))
 		format_string = '>B{}s8s20s20s'.format(len(pstr))
 		handshake = struct.pack(format_string, len(pstr), pstr, reserved, info_hash, self.peer_id.encode())
 		assert len(handshake) == 49 + len(pstr), 'handshake has the wrong length'
@@ -150,13 +154,16 @@ class PeerSession:
 
 		# Return message id and payload tuple
 		message = Message(message_id, payload)
-		message_str = message_to_string(message)
-		logging.debug('Received message: {}'.format(message_str))
+		if logging.getLogger().isEnabledFor(logging.DEBUG):
+			logging.debug('Received message: %s', message_to_string(message))
 		return message
 
 	## Collect all messages from the peer until timeout or error
+	#  @param observe Optional callable receiving the duration of each successful message receival,
+	#  not the final timeout which ends every session
+	#  @param arrivals Optional list to append tuples of message type and perf_counter arrival time to
 	#  @return List of tuples of message id and payload and duration without last timeout
-	def receive_all_messages(self):
+	def receive_all_messages(self, observe=None, arrivals=None):
 		messages = list()
 		max_duration = 0
 		while len(messages) < config.receive_message_max:
@@ -164,10 +171,16 @@ class PeerSession:
 			try:
 				message = self.receive_message()
 			except PeerError as err:
-				logging.debug('No more messages: {}'.format(err))
+				logging.debug('No more messages: %s', err)
 				break
 			messages.append(message)
-			max_duration = max(time.perf_counter() - start, max_duration)
+			end = time.perf_counter()
+			duration = end - start
+			if arrivals is not None:
+				arrivals.append((message.type, end))
+			max_duration = max(duration, max_duration)
+			if observe is not None:
+				observe(duration)
 		else:
 			logging.warning('Reached message limit')
 		if max_duration == 0:
@@ -184,8 +197,8 @@ class PeerSession:
 		format_string = '!IB{}s'.format(len(message.payload))
 		data = struct.pack(format_string, 1+len(message.payload), message.type, message.payload)
 		self.send_bytes(data) # PeerError
-		message_str = message_to_string(message)
-		logging.debug('Sent message: {}'.format(message_str))
+		if logging.getLogger().isEnabledFor(logging.DEBUG):
+			logging.debug('Sent message: %s', message_to_string(message))
 
 	## Sends a port message, according to BEP 5
 	#  @param dht_port UDP port of DHT node
@@ -193,7 +206,7 @@ class PeerSession:
 	def send_port(self, dht_port):
 		data = struct.pack('!H', dht_port)
 		self.send_message(Message(9, data)) # PeerError
-		logging.debug('Sent DHT port {} to remote peer'.format(dht_port))
+		logging.debug('Sent DHT port %s to remote peer', dht_port)
 
 	## Sends a extended message using the BEP 10 Extension Protocol
 	#  @param message The Message
@@ -202,7 +215,7 @@ class PeerSession:
 		format_string = '!B{}s'.format(len(payload))
 		data = struct.pack(format_string, extended_message_id, payload)
 		self.send_message(Message(20, data)) # PeerError
-		logging.debug('Sent Extension Protocol message of type {}'.format(extended_message_id))
+		logging.debug('Sent Extension Protocol message of type %s', extended_message_id)
 
 	## Sends extended handshake of the BEP 10 Extension Protocol
 	#  @param supported_extensions Dict of supported extensions
@@ -215,6 +228,37 @@ class PeerSession:
 		handshake_bencoded = bencodepy.encode(handshake)
 		self.send_extended_message(0, handshake_bencoded)
 
+## Receive timeout derived from the connect round trip time and observed message inter-arrival times
+#  @note Only measured gaps are observed. Gaps longer than the timeout end a session like the idle timeout after
+#  the last message, so they cannot be told apart; timeout_margin keeps the timeout above the estimated quantile.
+class AdaptiveTimeout:
+	def __init__(self):
+		self.interarrival = P2Quantile(config.timeout_quantile)
+		self.lock = threading.Lock()
+
+	## Estimate another quantile, starting without observations
+	#  @param quantile Quantile between 0 and 1
+	def set_quantile(self, quantile):
+		with self.lock:
+			self.interarrival = P2Quantile(quantile)
+
+	## Record the time waited for a message
+	#  @param duration Seconds
+	def observe(self, duration):
+		with self.lock:
+			self.interarrival.add(duration)
+
+	## Timeout for a connection
+	#  @param rtt Measured round trip time in seconds or None if unknown
+	#  @return Timeout in seconds within the configured bounds
+	def timeout(self, rtt=None):
+		with self.lock:
+			estimate = self.interarrival.value()
+		timeout = config.network_timeout if estimate is None else estimate * config.timeout_margin
+		if rtt is not None:
+			timeout = max(timeout, rtt * config.timeout_rtt_factor)
+		return min(max(timeout, config.network_timeout_min), config.network_timeout_max)
+
 ## Pack a peer message according to http://www.bittorrent.org/beps/bep_0003.html#peer-messages
 #  @param message_id Message id to specify their type, -1 for a keep-alive
 #  @param payload Bytes string representing the payload
@@ -313,9 +357,35 @@ def bitfield_from_messages(messages, pieces_number):
 			other_count += 1
 
 	# Return peer_id and bitfield
-	logging.info('Received {} bitfield, {} have and {} other messages'.format(bitfield_count, have_count, other_count))
+	logging.info('Received %s bitfield, %s have and %s other messages', bitfield_count, have_count, other_count)
 	return bitfield
 
+## Extract peers from ut_pex messages according to BEP 11
+#  @param messages List of messages to be evaluated
+#  @return List of ip port tuples of added IPv4 peers
+def peers_from_pex(messages):
+	peers = list()
+	for message in messages:
+		# Check for extended messages of advertised type
+		if message.type != 20 or len(message.payload) < 2:
+			continue
+		extended_message_id, extended_payload = unpack_message(message.payload)
+		if extended_message_id != config.extension_ut_pex_id:
+			continue
+
+		# Decode compact peer list
+		try:
+			added = bencodepy.decode(extended_payload)[b'added']
+		except (bencodepy.exceptions.DecodingError, KeyError, TypeError) as err:
+			logging.warning('Peer sent bad ut_pex message: {}'.format(err))
+			continue
+		if type(added) is not bytes:
+			logging.warning('Peer sent bad ut_pex peer list')
+			continue
+		peers.extend(parse_ips(added))
+	logging.info('Received %s peers via ut_pex', len(peers))
+	return peers
+
 ## Determine the threshold in pieces where a download is considered complete
 #  @param total_pieces Number of total pieces
 #  @return True false answer
@@ -327,24 +397,61 @@ def get_complete_threshold(total_pieces):
 #  @param own_peer_id Own peer id
 #  @param dht_enabled Should DHT node port be announced
 #  @param info_hash Info hash for outgoing evaluations, None for incoming connections
+#  @param timeout Optional AdaptiveTimeout to derive the receive timeout from and to feed with message durations
+#  @param rtt Measured connect round trip time in seconds, None if unknown
+#  @param phases Optional dict filled with durations in seconds of the reached phases, also on failure
 #  @return Evaluation results
 #  @exception PeerError
-def evaluate_peer(sock, own_peer_id, dht_enabled, info_hash=None):
+def evaluate_peer(sock, own_peer_id, dht_enabled, info_hash=None, timeout=None, rtt=None, phases=None):
+	if phases is None:
+		return _evaluate_peer(sock, own_peer_id, dht_enabled, info_hash, timeout, rtt, None)
+	start = time.perf_counter()
+	arrivals = list()
+	try:
+		return _evaluate_peer(sock, own_peer_id, dht_enabled, info_hash, timeout, rtt, arrivals)
+	finally:
+		end = time.perf_counter()
+		phases['session'] = end - start
+		if arrivals:
+			phases['handshake'] = arrivals[0][1] - start
+		if len(arrivals) > 1:
+			phases['first message'] = arrivals[1][1] - start
+			for message_type, arrival in arrivals[1:]:
+				if message_type == 5:
+					phases['bitfield'] = arrival - start
+					break
+
+## Evaluation of evaluate_peer
+#  @param arrivals None or list to append tuples of message type and arrival time to, the handshake has type None
+def _evaluate_peer(sock, own_peer_id, dht_enabled, info_hash, timeout, rtt, arrivals):
 	# Establish session
 	session = PeerSession(sock, own_peer_id)
+	if timeout is not None:
+		try:
+			sock.settimeout(timeout.timeout(rtt))
+		except OSError as err:
+			raise PeerError('Failed to set timeout: {}'.format(err), Reason.timeout_setup) from err
 
 	# Incoming connection
 	if info_hash is None:
 		rec_peer_id, reserved, rec_info_hash = session.receive_handshake() # PeerError
-		session.send_handshake(rec_info_hash, dht_enabled) # PeerError
+		if arrivals is not None:
+			arrivals.append((None, time.perf_counter()))
+		session.send_handshake(rec_info_hash, dht_enabled, config.pex_enabled) # PeerError
 
 	# Outgoning connection
 	else:
-		session.send_handshake(info_hash, dht_enabled) # PeerError
+		session.send_handshake(info_hash, dht_enabled, config.pex_enabled) # PeerError
 		rec_peer_id, reserved, rec_info_hash = session.receive_handshake(info_hash) # PeerError
+		if arrivals is not None:
+			arrivals.append((None, time.perf_counter()))
+
+	# Advertise peer exchange according to BEP 11 if the Extension Protocol is supported
+	if config.pex_enabled and reserved[5] & 0x10 != 0:
+		session.send_extended_handshake({'ut_pex': config.extension_ut_pex_id}, dict()) # PeerError
 
 	# Receive messages
-	messages, duration = session.receive_all_messages()
+	messages, duration = session.receive_all_messages(None if timeout is None else timeout.observe, arrivals)
 
 	# Send own DHT node UDP port to peer if supported
 	if dht_enabled and reserved[7] & 0x01 != 0:
@@ -356,6 +463,265 @@ def evaluate_peer(sock, own_peer_id, dht_enabled, info_hash=None):
 	# Return results
 	return rec_peer_id, rec_info_hash, messages, duration
 
+## Downloads metadata blocks according to BEP 9 from multiple peers in parallel
+class MetadataDownloader:
+	## Prepare download of one info dict
+	#  @param info_hash Info hash of desired torrent
+	#  @param own_peer_id Own peer id to use
+	def __init__(self, info_hash, own_peer_id):
+		self.info_hash = info_hash
+		self.own_peer_id = own_peer_id
+		self.group = ConnectionGroup()
+		self.finished = threading.Event()
+		self.lock = threading.Lock()
+		self.metadata_size = None
+		self.number_blocks = None
+		self.blocks = dict()
+		self.pending = collections.Counter()
+		self.contributors = list()
+
+	## Download metadata from a list of peers, a fixed number of peers is used at once
+	#  @note If the merged blocks do not match the info hash, all blocks are fetched again from one peer at a time,
+	#  first from the peers which sent blocks, then from the other asked peers and the peers not asked yet
+	#  @param peers List of ip port tuples of peers to ask
+	#  @return Bencoded info dict, verified against the info hash
+	#  @exception PeerError
+	def download(self, peers):
+		peers = iter(peers)
+		stopped = queue.Queue()
+		running = 0
+		parallel_peers = config.metadata_parallel_peers
+		asked = list()
+		mismatch = False
+		while True:
+			while not self.finished.is_set():
+				# Replace finished peer workers with new peers
+				while running < parallel_peers:
+					try:
+						peer = next(peers)
+					except StopIteration:
+						break
+					thread = threading.Thread(target=self._peer_worker, args=(peer, stopped))
+					thread.daemon = True
+					thread.start()
+					asked.append(peer)
+					running += 1
+				if running == 0:
+					break
+				stopped.get()
+				running -= 1
+
+			# Abort remaining connections
+			self.group.cancel()
+			if not self.finished.is_set():
+				if mismatch:
+					raise PeerError('Mismatch of info hash on received parts and no other peer left', Reason.info_hash_mismatch)
+				raise PeerError('Could not fetch metadata from any peer')
+
+			# Merge received blocks and check hash value once
+			metadata = b''.join(self.blocks[block] for block in range(self.number_blocks))
+			if hashlib.sha1(metadata).digest() == self.info_hash:
+				logging.info('Successfully fetched metadata of {} bytes'.format(len(metadata)))
+				return metadata
+
+			# Aborted workers must stop before they could change the blocks of the next attempt
+			logging.warning('Mismatch of info hash on received parts, fetching all blocks from a single peer')
+			for i in range(running):
+				stopped.get()
+			running = 0
+			if not mismatch:
+				# A single contributor sent bad blocks itself, otherwise any of them may have
+				retry = self.contributors if len(self.contributors) > 1 else list()
+				peers = itertools.chain(retry, [peer for peer in asked if peer not in self.contributors], peers)
+			parallel_peers = 1
+			mismatch = True
+			self.group = ConnectionGroup()
+			self.finished.clear()
+			self.metadata_size = None
+			self.number_blocks = None
+			self.blocks = dict()
+			self.pending = collections.Counter()
+			self.contributors = list()
+
+	## Request and receive blocks from one peer until all blocks are available
+	#  @param peer Ip port tuple
+	#  @param stopped Queue to report termination to
+	#  @note This is a worker method to be started as a thread
+	def _peer_worker(self, peer, stopped):
+		requested = set()
+		try:
+			with TCPConnection(*peer, timeout=config.network_timeout, group=self.group) as sock:
+				session, ut_metadata_id, metadata_size = open_metadata_session(sock, self.info_hash, self.own_peer_id)
+				self._set_size(metadata_size) # PeerError
+				while not self.finished.is_set():
+					# Keep a number of block requests in flight
+					for block in self._claim_blocks(config.metadata_block_pipeline - len(requested), requested):
+						request = bencodepy.encode({'msg_type': 0, 'piece': block})
+						session.send_extended_message(ut_metadata_id, request) # PeerError
+						requested.add(block)
+					if not requested:
+						break
+
+					# Wait for the next block
+					block, data = self._receive_block(session, requested) # PeerError
+					requested.discard(block)
+					self._store_block(block, data, peer)
+		except (PeerError, UtilError) as err:
+			if not self.finished.is_set():
+				logging.info('Stopped fetching metadata from peer: {}'.format(err))
+		finally:
+			self._release_blocks(requested)
+			stopped.put(peer)
+
+	## Remember the metadata size of the first peer, reject peers reporting other sizes
+	#  @param metadata_size Size reported by a peer
+	#  @exception PeerError
+	def _set_size(self, metadata_size):
+		with self.lock:
+			if self.metadata_size is None:
+				if type(metadata_size) is not int or not 0 < metadata_size <= config.metadata_size_max:
+					raise PeerError('Bad metadata_size')
+				self.metadata_size = metadata_size
+				self.number_blocks = math.ceil(metadata_size / UT_METADATA_BLOCK_SIZE)
+				logging.info('Request {} bytes of metadata in {} blocks ...'.format(metadata_size, self.number_blocks))
+			elif metadata_size != self.metadata_size:
+				raise PeerError('Peer reported different metadata_size')
+
+	## Choose blocks to request, prefer blocks no other peer is waiting for
+	#  @param count Maximum number of blocks
+	#  @param requested Blocks already requested by the calling peer
+	#  @return List of block indices
+	def _claim_blocks(self, count, requested):
+		with self.lock:
+			missing = [block for block in range(self.number_blocks)
+					if block not in self.blocks and block not in requested]
+			missing.sort(key=lambda block: self.pending[block])
+			claimed = missing[:max(count, 0)]
+			for block in claimed:
+				self.pending[block] += 1
+		return claimed
+
+	## Release blocks requested by a peer which stops
+	#  @param blocks Block indices
+	def _release_blocks(self, blocks):
+		with self.lock:
+			for block in blocks:
+				self.pending[block] -= 1
+
+	## Save a received block, finish when all blocks are available
+	#  @param block Block index
+	#  @param data Block content
+	#  @param peer Ip port tuple of the sending peer
+	def _store_block(self, block, data, peer):
+		with self.lock:
+			self.pending[block] -= 1
+			if block in self.blocks:
+				return
+			self.blocks[block] = data
+			if peer not in self.contributors:
+				self.contributors.append(peer)
+			logging.info('Received metadata block {} of length {}'.format(block, len(data)))
+			if len(self.blocks) == self.number_blocks:
+				self.finished.set()
+		if self.finished.is_set():
+			self.group.cancel()
+
+	## Receive messages until one of the requested blocks arrives
+	#  @param session Peer session with finished extended handshake
+	#  @param requested Indices of requested blocks
+	#  @return Tuple of block index and data
+	#  @exception PeerError
+	def _receive_block(self, session, requested):
+		for i in range(config.receive_message_max):
+			message = session.receive_message() # PeerError
+
+			# Check for extended messages
+			if message.type != 20:
+				continue
+			extended_message_id, extended_payload = unpack_message(message.payload)
+			if extended_message_id != config.extension_ut_metadata_id:
+				logging.debug('Peer sent extended message of other type {}'.format(extended_message_id))
+				continue
+
+			# Decode extended payload
+			try:
+				extended_dict = bencodepy.decode(extended_payload)
+				msg_type = extended_dict[b'msg_type']
+				piece = extended_dict[b'piece']
+			except (bencodepy.exceptions.DecodingError, KeyError) as err:
+				raise PeerError('Peer sent bad metadata response: {}'.format(err))
+			if msg_type == 2:
+				raise PeerError('Peer rejected metadata block {}'.format(piece))
+			if msg_type != 1 or piece not in requested:
+				logging.warning('Peer sent unexpected metadata message')
+				continue
+
+			# Extract block appended to the bencoded dict
+			expected_appendix = UT_METADATA_BLOCK_SIZE if piece < self.number_blocks-1 else self.metadata_size - piece * UT_METADATA_BLOCK_SIZE
+			appendix_start = len(extended_payload) - expected_appendix
+			if appendix_start <= 0:
+				raise PeerError('Peer sent metadata block {} of wrong length'.format(piece))
+			return piece, extended_payload[appendix_start:]
+		raise PeerError('No metadata block until message limit')
+
+## Exchange handshakes and check for ut_metadata support according to BEP 9 and BEP 10
+#  @param sock Connection socket
+#  @param info_hash Info hash of desired torrent
+#  @param own_peer_id Own peer id to use
+#  @return Tuple of peer session, remote ut_metadata message id and metadata size
+#  @exception PeerError
+def open_metadata_session(sock, info_hash, own_peer_id):
+	# Establish session
+	logging.info('Exchanging handshakes ...')
+	session = PeerSession(sock, own_peer_id)
+	session.send_handshake(info_hash, dht_enabled=True, extension_enabled=True)
+	rec_peer_id, reserved, rec_info_hash = session.receive_handshake(info_hash)
+	if rec_info_hash != info_hash:
+		raise PeerError('Info hash mismatch')
+	if reserved[5] & 0x10 == 0:
+		raise PeerError('Extension Protocol not supported')
+
+	# Sending Extension Protocol handshake
+	logging.info('Exchanging extended handshake ...')
+	supported_extensions = {'ut_metadata': config.extension_ut_metadata_id}
+	session.send_extended_handshake(supported_extensions, dict())
+
+	# Receive Extension Protocol handshake
+	msg_count = 0
+	while msg_count < config.receive_message_max:
+		try:
+			rec_message = session.receive_message()
+		except PeerError as err:
+			raise PeerError('No Extension Protocol support: {}'.format(err))
+		if rec_message.type == 20:
+			break
+		msg_count += 1
+	else:
+		raise PeerError('No extension handshake until message limit')
+
+	# Check for ut_metadata support
+	logging.info('Check handshake for ut_metadata support ...')
+	extended_message_id, extended_payload = unpack_message(rec_message.payload)
+	if extended_message_id != 0:
+		raise PeerError('Unknown extended message of type {}'.format(extended_message_id))
+	try:
+		extended_dict = bencodepy.decode(extended_payload)
+	except bencodepy.exceptions.DecodingError as err:
+		raise PeerError('Decode error: {}'.format(err))
+	try:
+		supported_extensions = extended_dict[b'm']
+	except KeyError:
+		raise PeerError('Bad handshake')
+	try:
+		rec_ut_metadata_id = supported_extensions[b'ut_metadata']
+	except KeyError:
+		raise PeerError('No ut_metadata support')
+	try:
+		metadata_size = extended_dict[b'metadata_size']
+	except KeyError:
+		raise PeerError('Not received metadata_size')
+	return session, rec_ut_metadata_id, metadata_size
+
 ## Get pieces count and pieces size of an info hash form peer using BEP 9 and BEP 10
 #  @param info_hash Info hash of desired torrent
 #  @param peer Peer to ask, should be known to have the torrent
@@ -363,122 +729,13 @@ def evaluate_peer(sock, own_peer_id, dht_enabled, info_hash=None):
 #  @return Bencoded info dict
 #  @exception PeerError
 def get_ut_metadata(info_hash, peer, own_peer_id):
-	# Contact peer
-	with TCPConnection(*peer, timeout=config.network_timeout) as sock:
-		# Establish session
-		logging.info('Exchanging handshakes ...')
-		session = PeerSession(sock, own_peer_id)
-		session.send_handshake(info_hash, dht_enabled=True, extension_enabled=True)
-		rec_peer_id, reserved, rec_info_hash = session.receive_handshake(info_hash)
-		if rec_info_hash != info_hash:
-			raise PeerError('Info hash mismatch')
-		if reserved[5] & 0x10 == 0:
-			raise PeerError('Extension Protocol not supported')
-
-		# Sending Extension Protocol handshake
-		logging.info('Exchanging extended handshake ...')
-		supported_extensions = {'ut_metadata': config.extension_ut_metadata_id}
-		session.send_extended_handshake(supported_extensions, dict())
-
-		# Receive Extension Protocol handshake
-		msg_count = 0
-		while msg_count < config.receive_message_max:
-			try:
-				rec_message = session.receive_message()
-			except PeerError as err:
-				raise PeerError('No Extension Protocol support: {}'.format(err))
-			if rec_message.type == 20:
-				break
-			msg_count += 1
-		else:
-			raise PeerError('No extension handshake until message limit')
-
-		# Check for ut_metadata support
-		logging.info('Check handshake for ut_metadata support ...')
-		extended_message_id, extended_payload = unpack_message(rec_message.payload)
-		if extended_message_id != 0:
-			raise PeerError('Unknown extended message of type {}'.format(extended_message_id))
-		try:
-			extended_dict = bencodepy.decode(extended_payload)
-		except bencodepy.exceptions.DecodingError as err:
-			raise PeerError('Decode error: {}'.format(err))
-		try:
-			supported_extensions = extended_dict[b'm']
-		except KeyError:
-			raise PeerError('Bad handshake')
-		try:
-			rec_ut_metadata_id = supported_extensions[b'ut_metadata']
-		except KeyError:
-			raise PeerError('No ut_metadata support')
-		try:
-			metadata_size = extended_dict[b'metadata_size']
-		except KeyError:
-			raise PeerError('Not received metadata_size')
-
-		# Request blocks
-		number_blocks = math.ceil(metadata_size / UT_METADATA_BLOCK_SIZE)
-		logging.info('Request {} bytes of metadata in {} blocks ...'.format(metadata_size, number_blocks))
-		for block in range(0, number_blocks):
-			request = {'msg_type': 0, 'piece': block}
-			request = bencodepy.encode(request)
-			session.send_extended_message(rec_ut_metadata_id, request)
-
-		# Receive data
-		logging.info('Receiving all messages ...')
-		messages = session.receive_all_messages()[0]
-
-	# Parse response
-	metadata_pieces = dict()
-	for message in messages:
-		# Check for extended messages
-		if message.type != 20:
-			continue
-		extended_message_id, extended_payload = unpack_message(message.payload)
-		if extended_message_id != config.extension_ut_metadata_id:
-			logging.warning('Peer sent extended message of unknown type {}'.format(extended_message_id))
-			continue
+	return MetadataDownloader(info_hash, own_peer_id).download([peer])
 
-		# Decode extended payload
-		try:
-			extended_dict = bencodepy.decode(extended_payload)
-		except bencodepy.exceptions.DecodingError as err:
-			logging.warning('Peer sent bad extended message: {}'.format(err))
-			continue
-		try:
-			msg_type = extended_dict[b'msg_type']
-		except KeyError as err:
-			logging.warning('Peer sent bad metadata response: {}'.format(err))
-			continue
-		if msg_type != 1:
-			logging.warning('Peer sent wrong metadata response')
-			continue
-		try:
-			piece = extended_dict[b'piece']
-		except KeyError as err:
-			logging.warning('Peer sent bad metadata response: {}'.format(err))
-			continue
-
-		# Save metadata pieces
-		expected_appendix = UT_METADATA_BLOCK_SIZE if piece < number_blocks-1 else metadata_size % UT_METADATA_BLOCK_SIZE
-		appendix_start = len(extended_payload) - expected_appendix
-		assert appendix_start > 0
-		metadata_pieces[piece] = extended_payload[appendix_start:]
-		logging.info('Received metadata block {} of length {}'.format(piece, len(metadata_pieces[piece])))
-
-	# Merge received pieces of metadata
-	metadata = list()
-	for block in range(0, number_blocks):
-		try:
-			metadata.append(metadata_pieces[block])
-		except KeyError:
-			raise PeerError('Peer did not send block {}'.format(block))
-	metadata = b''.join(metadata)
-
-	# Check hash value
-	rec_info_hash = hashlib.sha1(metadata).digest()
-	if rec_info_hash != info_hash:
-		raise PeerError('Mismatch of info hash on received parts')
-
-	# Return info dict
-	logging.info('Successfully fetched metadata from peer')
-	return metadata
+## Fetch metadata by downloading blocks from multiple peers in parallel
+#  @param info_hash Info hash of desired torrent
+#  @param peers List of ip port tuples of peers to ask
+#  @param own_peer_id Own peer id to use
+#  @return Bencoded info dict, verified against the info hash
+#  @exception PeerError
+def fetch_metadata(info_hash, peers, own_peer_id):
+	return MetadataDownloader(info_hash, own_peer_id).download(peers)
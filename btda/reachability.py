@@ -0,0 +1,110 @@
+# Built-in modules
+import json
+import logging
+import math
+import os
+import threading
+
+# Project modules
+import config
+from util import *
+
+## Online estimate of the connect success of peers, learned per address prefix, port range and source
+class ReachabilityModel:
+	## Load a persisted model if available
+	#  @param path File path of the JSON model
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.total = [1, 1] # successes, failures
+		self.counts = dict() # feature -> [successes, failures]
+		self.load()
+
+	## Derive the features of a peer
+	#  @note Only features known before the first contact, as predictions are made for new peers
+	#  @param peer The peer
+	#  @return List of feature strings
+	@staticmethod
+	def features(peer):
+		return ['net:' + peer.ip_address.rpartition('.')[0], 'port:' + port_range(peer.port), 'source:' + peer.source.name]
+
+	## Estimate the probability of a successful evaluation
+	#  @param peer The peer
+	#  @return Probability between 0 and 1
+	def predict(self, peer):
+		with self.lock:
+			prior = self.total[0] / sum(self.total)
+			log_odds = logit(prior)
+			for feature in self.features(peer):
+				try:
+					success, failure = self.counts[feature]
+				except KeyError:
+					continue
+				smoothed = (success + config.reachability_smoothing * prior) / (success + failure + config.reachability_smoothing)
+				log_odds += logit(smoothed) - logit(prior)
+		return 1 / (1 + math.exp(-log_odds))
+
+	## Learn from an evaluation attempt
+	#  @param peer The peer
+	#  @param success True if connection and handshake succeeded
+	def observe(self, peer, success):
+		index = 0 if success else 1
+		with self.lock:
+			self.total[index] += 1
+			for feature in self.features(peer):
+				try:
+					self.counts[feature][index] += 1
+				except KeyError:
+					self.counts[feature] = [0, 0]
+					self.counts[feature][index] = 1
+			if len(self.counts) > config.reachability_max_features:
+				self._prune()
+
+	## Forget the half of features with the fewest observations
+	def _prune(self):
+		ranked = sorted(self.counts.items(), key=lambda item: sum(item[1]))
+		self.counts = dict(ranked[len(ranked) // 2:])
+		logging.info('Pruned reachability model to {} features'.format(len(self.counts)))
+
+	## Read the model from file
+	def load(self):
+		try:
+			with open(self.path) as file:
+				data = json.load(file)
+			self.total = data['total']
+			self.counts = data['counts']
+		except FileNotFoundError:
+			logging.info('No reachability model at {}, starting empty'.format(self.path))
+		except (OSError, ValueError, KeyError) as err:
+			logging.warning('Could not load reachability model: {}'.format(err))
+		else:
+			logging.info('Loaded reachability model with {} features'.format(len(self.counts)))
+
+	## Write the model to file atomically
+	def save(self):
+		with self.lock:
+			data = json.dumps({'total': self.total, 'counts': self.counts})
+		try:
+			with open(self.path + '.tmp', mode='w') as file:
+				file.write(data)
+			os.replace(self.path + '.tmp', self.path)
+		except OSError as err:
+			logging.warning('Could not save reachability model: {}'.format(err))
+
+## Classify a port number
+#  @param port Port number
+#  @return Name of the port range
+def port_range(port):
+	if 6881 <= port <= 6889:
+		return 'bittorrent'
+	if port < 1024:
+		return 'system'
+	if port < 49152:
+		return 'registered{}'.format(port // 4096)
+	return 'dynamic'
+
+## Logarithm of the odds
+#  @param probability Probability between 0 and 1, exclusive
+#  @return Log odds
+def logit(probability):
+	return math.log(probability / (1 - probability))
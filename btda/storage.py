@@ -16,8 +16,12 @@ import maxminddb.errors
 
 # Project modules
 import config
+import eventlog
 from util import *
 
+# The torrent table class shadows the named tuple
+TorrentTuple = Torrent
+
 # Create declarative base class, from which table classes are inherited
 Base = sqlalchemy.ext.declarative.declarative_base()
 
@@ -38,7 +42,7 @@ class Peer(Base):
 	last_seen = sqlalchemy.Column(sqlalchemy.types.Integer)
 	max_speed = sqlalchemy.Column(sqlalchemy.types.Float)
 	visits = sqlalchemy.Column(sqlalchemy.types.Integer)
-	source = sqlalchemy.Column(sqlalchemy.types.Enum('tracker', 'incoming', 'dht'))
+	source = sqlalchemy.Column(sqlalchemy.types.Enum('tracker', 'incoming', 'dht', 'pex'))
 	torrent = sqlalchemy.Column(sqlalchemy.types.Integer)
 
 ## Declarative class for torrent table
@@ -62,7 +66,7 @@ class Request(Base):
 
 	id = sqlalchemy.Column(sqlalchemy.types.Integer, primary_key=True)
 	timestamp = sqlalchemy.Column(sqlalchemy.types.Integer)
-	source = sqlalchemy.Column(sqlalchemy.types.Enum('tracker', 'incoming', 'dht'))
+	source = sqlalchemy.Column(sqlalchemy.types.Enum('tracker', 'incoming', 'dht', 'pex'))
 	received_peers = sqlalchemy.Column(sqlalchemy.types.Integer)
 	duplicate_peers = sqlalchemy.Column(sqlalchemy.types.Integer)
 	seeders = sqlalchemy.Column(sqlalchemy.types.Integer)
@@ -81,11 +85,37 @@ class Statistic(Base):
 	visited_queue = sqlalchemy.Column(sqlalchemy.types.Integer)
 	unique_incoming = sqlalchemy.Column(sqlalchemy.types.Integer)
 	success_active = sqlalchemy.Column(sqlalchemy.types.Integer)
+	success_per_minute = sqlalchemy.Column(sqlalchemy.types.Float)
 	thread_workload = sqlalchemy.Column(sqlalchemy.types.Float)
+	workload_distribution = sqlalchemy.Column(sqlalchemy.types.String)
+	torrent_share = sqlalchemy.Column(sqlalchemy.types.String)
 	load_average = sqlalchemy.Column(sqlalchemy.types.Float)
 	memory_mb = sqlalchemy.Column(sqlalchemy.types.Float)
 	server_threads = sqlalchemy.Column(sqlalchemy.types.Integer)
 	evaluator_threads = sqlalchemy.Column(sqlalchemy.types.Integer)
+	evaluator_limit = sqlalchemy.Column(sqlalchemy.types.Integer)
+	limit_decisions = sqlalchemy.Column(sqlalchemy.types.String)
+	handler_stages = sqlalchemy.Column(sqlalchemy.types.String)
+	peer_queue_fill = sqlalchemy.Column(sqlalchemy.types.Float)
+	visited_queue_fill = sqlalchemy.Column(sqlalchemy.types.Float)
+	backpressure = sqlalchemy.Column(sqlalchemy.types.String)
+	pressure_dropped = sqlalchemy.Column(sqlalchemy.types.Integer)
+
+## Declarative class for latency table
+class Latency(Base):
+	__tablename__ = 'latency'
+
+	id = sqlalchemy.Column(sqlalchemy.types.Integer, primary_key=True)
+	timestamp = sqlalchemy.Column(sqlalchemy.types.Integer)
+	phase = sqlalchemy.Column(sqlalchemy.types.String)
+	source = sqlalchemy.Column(sqlalchemy.types.Enum('tracker', 'incoming', 'dht', 'pex'))
+	outcome = sqlalchemy.Column(sqlalchemy.types.String)
+	count = sqlalchemy.Column(sqlalchemy.types.Integer)
+	p50_sec = sqlalchemy.Column(sqlalchemy.types.Float)
+	p90_sec = sqlalchemy.Column(sqlalchemy.types.Float)
+	p99_sec = sqlalchemy.Column(sqlalchemy.types.Float)
+	p999_sec = sqlalchemy.Column(sqlalchemy.types.Float)
+	max_sec = sqlalchemy.Column(sqlalchemy.types.Float)
 
 ## Handling database access with SQLAlchemy
 class Database:
@@ -124,15 +154,17 @@ class Database:
 
 	## Store a peer's statistic
 	#  @param peer Peer named tuple
+	#  @param location Location tuple from get_place_by_ip, looked up if None
+	#  @param commit Commit new peers immediately, else only assign the database id and leave committing to the caller
 	#  @return Database id if peer is new, None else
 	#  @exception DatabaseError
-	def store_peer(self, peer):
+	def store_peer(self, peer, location=None, commit=True):
 		# Get thread-local session
 		session = self.Session()
 
 		# Commit if necessary
 		now = time.perf_counter()
-		if now - self.last_peer_commit > 10:
+		if commit and now - self.last_peer_commit > 10:
 			self.last_peer_commit = now
 			try:
 				session.commit()
@@ -143,7 +175,8 @@ class Database:
 		# Check if this is a new peer
 		if peer.key is None:
 			# Get meta data
-			location = self.get_place_by_ip(peer.ip_address)
+			if location is None:
+				location = self.get_place_by_ip(peer.ip_address)
 			timestamp = datetime.datetime.now()
 			client = client_from_peerid(peer.id)
 
@@ -155,20 +188,25 @@ class Database:
 					source=peer.source.name, torrent=peer.torrent)
 			try:
 				session.add(new_peer)
-				session.commit()
+				if commit:
+					session.commit()
+				else:
+					session.flush()
 			except Exception as err:
 				session.rollback()
 				raise DatabaseError('{} during store new peer: {}'.format(type(err).__name__, err))
 
 			# Return database id
 			database_id = new_peer.id
-			logging.info('Stored new peer with database id {}'.format(database_id))
+			logging.info('Stored new peer with database id %s', database_id)
 			return database_id
 
 		# Update former stored peer
 		else:
 			# Get and delete old entry
 			database_peer = session.query(Peer).filter_by(id=peer.key).first()
+			if database_peer is None:
+				raise DatabaseError('Peer with database id {} does not exist'.format(peer.key))
 			session.delete(database_peer)
 
 			# Copy first to last statistics on second visit
@@ -182,7 +220,7 @@ class Database:
 			time_delta_seconds = time_delta.total_seconds()
 			pieces_delta = peer.pieces - database_peer.last_pieces
 			pieces_per_second = pieces_delta / time_delta_seconds
-			logging.debug('Download speed since last visit is {} pieces per second'.format(pieces_per_second))
+			logging.debug('Download speed since last visit is %s pieces per second', pieces_per_second)
 
 			# Update peer
 			database_peer.last_pieces = peer.pieces
@@ -197,7 +235,24 @@ class Database:
 			except Exception as err:
 				session.rollback()
 				raise DatabaseError('{} during update peer: {}'.format(type(err).__name__, err))
-			logging.debug('Updated peer with database id {}'.format(peer.key))
+			logging.debug('Updated peer with database id %s', peer.key)
+
+	## Commit pending changes of the calling thread's session
+	#  @exception DatabaseError
+	def commit(self):
+		session = self.Session()
+		try:
+			session.commit()
+		except Exception as err:
+			session.rollback()
+			raise DatabaseError('{} during commit: {}'.format(type(err).__name__, err))
+
+	## Discard pending changes of the calling thread's session
+	def rollback(self):
+		try:
+			self.Session().rollback()
+		except Exception as err:
+			logging.critical('{} during rollback: {}'.format(type(err).__name__, err))
 
 	## Uses a local GeoIP2 database to geolocate an ip address
 	#  @param ip_address The address in question
@@ -212,7 +267,7 @@ class Database:
 			logging.warning('IP address is not in the database: {}'.format(err))
 			return None, None, None, None
 		else:
-			logging.debug('Location of ip address is {}, {}, {}'.format(response.city.name, response.country.name, response.continent.name))
+			logging.debug('Location of ip address is %s, %s, %s', response.city.name, response.country.name, response.continent.name)
 			return response.continent.code, response.country.iso_code, response.location.latitude, response.location.longitude
 
 	## Store a given torrent in the database
@@ -245,6 +300,24 @@ class Database:
 		logging.info('Stored {} with database id {}'.format(torrent, database_id))
 		return database_id
 
+	## Read all stored torrents, e.g. to resume an analysis
+	#  @return Dict of database id and tuple of util.Torrent named tuple, file path and display name
+	#  @exception DatabaseError
+	def load_torrents(self):
+		# Get thread-local session
+		session = self.Session()
+
+		try:
+			rows = session.query(Torrent).all()
+		except Exception as err:
+			raise DatabaseError('{} during torrent loading: {}'.format(type(err).__name__, err))
+		torrents = dict()
+		for row in rows:
+			announce_url = row.announce_url.split(',') if row.announce_url else None
+			torrents[row.id] = (TorrentTuple(announce_url, row.info_hash, row.info_hash_hex, row.pieces_count, row.piece_size,
+					row.complete_threshold), row.filepath, row.display_name)
+		return torrents
+
 	## Store statistics about a request for new peers
 	#  @param source A peer_analyzer.Source enum
 	#  @param received_peers Number of received peers
@@ -271,6 +344,7 @@ class Database:
 			session.commit()
 		except Exception as err:
 			session.rollback()
+			record_failed_write('request storing', err)
 			raise DatabaseError('{} during request storing: {}'.format(type(err).__name__, err))
 		logging.info('Stored {} request: {} peers received, {} duplicates, took {} seconds'.format(source.name, received_peers, duplicate_peers, duration))
 
@@ -279,11 +353,22 @@ class Database:
 	#  @param unique_incoming Seen unique incoming peers
 	#  @param visited_queue Length of the visited peers queue
 	#  @param success_active Active evaluations successful
+	#  @param success_per_minute Successful active evaluations per minute since the last statistic
 	#  @param thread_workload Percentage of active time between 0 and 1
+	#  @param workload_distribution Dict of statistic name and workload over the evaluator threads
+	#  @param torrent_share Dict of torrent id and its share of active evaluations between 0 and 1
 	#  @param server_threads Number of currently active server threads
 	#  @param evaluator_threads Number of currently active evaluator threads
+	#  @param evaluator_limit Current limit of active evaluator threads
+	#  @param limit_decisions Dict of concurrency controller decisions and their count
+	#  @param handler_stages List of name, queue depth and items per second tuples of the peer handler stages
+	#  @param peer_queue_fill Fill level of the bounded main queue between 0 and 1, None if unbounded
+	#  @param visited_queue_fill Fill level of the bounded visited peers queue between 0 and 1, None if unbounded
+	#  @param backpressure Dict of full queue and seconds spent full since last statistic
+	#  @param pressure_dropped Number of discovered peers dropped on a full main queue since last statistic
 	#  @exception DatabaseError
-	def store_statistic(self, peer_queue, visited_queue, unique_incoming, success_active, thread_workload, server_threads, evaluator_threads):
+	def store_statistic(self, peer_queue, visited_queue, unique_incoming, success_active, success_per_minute, thread_workload, workload_distribution, torrent_share, server_threads, evaluator_threads,
+			evaluator_limit, limit_decisions, handler_stages, peer_queue_fill, visited_queue_fill, backpressure, pressure_dropped):
 		# Get thread-local session
 		session = self.Session()
 
@@ -303,27 +388,81 @@ class Database:
 				visited_queue=visited_queue,
 				unique_incoming=unique_incoming,
 				success_active=success_active,
+				success_per_minute=success_per_minute,
 				thread_workload=thread_workload,
+				workload_distribution=','.join('{}:{:.4f}'.format(*item) for item in workload_distribution.items()),
+				torrent_share=','.join('{}:{:.4f}'.format(*item) for item in sorted(torrent_share.items())),
 				load_average=load,
 				memory_mb=memory,
 				server_threads=server_threads,
-				evaluator_threads=evaluator_threads)
+				evaluator_threads=evaluator_threads,
+				evaluator_limit=evaluator_limit,
+				limit_decisions=','.join('{}:{}'.format(*item) for item in sorted(limit_decisions.items())),
+				handler_stages=','.join('{}:{}:{:.2f}'.format(*stage) for stage in handler_stages),
+				peer_queue_fill=peer_queue_fill,
+				visited_queue_fill=visited_queue_fill,
+				backpressure=','.join('{}:{:.1f}'.format(*item) for item in sorted(backpressure.items())),
+				pressure_dropped=pressure_dropped)
 		try:
 			session.add(new_statistic)
 			session.commit()
 		except Exception as err:
 			session.rollback()
+			record_failed_write('statistic storing', err)
 			raise DatabaseError('{} during statistic storing: {}'.format(type(err).__name__, err))
 		logging.info('Stored peer statistic')
 
+	## Store latency percentiles of evaluation phases
+	#  @param histograms Dict of phase, source and outcome tuples and LogHistogram of the durations since the last call
+	#  @exception DatabaseError
+	def store_latency(self, histograms):
+		# Get thread-local session
+		session = self.Session()
+
+		# Write to database
+		timestamp = int(datetime.datetime.now().timestamp())
+		for (phase, source, outcome), histogram in sorted(histograms.items()):
+			session.add(Latency(timestamp=timestamp,
+					phase=phase,
+					source=source,
+					outcome=outcome,
+					count=histogram.total,
+					p50_sec=histogram.quantile(0.5),
+					p90_sec=histogram.quantile(0.9),
+					p99_sec=histogram.quantile(0.99),
+					p999_sec=histogram.quantile(0.999),
+					max_sec=histogram.quantile(1)))
+		try:
+			session.commit()
+		except Exception as err:
+			session.rollback()
+			record_failed_write('latency storing', err)
+			raise DatabaseError('{} during latency storing: {}'.format(type(err).__name__, err))
+		logging.info('Stored latency of {} phases'.format(len(histograms)))
+
 	## Relase resources
 	def close(self):
 		# Close GeoIP2 database reader
 		self.reader.close()
 		self.geoipdb_closed = True
 		logging.info('GeoIP2 database closed')
+
+		# Commit pending writes of this thread and close all pooled connections, so no journal is left behind
+		try:
+			self.Session().commit()
+		except Exception as err:
+			logging.critical('{} during final commit: {}'.format(type(err).__name__, err))
+		self.Session.remove()
+		self.engine.dispose()
 		logging.info('Results written to {}'.format(self.database_path))
 
+## Record a failed write in the event log, including the statement to apply it later
+#  @param operation Description of the write
+#  @param err Exception
+def record_failed_write(operation, err):
+	eventlog.event('database error', operation=operation, error=type(err).__name__,
+			statement=getattr(err, 'statement', None), parameters=getattr(err, 'params', None))
+
 ## Parse client code from peer id, according to BEP 20
 #  @param Raw peer id
 #  @return String of client code with only ASCII or None
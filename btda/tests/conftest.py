@@ -0,0 +1,6 @@
+# Built-in modules
+import os
+import sys
+
+# The analyzer modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+# Built-in modules
+import operator
+import time
+
+# Project modules
+import checkpoint
+from analyzer import Peer
+from util import *
+
+## Create a queued peer of torrent 1
+def make_peer(ip_address, revisit, scheduled, key=None):
+	peer = Peer()
+	peer.ip_address = ip_address
+	peer.port = 6881
+	peer.torrent = 1
+	peer.revisit = revisit
+	peer.scheduled = scheduled
+	peer.key = key
+	peer.source = Source.tracker
+	return peer
+
+def load_roundtrip(tmp_path, peers):
+	queue = PrioritySetQueue(key=Peer.identity, shard=operator.attrgetter('torrent'), ready=Peer.is_due)
+	for peer in peers:
+		queue.force_put(peer)
+	saved = checkpoint.Checkpoint(str(tmp_path / 'analysis'), Peer)
+	saved.write_snapshot(queue, PeerRegistry())
+	content, incoming, outgoing = checkpoint.Checkpoint(str(tmp_path / 'analysis'), Peer).load()
+	return {peer.ip_address: peer for peer in content[1][1]}
+
+def test_new_peer_with_positive_priority_keeps_priority(tmp_path):
+	loaded = load_roundtrip(tmp_path, [make_peer('10.0.0.1', 0.25, False)])
+	peer = loaded['10.0.0.1']
+	assert not peer.scheduled
+	assert peer.revisit == 0.25
+
+def test_scheduled_peer_keeps_revisit_time(tmp_path):
+	revisit = time.perf_counter() + 100
+	loaded = load_roundtrip(tmp_path, [make_peer('10.0.0.2', revisit, True, 7)])
+	peer = loaded['10.0.0.2']
+	assert peer.scheduled
+	assert peer.key == 7
+	assert abs(peer.revisit - revisit) < 1
+
+def test_past_revisit_time_is_clamped_to_now(tmp_path):
+	before = time.perf_counter()
+	loaded = load_roundtrip(tmp_path, [make_peer('10.0.0.3', before - 50, True, 8)])
+	assert loaded['10.0.0.3'].revisit >= before
@@ -0,0 +1,49 @@
+# Built-in modules
+import json
+import socket
+import threading
+
+# Project modules
+import control
+
+## Stands in for the analyzer, requests with bad fields must be rejected before it is used
+class IdleAnalyzer:
+	paused = set()
+
+def start_server(tmp_path):
+	server = control.ControlServer(str(tmp_path / 'control.sock'), IdleAnalyzer())
+	thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+	thread.daemon = True
+	thread.start()
+	return server
+
+def send(path, requests):
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.settimeout(5)
+		sock.connect(path)
+		file = sock.makefile('rwb')
+		responses = list()
+		for request in requests:
+			file.write(json.dumps(request).encode() + b'\n')
+			file.flush()
+			responses.append(json.loads(file.readline()))
+		return responses
+
+def test_non_string_fields_are_answered_with_errors(tmp_path):
+	server = start_server(tmp_path)
+	try:
+		requests = [
+				{'command': ['get']},
+				{'command': {'set': 1}},
+				{'command': 'get', 'name': ['network_timeout']},
+				{'command': 'set', 'name': {'network_timeout': 1}, 'value': 1},
+				{'command': 'pause', 'source': ['dht']},
+				{'command': 'profile', 'action': ['status']},
+				{'command': 'get', 'name': 'network_timeout'}]
+		responses = send(server.path, requests)
+	finally:
+		server.close()
+	for response in responses[:-1]:
+		assert response['ok'] is False
+		assert 'string' in response['error']
+	assert responses[-1]['ok'] is True
@@ -0,0 +1,50 @@
+# Built-in modules
+import random
+import socket
+
+# Project modules
+import config
+import protocol
+from util import *
+
+## Clock advanced by the fake session instead of real waiting
+class FakeClock:
+	def __init__(self):
+		self.now = 1000.0
+
+	def perf_counter(self):
+		return self.now
+
+## Session delivering a fixed number of messages, then waiting for the current timeout like an idle peer
+class IdleEndingSession(protocol.PeerSession):
+	def __init__(self, clock, gaps, timeout):
+		self.clock = clock
+		self.gaps = list(gaps)
+		self.timeout = timeout
+
+	def receive_message(self):
+		if not self.gaps:
+			self.clock.now += self.timeout
+			raise PeerError('timed out', Reason.timeout) from socket.timeout('timed out')
+		self.clock.now += self.gaps.pop(0)
+		return protocol.Message(4, b'\x00\x00\x00\x01')
+
+def test_idle_timeout_at_session_end_keeps_timeout_stable(monkeypatch):
+	clock = FakeClock()
+	monkeypatch.setattr(protocol.time, 'perf_counter', clock.perf_counter)
+	rng = random.Random(1)
+	adaptive = protocol.AdaptiveTimeout()
+	for i in range(500):
+		timeout = adaptive.timeout()
+		gaps = [rng.expovariate(1 / 0.2) for j in range(4)]
+		IdleEndingSession(clock, gaps, timeout).receive_all_messages(adaptive.observe)
+	assert adaptive.timeout() < config.network_timeout
+	assert adaptive.timeout() < config.network_timeout_max
+
+def test_slow_gaps_raise_timeout(monkeypatch):
+	clock = FakeClock()
+	monkeypatch.setattr(protocol.time, 'perf_counter', clock.perf_counter)
+	adaptive = protocol.AdaptiveTimeout()
+	for i in range(200):
+		IdleEndingSession(clock, [8.0] * 4, adaptive.timeout()).receive_all_messages(adaptive.observe)
+	assert adaptive.timeout() >= 8.0 * config.timeout_margin - 1e-6
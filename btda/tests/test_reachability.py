@@ -0,0 +1,28 @@
+# Project modules
+import reachability
+from analyzer import Peer
+from util import *
+
+## Create a peer as queued before its first contact, without peer id
+def make_peer(ip_address, port):
+	peer = Peer()
+	peer.ip_address = ip_address
+	peer.port = port
+	peer.source = Source.dht
+	return peer
+
+def test_learned_network_changes_prediction_of_new_peer(tmp_path):
+	model = reachability.ReachabilityModel(str(tmp_path / 'reachability.json'))
+	for i in range(50):
+		model.observe(make_peer('10.1.2.{}'.format(i), 51413), True)
+		model.observe(make_peer('10.9.9.{}'.format(i), 51413), False)
+	reachable = model.predict(make_peer('10.1.2.200', 51413))
+	unreachable = model.predict(make_peer('10.9.9.200', 51413))
+	assert reachable > 0.8
+	assert unreachable < 0.2
+
+def test_features_are_independent_of_visit_results(tmp_path):
+	new_peer = make_peer('10.1.2.3', 6881)
+	visited_peer = make_peer('10.1.2.3', 6881)
+	visited_peer.id = b'-qB4250-abcdefghijkl'
+	assert reachability.ReachabilityModel.features(new_peer) == reachability.ReachabilityModel.features(visited_peer)
@@ -0,0 +1,65 @@
+# Built-in modules
+import threading
+
+# Project modules
+from util import *
+
+## Item with a due flag, ordered by priority
+class Item:
+	def __init__(self, key, shard, priority, due):
+		self.key = key
+		self.shard = shard
+		self.priority = priority
+		self.due = due
+
+	def __lt__(self, other):
+		return self.priority < other.priority
+
+def make_queue():
+	return PrioritySetQueue(key=lambda item: item.key, shard=lambda item: item.shard, ready=lambda item: item.due)
+
+def test_get_leaves_waiting_heads_uncharged():
+	queue = make_queue()
+	queue.put(Item(1, 'a', 0, False))
+	shard = queue.shards['a']
+	try:
+		queue.get()
+	except PrioritySetQueueEmpty:
+		pass
+	else:
+		raise AssertionError('Got an item which is not ready')
+	assert len(queue) == 1
+	assert (shard.finish, shard.active, shard.served) == (0, 0, 0)
+	assert queue.read_shares() == {'a': 0}
+
+def test_get_serves_ready_shards_only():
+	queue = make_queue()
+	queue.put(Item(1, 'a', 0, False))
+	queue.put(Item(2, 'b', 0, True))
+	assert queue.get().key == 2
+	queue.task_done(Item(2, 'b', 0, True))
+	assert queue.read_shares() == {'a': 0, 'b': 1}
+	assert queue.shards['a'].finish == 0
+
+## Activity state whose thread finishes while the reader looks at it
+class FinishingActivity:
+	def __init__(self, timer, thread):
+		self.timer = timer
+		self.thread = thread
+		self.unregistering = None
+
+	@property
+	def state(self):
+		self.unregistering = threading.Thread(target=self.timer.unregister, args=(self.thread,))
+		self.unregistering.start()
+		self.unregistering.join(0.2)
+		return (False, 1.0, None)
+
+def test_activity_timer_forgets_threads_unregistered_during_read():
+	timer = ActivityTimer()
+	timer.register('worker')
+	activity = timer.timer['worker'] = FinishingActivity(timer, 'worker')
+	timer.read()
+	activity.unregistering.join()
+	assert 'worker' not in timer.last
+	assert 'worker' not in timer.timer
@@ -4,6 +4,7 @@ import logging
 import urllib.parse
 import tempfile
 import time
+import os
 
 # Project modules
 import config
@@ -118,6 +119,59 @@ class InfoDict:
 		except KeyError as err:
 			logging.warning('File did not contain a name tag: {}'.format(err))
 
+## Content-addressed file store of verified bencoded info dicts
+class MetadataCache:
+	## Create the cache directory if necessary
+	#  @param path Directory path, with trailing slash
+	#  @exception FileError
+	def __init__(self, path):
+		self.path = path
+		try:
+			os.makedirs(path, exist_ok=True)
+		except OSError as err:
+			raise FileError('Could not create metadata cache: {}'.format(err))
+
+	## Get the file name for an info hash
+	#  @param info_hash The info hash
+	#  @return File path
+	def _filename(self, info_hash):
+		return os.path.join(self.path, '{}.info'.format(bytes_to_hex(info_hash)))
+
+	## Read a cached info dict
+	#  @param info_hash The info hash
+	#  @return Bencoded info dict or None if not cached or corrupted
+	def get(self, info_hash):
+		filename = self._filename(info_hash)
+		try:
+			with open(filename, mode='rb') as file:
+				info_dict = file.read()
+		except FileNotFoundError:
+			return None
+		except OSError as err:
+			logging.warning('Could not read cached metadata: {}'.format(err))
+			return None
+		if hashlib.sha1(info_dict).digest() != info_hash:
+			logging.warning('Discarding corrupted cached metadata {}'.format(filename))
+			return None
+		logging.info('Read metadata from cache {}'.format(filename))
+		return info_dict
+
+	## Store a verified info dict atomically
+	#  @param info_hash The info hash
+	#  @param info_dict Bencoded info dict
+	def put(self, info_hash, info_dict):
+		if hashlib.sha1(info_dict).digest() != info_hash:
+			logging.error('Refusing to cache metadata not matching the info hash')
+			return
+		try:
+			with tempfile.NamedTemporaryFile(dir=self.path, suffix='.tmp', delete=False) as file:
+				file.write(info_dict)
+			os.replace(file.name, self._filename(info_hash))
+		except OSError as err:
+			logging.warning('Could not write metadata cache: {}'.format(err))
+		else:
+			logging.info('Stored metadata in cache')
+
 ## Extract the info hash according to BEP 9
 #  @return Info hash as hex string
 #  @exception FileError
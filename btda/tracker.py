@@ -2,7 +2,6 @@
 import logging
 import random
 import http.client
-import ipaddress
 import struct
 import urllib.request
 import urllib.parse
@@ -21,9 +20,11 @@ class TrackerCommunicator:
 	#  @param peer_id Own peer id
 	#  @param announce_url The announce URL representing the tracker
 	#  @param total_pieces Number of total pieces of the torrent
-	def __init__(self, peer_id, announce_url, total_pieces):
+	#  @param group Optional ConnectionGroup allowing to abort UDP requests
+	def __init__(self, peer_id, announce_url, total_pieces, group=None):
 		self.peer_id = peer_id
 		self.announce_url = announce_url
+		self.group = group
 		self.first_announce = True
 		logging.info('Port {} will be announced'.format(config.bittorrent_listen_port))
 
@@ -42,12 +43,15 @@ class TrackerCommunicator:
 		if parsed.scheme in ["http", "https"]:
 			interval, ip_bytes = self._http_request(info_hash)
 		elif parsed.scheme == "udp":
+			sock = self._open_udp_socket()
 			try:
-				interval, ip_bytes = self._udp_request(info_hash)
+				interval, ip_bytes = self._udp_request(info_hash, sock)
 			except (OSError, TrackerError) as err:
-				raise TrackerError('UDP tracker request failed: {}'.format(err))
+				raise TrackerError('UDP tracker request failed: {}'.format(err)) from err
+			finally:
+				self._close_udp_socket(sock)
 		else:
-			raise TrackerError('Unsupported protocol: {}'.format(parsed.scheme))
+			raise TrackerError('Unsupported protocol: {}'.format(parsed.scheme), Reason.unsupported_protocol)
 		self.first_announce = False
 		ips = parse_ips(ip_bytes)
 		return interval, ips
@@ -74,19 +78,19 @@ class TrackerCommunicator:
 					logging.info('HTTP response status code is OK')
 					response_bencoded = http_response.read()
 				else:
-					raise TrackerError('HTTP response status code is {}'.format(http_response.status))
+					raise TrackerError('HTTP response status code is {}'.format(http_response.status), Reason.http_status)
 		except (urllib.error.URLError, http.client.HTTPException, OSError) as err:
-			raise TrackerError('Get request failed: ' + str(err))
+			raise TrackerError('Get request failed: ' + str(err)) from err
 
 		# Decode response
 		try:
 			response = bencodepy.decode(response_bencoded)
 		except bencodepy.exceptions.DecodingError as err:
-			raise TrackerError('Unable to decode response: {}'.format(err))
+			raise TrackerError('Unable to decode response: {}'.format(err), Reason.bad_response) from err
 		logging.debug('Tracker response: {}'.format(response))
 		if b'failure reason' in response:
 			failure_reason = response[b'failure reason']
-			raise TrackerError('Tracker responded with failure reason: {}'.format(failure_reason))
+			raise TrackerError('Tracker responded with failure reason: {}'.format(failure_reason), Reason.tracker_failure)
 
 		# Extract request interval
 		try:
@@ -100,18 +104,17 @@ class TrackerCommunicator:
 		try:
 			ip_bytes = response[b'peers']
 		except KeyError as err:
-			raise TrackerError('Tracker did not send any peers: {}'.format(err))
+			raise TrackerError('Tracker did not send any peers: {}'.format(err), Reason.no_peers)
 		return interval, ip_bytes
 
 	## Issue announce request according to http://www.bittorrent.org/beps/bep_0015.html
 	#  and https://github.com/erindru/m2t/blob/75b457e65d71b0c42afdc924750448c4aaeefa0b/m2t/scraper.py
 	#  @param info_hash Info hash for the desired torrent
+	#  @param sock UDP socket
 	#  @exception OSError, TrackerError
 	#  @return Request interval, ip-port bytes block
-	def _udp_request(self, info_hash):
+	def _udp_request(self, info_hash, sock):
 		# Establish connection
-		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-		sock.settimeout(config.network_timeout)
 		parsed_tracker = urllib.parse.urlparse(self.announce_url)
 		port = parsed_tracker.port if parsed_tracker.port else 80
 		conn = (socket.gethostbyname(parsed_tracker.hostname), port)
@@ -124,22 +127,22 @@ class TrackerCommunicator:
 		try:
 			sock.sendto(req, conn)
 		except TypeError as err:
-			raise TrackerError('Bad announce url: {}'.format(err))
+			raise TrackerError('Bad announce url: {}'.format(err), Reason.bad_url) from err
 
 		# Parse connection id from connect response
 		buf = sock.recvfrom(2048)[0]
 		if len(buf) < 16:
-			raise TrackerError('Wrong length connect response: {}'.format(len(buf)))
+			raise TrackerError('Wrong length connect response: {}'.format(len(buf)), Reason.bad_response)
 		action = struct.unpack_from('!i', buf)[0]
 		res_transaction_id = struct.unpack_from('!i', buf, 4)[0]
 		if res_transaction_id != transaction_id:
 			raise TrackerError('Transaction ID doesn\'t match in connection response! Expected {} but got {}'.format(
-					transaction_id, res_transaction_id))
+					transaction_id, res_transaction_id), Reason.transaction_mismatch)
 		if action == 0x0:
 			connection_id = struct.unpack_from('!q', buf, 8)[0]
 		elif action == 0x3:
 			error = struct.unpack_from('!s', buf, 8)
-			raise TrackerError('Error while trying to get a connection response: {}'.format(error))
+			raise TrackerError('Error while trying to get a connection response: {}'.format(error), Reason.tracker_failure)
 		else:
 			logging.warning('Bad UDP tracker connect response')
 
@@ -155,19 +158,19 @@ class TrackerCommunicator:
 		# Parse announce response
 		buf = sock.recvfrom(2048)[0]
 		if len(buf) < 20:
-			raise TrackerError('Wrong length announce response: {}'.format(len(buf)))
+			raise TrackerError('Wrong length announce response: {}'.format(len(buf)), Reason.bad_response)
 		elif len(buf) == 2048:
 			logging.warning('Receive buffer may be too small')
 		action = struct.unpack_from('!i', buf)[0]
 		res_transaction_id = struct.unpack_from('!i', buf, 4)[0]
 		if res_transaction_id != transaction_id:
 			raise TrackerError('Transaction ID doesn\'t match in connection response! Expected {}, got {}'.format(
-					transaction_id, res_transaction_id))
+					transaction_id, res_transaction_id), Reason.transaction_mismatch)
 		if action == 0x3:
 			error = struct.unpack_from('!s', buf, 8)
-			raise TrackerError('Error while trying to get a connection response: {}'.format(error))
+			raise TrackerError('Error while trying to get a connection response: {}'.format(error), Reason.tracker_failure)
 		elif action != 0x1:
-			raise TrackerError('Wrong action received after announce request: {}'.format(action))
+			raise TrackerError('Wrong action received after announce request: {}'.format(action), Reason.bad_response)
 
 		# Extract desired information
 		interval = struct.unpack_from('!i', buf, 8)[0]
@@ -182,19 +185,22 @@ class TrackerCommunicator:
 		# Assemble scrape URL
 		scrape_url = self.announce_url.replace('announce', 'scrape')
 		if 'scrape' not in scrape_url:
-			raise TrackerError('Unable to assemble scrape URL')
+			raise TrackerError('Unable to assemble scrape URL', Reason.bad_url)
 		parsed = urllib.parse.urlparse(scrape_url)
 
 		# Split on scheme
 		if parsed.scheme in ["http", "https"]:
 			return self._http_scrape(scrape_url, info_hash)
 		elif parsed.scheme == "udp":
+			sock = self._open_udp_socket()
 			try:
-				return self._udp_scrape(scrape_url, info_hash)
+				return self._udp_scrape(scrape_url, info_hash, sock)
 			except (OSError, TrackerError) as err:
-				raise TrackerError('UDP tracker request failed: {}'.format(err))
+				raise TrackerError('UDP tracker request failed: {}'.format(err)) from err
+			finally:
+				self._close_udp_socket(sock)
 		else:
-			raise TrackerError('Unsupported protocol: {}'.format(parsed.scheme))
+			raise TrackerError('Unsupported protocol: {}'.format(parsed.scheme), Reason.unsupported_protocol)
 
 	## Issue a HTTP GET request on the scrape URL
 	#  @param info_hash Info hash for the desired torrent
@@ -214,49 +220,48 @@ class TrackerCommunicator:
 					logging.info('HTTP response status code is OK')
 					response_bencoded = http_response.read()
 				else:
-					raise TrackerError('HTTP response status code is {}'.format(http_response.status))
+					raise TrackerError('HTTP response status code is {}'.format(http_response.status), Reason.http_status)
 		except (urllib.error.URLError, http.client.HTTPException, OSError) as err:
-			raise TrackerError('Get request failed: ' + str(err))
+			raise TrackerError('Get request failed: ' + str(err)) from err
 
 		# Decode response
 		try:
 			response = bencodepy.decode(response_bencoded)
 		except bencodepy.exceptions.DecodingError as err:
-			raise TrackerError('Unable to decode response: {}'.format(err))
+			raise TrackerError('Unable to decode response: {}'.format(err), Reason.bad_response) from err
 		logging.debug('Tracker response: {}'.format(response))
 		if b'failure reason' in response:
 			failure_reason = response[b'failure reason']
-			raise TrackerError('Tracker responded with failure reason: {}'.format(failure_reason))
+			raise TrackerError('Tracker responded with failure reason: {}'.format(failure_reason), Reason.tracker_failure)
 
 		# Extract file item
 		try:
 			item = response[b'files'][info_hash]
 		except KeyError as err:
-			raise TrackerError('Info hash not found')
+			raise TrackerError('Info hash not found', Reason.not_scraped)
 
 		# Extract attributes
 		try:
 			seeders = item[b'complete']
 		except KeyError as err:
-			raise TrackerError('Complete value not found')
+			raise TrackerError('Complete value not found', Reason.bad_response)
 		try:
 			completed = item[b'downloaded']
 		except KeyError as err:
-			raise TrackerError('Downloaded value not found')
+			raise TrackerError('Downloaded value not found', Reason.bad_response)
 		try:
 			leechers = item[b'incomplete']
 		except KeyError as err:
-			raise TrackerError('Incomplete value not found')
+			raise TrackerError('Incomplete value not found', Reason.bad_response)
 		return seeders, completed, leechers
 
 	## Issue scrape request
 	#  @param info_hash Info hash for the desired torrent
 	#  @return Request interval, ip-port bytes block
+	#  @param sock UDP socket
 	#  @exception OSError, TrackerError
-	def _udp_scrape(self, scrape_url, info_hash):
+	def _udp_scrape(self, scrape_url, info_hash, sock):
 		# Establish connection
-		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-		sock.settimeout(config.network_timeout)
 		parsed_tracker = urllib.parse.urlparse(scrape_url)
 		port = parsed_tracker.port if parsed_tracker.port else 80
 		conn = (socket.gethostbyname(parsed_tracker.hostname), port)
@@ -269,22 +274,22 @@ class TrackerCommunicator:
 		try:
 			sock.sendto(req, conn)
 		except TypeError as err:
-			raise TrackerError('Bad scrape url: {}'.format(err))
+			raise TrackerError('Bad scrape url: {}'.format(err), Reason.bad_url) from err
 
 		# Parse connection id from connect response
 		buf = sock.recvfrom(2048)[0]
 		if len(buf) < 16:
-			raise TrackerError('Wrong length connect response: {}'.format(len(buf)))
+			raise TrackerError('Wrong length connect response: {}'.format(len(buf)), Reason.bad_response)
 		action = struct.unpack_from('!i', buf)[0]
 		res_transaction_id = struct.unpack_from('!i', buf, 4)[0]
 		if res_transaction_id != transaction_id:
 			raise TrackerError('Transaction ID doesn\'t match in connection response! Expected {} but got {}'.format(
-					transaction_id, res_transaction_id))
+					transaction_id, res_transaction_id), Reason.transaction_mismatch)
 		if action == 0x0:
 			connection_id = struct.unpack_from('!q', buf, 8)[0]
 		elif action == 0x3:
 			error = struct.unpack_from('!s', buf, 8)
-			raise TrackerError('Error while trying to get a connection response: {}'.format(error))
+			raise TrackerError('Error while trying to get a connection response: {}'.format(error), Reason.tracker_failure)
 		else:
 			logging.warning('Bad UDP tracker connect response')
 
@@ -297,16 +302,17 @@ class TrackerCommunicator:
 		# Parse scrape response
 		buf = sock.recvfrom(2048)[0]
 		if len(buf) < 8:
-			raise TrackerError('Wrong length scrape response: {}'.format(len(buf)))
+			raise TrackerError('Wrong length scrape response: {}'.format(len(buf)), Reason.bad_response)
 		action = struct.unpack_from('!i', buf)[0]
 		res_transaction_id = struct.unpack_from('!i', buf, 4)[0]
 		if res_transaction_id != transaction_id:
 			raise TrackerError('Transaction ID doesn\'t match in connection response! Expected {}, got {}'.format(
-					transaction_id, res_transaction_id))
+					transaction_id, res_transaction_id), Reason.transaction_mismatch)
 		if action == 0x3:
-			raise TrackerError('Error while trying to get a connection response: {}'.format(error))
+			error = struct.unpack_from('!s', buf, 8)
+			raise TrackerError('Error while trying to get a connection response: {}'.format(error), Reason.tracker_failure)
 		elif action != 0x2:
-			raise TrackerError('Wrong action received after announce request: {}'.format(action))
+			raise TrackerError('Wrong action received after announce request: {}'.format(action), Reason.bad_response)
 
 		# Extract desired information
 		seeders = struct.unpack_from('!i', buf, 8)[0]
@@ -314,24 +320,30 @@ class TrackerCommunicator:
 		leechers = struct.unpack_from('!i', buf, 16)[0]
 		return seeders, completed, leechers
 
+	## Create a UDP socket, which is aborted when the connection group is cancelled
+	#  @return Socket
+	#  @exception TrackerError
+	def _open_udp_socket(self):
+		try:
+			sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			sock.settimeout(config.network_timeout)
+		except OSError as err:
+			raise TrackerError('Could not create UDP socket: {}'.format(err)) from err
+		if self.group is not None:
+			try:
+				self.group.add(sock)
+			except UtilError as err:
+				raise TrackerError(str(err)) from err
+		return sock
+
+	## Release a socket created with _open_udp_socket
+	#  @param sock Socket
+	def _close_udp_socket(self, sock):
+		if self.group is not None:
+			self.group.discard(sock)
+		sock.close()
+
 ## Generate a transaction id for udp tracker protocol
 #  @return Transaction id
 def udp_transaction_id():
 	return int(random.randrange(0, 255))
-
-## Parses bytes to ip addresses and ports
-#  @param ip_bytes Input block
-#  @return list of ip port tuples
-def parse_ips(ip_bytes):
-	peers_count = int(len(ip_bytes) / 6)
-	ips = list()
-	for peer in range(0, peers_count):
-		offset = peer * 6
-		try:
-			peer_ip = str(ipaddress.ip_address(ip_bytes[offset:offset+4]))
-		except ValueError as err:
-			logging.warning('Tracker sent invalid ip address: {}'.format(err))
-			continue
-		peer_port = struct.unpack("!H", ip_bytes[offset+4:offset+6])[0]
-		ips.append((peer_ip, peer_port))
-	return ips
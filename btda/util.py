@@ -8,6 +8,13 @@ import binascii
 import struct
 import time
 import heapq
+import array
+import queue
+import traceback
+import ipaddress
+import errno
+import http.client
+import urllib.error
 import matplotlib
 matplotlib.use('Agg') # $DISPLAY not defined
 import matplotlib.pyplot
@@ -37,13 +44,23 @@ class DHTError(AnalyzerError):
 	pass
 
 class TrackerError(AnalyzerError):
-	pass
+	## Create an error with an optional taxonomy code
+	#  @param message Description
+	#  @param reason Reason or None to classify the cause
+	def __init__(self, message, reason=None):
+		super().__init__(message)
+		self.reason = reason
 
 class DatabaseError(AnalyzerError):
 	pass
 
 class PeerError(AnalyzerError):
-	pass
+	## Create an error with an optional taxonomy code
+	#  @param message Description
+	#  @param reason Reason or None to classify the cause
+	def __init__(self, message, reason=None):
+		super().__init__(message)
+		self.reason = reason
 
 class UtilError(AnalyzerError):
 	pass
@@ -52,6 +69,114 @@ class Source(enum.Enum):
 	tracker = 0
 	incoming = 1
 	dht = 2
+	pex = 3
+
+## Fixed taxonomy of failed peer contacts, admissions and tracker requests, values index count arrays
+class Reason(enum.IntEnum):
+	none = 0
+	# Network errors
+	timeout = 1
+	connection_refused = 2
+	connection_reset = 3
+	connection_aborted = 4
+	broken_pipe = 5
+	no_route = 6
+	network_unreachable = 7
+	address_unavailable = 8
+	too_many_files = 9
+	name_resolution = 10
+	other_network = 11
+	# Peer protocol errors
+	connection_closed = 12
+	unknown_protocol = 13
+	info_hash_mismatch = 14
+	unknown_info_hash = 15
+	already_outgoing = 16
+	timeout_setup = 17
+	other_protocol = 18
+	# Admission of discovered endpoints
+	bad_port = 19
+	malformed_address = 20
+	own_address = 21
+	unspecified = 22
+	private = 23
+	shared = 24
+	loopback = 25
+	link_local = 26
+	reserved = 27
+	documentation = 28
+	benchmark = 29
+	multicast = 30
+	broadcast = 31
+	blocklist = 32
+	# Tracker errors
+	http_status = 33
+	bad_response = 34
+	tracker_failure = 35
+	no_peers = 36
+	transaction_mismatch = 37
+	bad_url = 38
+	unsupported_protocol = 39
+	not_scraped = 40
+	other = 41
+
+# Reasons as written to the error CSV files
+REASON_LABELS = {
+	Reason.none: '',
+	Reason.timeout: 'Timed out',
+	Reason.connection_refused: 'Connection refused',
+	Reason.connection_reset: 'Connection reset by peer',
+	Reason.connection_aborted: 'Connection aborted',
+	Reason.broken_pipe: 'Broken pipe',
+	Reason.no_route: 'No route to host',
+	Reason.network_unreachable: 'Network is unreachable',
+	Reason.address_unavailable: 'Cannot assign requested address',
+	Reason.too_many_files: 'Too many open files',
+	Reason.name_resolution: 'Name resolution failed',
+	Reason.other_network: 'Other network error',
+	Reason.connection_closed: 'Socket connection broken',
+	Reason.unknown_protocol: 'Peer speaks unknown protocol',
+	Reason.info_hash_mismatch: 'Mismatch on received info hash',
+	Reason.unknown_info_hash: 'Unknown info hash',
+	Reason.already_outgoing: 'Already in outgoing',
+	Reason.timeout_setup: 'Failed to set timeout',
+	Reason.other_protocol: 'Other protocol error',
+	Reason.bad_port: 'port',
+	Reason.malformed_address: 'malformed',
+	Reason.own_address: 'own address',
+	Reason.unspecified: 'unspecified',
+	Reason.private: 'private',
+	Reason.shared: 'shared',
+	Reason.loopback: 'loopback',
+	Reason.link_local: 'link-local',
+	Reason.reserved: 'reserved',
+	Reason.documentation: 'documentation',
+	Reason.benchmark: 'benchmark',
+	Reason.multicast: 'multicast',
+	Reason.broadcast: 'broadcast',
+	Reason.blocklist: 'blocklist',
+	Reason.http_status: 'HTTP error status',
+	Reason.bad_response: 'Malformed response',
+	Reason.tracker_failure: 'Tracker responded with failure reason',
+	Reason.no_peers: 'Tracker did not send any peers',
+	Reason.transaction_mismatch: 'Transaction ID mismatch',
+	Reason.bad_url: 'Bad tracker URL',
+	Reason.unsupported_protocol: 'Unsupported protocol',
+	Reason.not_scraped: 'Info hash not found',
+	Reason.other: 'Other error'}
+
+# Reasons of operating system error numbers
+ERRNO_REASONS = {
+	errno.ETIMEDOUT: Reason.timeout,
+	errno.ECONNREFUSED: Reason.connection_refused,
+	errno.ECONNRESET: Reason.connection_reset,
+	errno.ECONNABORTED: Reason.connection_aborted,
+	errno.EPIPE: Reason.broken_pipe,
+	errno.EHOSTUNREACH: Reason.no_route,
+	errno.ENETUNREACH: Reason.network_unreachable,
+	errno.EADDRNOTAVAIL: Reason.address_unavailable,
+	errno.EMFILE: Reason.too_many_files,
+	errno.ENFILE: Reason.too_many_files}
 
 ## Simple thread-safe counter
 class SharedCounter:
@@ -60,11 +185,13 @@ class SharedCounter:
 		self.value = 0
 		self.lock = threading.Lock()
 		self.zero = threading.Event()
+		self.zero.set()
 
-	## Increase value by one
-	def increment(self):
+	## Increase value
+	#  @param amount Increase, one by default
+	def increment(self, amount=1):
 		with self.lock:
-			self.value += 1
+			self.value += amount
 			self.zero.clear()
 
 	## Reduce value by one
@@ -86,25 +213,454 @@ class SharedCounter:
 	def reset(self):
 		with self.lock:
 			self.value = 0
+			self.zero.set()
+
+	## Read value and reset it to zero at once
+	#  @return The value before resetting
+	def take(self):
+		with self.lock:
+			value = self.value
+			self.value = 0
+			self.zero.set()
+			return value
 
 	## Blocks until counter reaches zero
-	def wait(self):
-		self.zero.wait()
+	#  @param timeout Maximum seconds to wait, None to wait forever
+	#  @return False on timeout
+	def wait(self, timeout=None):
+		return self.zero.wait(timeout)
+
+## Limit of concurrently running threads, adjustable at runtime
+class ConcurrencyLimit:
+	## Create a limit
+	#  @param limit Initial number of permits
+	def __init__(self, limit):
+		self.limit = limit
+		self.active = 0
+		self.closed = False
+		self.condition = threading.Condition()
+
+	## Block until a permit is available
+	#  @return False if the limit was closed meanwhile
+	def acquire(self):
+		with self.condition:
+			while not self.closed and self.active >= self.limit:
+				self.condition.wait()
+			if self.closed:
+				return False
+			self.active += 1
+			return True
+
+	## Return a permit
+	def release(self):
+		with self.condition:
+			self.active -= 1
+			self.condition.notify()
+
+	## Change the number of permits, running threads above a lowered limit finish their work
+	#  @param limit New number of permits
+	def set_limit(self, limit):
+		with self.condition:
+			self.limit = limit
+			self.condition.notify_all()
+
+	## Wake up all waiting threads and reject further permits
+	def close(self):
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+
+## Count and mean of values collected between two reads
+class WindowStatistic:
+	def __init__(self):
+		self.count = 0
+		self.sum = 0
+		self.lock = threading.Lock()
+
+	## Add a value
+	#  @param value Number
+	def add(self, value):
+		with self.lock:
+			self.count += 1
+			self.sum += value
+
+	## Read and reset
+	#  @return Tuple of count and mean, mean is None without values
+	def take(self):
+		with self.lock:
+			count, total = self.count, self.sum
+			self.count = self.sum = 0
+		return count, total / count if count else None
+
+## Streaming estimate of a quantile with constant memory, P-square algorithm by Jain and Chlamtac
+class P2Quantile:
+	## Create an estimator
+	#  @param quantile Desired quantile between 0 and 1
+	def __init__(self, quantile):
+		self.p = quantile
+		self.initial = list()
+		self.heights = None
+		self.positions = None
+		self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+		self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+	## Add an observation
+	#  @param value Number
+	def add(self, value):
+		# Collect the first five observations as initial markers
+		if self.heights is None:
+			self.initial.append(value)
+			if len(self.initial) == 5:
+				self.heights = sorted(self.initial)
+				self.positions = [1, 2, 3, 4, 5]
+			return
+		q, n = self.heights, self.positions
+
+		# Find cell of the observation and adjust extreme markers
+		if value < q[0]:
+			q[0] = value
+			cell = 0
+		elif value >= q[4]:
+			q[4] = value
+			cell = 3
+		else:
+			cell = 0
+			while value >= q[cell + 1]:
+				cell += 1
+		for i in range(cell + 1, 5):
+			n[i] += 1
+		for i in range(5):
+			self.desired[i] += self.increments[i]
+
+		# Move middle markers towards their desired positions
+		for i in range(1, 4):
+			delta = self.desired[i] - n[i]
+			if (delta >= 1 and n[i + 1] - n[i] > 1) or (delta <= -1 and n[i - 1] - n[i] < -1):
+				d = 1 if delta > 0 else -1
+				height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+						(n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+						(n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+				if not q[i - 1] < height < q[i + 1]:
+					height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+				q[i] = height
+				n[i] += d
+
+	## Current estimate
+	#  @return Estimated quantile or None without observations
+	def value(self):
+		if self.heights is not None:
+			return self.heights[2]
+		if not self.initial:
+			return None
+		ordered = sorted(self.initial)
+		return ordered[min(int(len(ordered) * self.p), len(ordered) - 1)]
+
+## Histogram of durations with logarithmic buckets of constant relative precision, similar to HdrHistogram
+#  @note Values are kept in microseconds, 64 sub-buckets per power of two give a relative error below 1.6%
+#  @note Only used buckets are stored, durations of one phase typically fill a few dozen of them
+class LogHistogram:
+	__slots__ = ('counts', 'total')
+	SUB_BUCKETS = 64
+	SIZE = 2 * 64 + 30 * 64
+
+	def __init__(self):
+		self.counts = dict()
+		self.total = 0
+
+	## Add a duration
+	#  @param seconds Duration in seconds
+	def record(self, seconds):
+		index = min(LogHistogram.index(int(seconds * 1000000)), LogHistogram.SIZE - 1)
+		counts = self.counts
+		try:
+			counts[index] += 1
+		except KeyError:
+			counts[index] = 1
+		self.total += 1
+
+	## Add all counts of another histogram
+	#  @param other LogHistogram
+	def merge(self, other):
+		counts = self.counts
+		for index, count in list(other.counts.items()):
+			try:
+				counts[index] += count
+			except KeyError:
+				counts[index] = count
+		self.total += other.total
+
+	## Counts of this histogram minus those of an earlier copy
+	#  @param earlier LogHistogram or None
+	#  @return New LogHistogram
+	def difference(self, earlier):
+		result = LogHistogram()
+		if earlier is None:
+			result.merge(self)
+		else:
+			for index, count in self.counts.items():
+				count -= earlier.counts.get(index, 0)
+				if count > 0:
+					result.counts[index] = count
+			result.total = sum(result.counts.values())
+		return result
+
+	## Estimate a quantile
+	#  @param q Quantile between 0 and 1
+	#  @return Upper bound of the bucket in seconds, None if empty
+	def quantile(self, q):
+		total = sum(self.counts.values())
+		if not total:
+			return None
+		rank = max(1, math.ceil(q * total))
+		seen = 0
+		for index in sorted(self.counts):
+			seen += self.counts[index]
+			if seen >= rank:
+				return LogHistogram.upper_bound(index) / 1000000
+		return LogHistogram.upper_bound(max(self.counts)) / 1000000
+
+	## Bucket of a value
+	#  @param value Non-negative integer
+	#  @return Bucket index
+	@staticmethod
+	def index(value):
+		sub = LogHistogram.SUB_BUCKETS
+		if value < 2 * sub:
+			return value
+		shift = value.bit_length() - 7
+		return 2 * sub + (shift - 1) * sub + (value >> shift) - sub
+
+	## Largest value of a bucket
+	#  @param index Bucket index
+	#  @return Integer
+	@staticmethod
+	def upper_bound(index):
+		sub = LogHistogram.SUB_BUCKETS
+		if index < 2 * sub:
+			return index
+		shift = (index - 2 * sub) // sub + 1
+		return (((index - 2 * sub) % sub + sub + 1) << shift) - 1
+
+## LogHistograms per key, written without locking by each thread into its own set and merged when read
+#  @note Sets of finished threads, e.g. of short-lived server threads, are folded into one when read
+class ThreadHistograms:
+	def __init__(self):
+		self.local = threading.local()
+		self.threads = list()
+		self.retired = dict()
+		self.lock = threading.Lock()
+		self.last = dict()
+
+	## Add a duration
+	#  @param key Hashable key, e.g. a tuple of labels
+	#  @param seconds Duration in seconds
+	def record(self, key, seconds):
+		try:
+			histograms = self.local.histograms
+		except AttributeError:
+			histograms = self.local.histograms = dict()
+			with self.lock:
+				self.threads.append((threading.current_thread(), histograms))
+		try:
+			histogram = histograms[key]
+		except KeyError:
+			histogram = histograms[key] = LogHistogram()
+		histogram.record(seconds)
+
+	## Merge all threads
+	#  @return Dict of key and LogHistogram with all durations since start
+	def merged(self):
+		with self.lock:
+			for thread, histograms in self.threads:
+				if not thread.is_alive():
+					merge_histograms(self.retired, histograms)
+			self.threads = [item for item in self.threads if item[0].is_alive()]
+			threads = list(self.threads)
+		result = dict()
+		merge_histograms(result, self.retired)
+		for thread, histograms in threads:
+			merge_histograms(result, histograms)
+		return result
+
+	## Merge all threads and subtract the state of the last call
+	#  @note Must not be called concurrently
+	#  @return Dict of key and LogHistogram with durations since the last call
+	def take(self):
+		current = self.merged()
+		result = {key: histogram.difference(self.last.get(key)) for key, histogram in current.items()}
+		self.last = current
+		return {key: histogram for key, histogram in result.items() if histogram.total}
+
+## Accumulated time spent in named states, e.g. backpressure, which are switched on and off from any thread
+class StateTimer:
+	## Create a timer with all states off
+	def __init__(self):
+		self.since = dict()
+		self.accumulated = collections.Counter()
+		self.lock = threading.Lock()
+
+	## Switch a state on or off, repeated calls with the same value are cheap
+	#  @param state Name of the state
+	#  @param active True to switch on, False to switch off
+	def set(self, state, active):
+		if (state in self.since) == active:
+			return
+		with self.lock:
+			now = time.perf_counter()
+			if active and state not in self.since:
+				self.since[state] = now
+			elif not active and state in self.since:
+				self.accumulated[state] += now - self.since.pop(state)
+
+	## Read seconds spent in each state since the last call, including ongoing states
+	#  @return Dict of state name and seconds
+	def take(self):
+		with self.lock:
+			now = time.perf_counter()
+			for state in self.since:
+				self.accumulated[state] += now - self.since[state]
+				self.since[state] = now
+			result = dict(self.accumulated)
+			self.accumulated.clear()
+			return result
+
+## Processing stage with a bounded input queue and a pool of worker threads
+class PipelineStage:
+	## Create a stage, call start to run it
+	#  @param name Name for statistics and thread names
+	#  @param function Callable processing a list of items and returning a list of items for the next stage
+	#  @param threads Number of worker threads
+	#  @param maxsize Bound of the input queue, producers block when it is full, 0 for no bound
+	#  @param batch Maximum number of queued items processed at once
+	#  @param output Next PipelineStage or None
+	#  @param input_queue Existing queue.Queue to consume instead of creating one
+	def __init__(self, name, function, threads=1, maxsize=0, batch=1, output=None, input_queue=None):
+		self.name = name
+		self.function = function
+		self.threads = threads
+		self.batch = batch
+		self.output = output
+		self.queue = queue.Queue(maxsize) if input_queue is None else input_queue
+		self.processed = SharedCounter()
+		self.read_timestamp = time.perf_counter()
+
+	## Start worker threads
+	def start(self):
+		for i in range(self.threads):
+			thread = threading.Thread(target=self._worker, name='{}-{}'.format(self.name, i))
+			thread.daemon = True
+			thread.start()
+
+	## Queue an item, blocks while the stage is full
+	#  @param item The item
+	def put(self, item):
+		self.queue.put(item)
+
+	## Process batches of items and pass results on
+	#  @note This is a worker method to be started as a thread
+	def _worker(self):
+		while True:
+			# Collect a batch without waiting for more items
+			items = [self.queue.get()]
+			while len(items) < self.batch:
+				try:
+					items.append(self.queue.get_nowait())
+				except queue.Empty:
+					break
+
+			# Process, never lose the worker to an unexpected exception
+			try:
+				results = self.function(items)
+			except Exception as err:
+				tb = traceback.format_tb(err.__traceback__)
+				logging.critical('{} in {} stage: {}\n{}'.format(type(err).__name__, self.name, err, ''.join(tb)))
+				results = list()
+			if self.output is not None:
+				for result in results:
+					self.output.put(result)
+
+			# Allow waiting for processed items at shutdown
+			for item in items:
+				self.processed.increment()
+				self.queue.task_done()
+
+	## Block until all queued items are processed
+	#  @param timeout Maximum seconds to wait, None to wait forever
+	#  @return False on timeout
+	def join(self, timeout=None):
+		deadline = None if timeout is None else time.perf_counter() + timeout
+		with self.queue.all_tasks_done:
+			while self.queue.unfinished_tasks:
+				remaining = None if deadline is None else deadline - time.perf_counter()
+				if remaining is not None and remaining <= 0:
+					return False
+				self.queue.all_tasks_done.wait(remaining)
+		return True
+
+	## Queue depth and throughput since the last read
+	#  @return Tuple of name, queue depth and processed items per second
+	def read(self):
+		now = time.perf_counter()
+		rate = self.processed.take() / (now - self.read_timestamp)
+		self.read_timestamp = now
+		return self.name, self.queue.qsize(), rate
+
+## Set of open sockets which can be aborted at once from another thread
+class ConnectionGroup:
+	## Create an empty group
+	def __init__(self):
+		self.sockets = set()
+		self.lock = threading.Lock()
+		self.cancelled = threading.Event()
+
+	## Add a socket to the group, closes it immediately if the group is already cancelled
+	#  @param sock Connected socket
+	#  @exception UtilError
+	def add(self, sock):
+		with self.lock:
+			if not self.cancelled.is_set():
+				self.sockets.add(sock)
+				return
+		abort_socket(sock)
+		raise UtilError('Connection cancelled')
+
+	## Remove a socket from the group without closing it
+	#  @param sock Socket previously added
+	def discard(self, sock):
+		with self.lock:
+			self.sockets.discard(sock)
+
+	## Abort all sockets in the group and reject further ones
+	def cancel(self):
+		with self.lock:
+			self.cancelled.set()
+			sockets = list(self.sockets)
+			self.sockets.clear()
+		for sock in sockets:
+			abort_socket(sock)
 
 ## Establishes and closes a TCP connection
 class TCPConnection:
-	def __init__(self, ip, port, timeout):
+	## Connect to a remote host
+	#  @param group Optional ConnectionGroup allowing to abort the connection
+	#  @exception UtilError
+	def __init__(self, ip, port, timeout, group=None):
 		logging.info('Connecting to peer ...')
 		try:
 			self.sock = socket.create_connection((ip, port), timeout)
 		except OSError as err:
 			raise UtilError('Connection establishment failed: {}'.format(err))
+		self.group = group
+		if group is not None:
+			group.add(self.sock) # UtilError
 		logging.info('Connection established')
 
 	def __enter__(self):
 		return self.sock
 
 	def __exit__(self, exc_type, exc_value, tb):
+		if self.group is not None:
+			self.group.discard(self.sock)
 		try:
 			self.sock.close()
 		except OSError as err:
@@ -113,115 +669,553 @@ class TCPConnection:
 			logging.info('Connection closed')
 
 ## Activity timer
+#  @note Each thread only writes its own state, a tuple replaced as a whole, so transitions need no lock.
+#  The reader derives workloads from the difference of accumulated seconds to its last read.
 class ActivityTimer:
 	## Initialize an activity timer
 	def __init__(self):
 		self.read_timestamp = time.perf_counter()
 		self.timer = dict()
-		self.lock = threading.RLock()
+		self.last = dict()
+		self.lock = threading.Lock()
 
 	## Register a thread to be timed
 	#  @param thread Identifier
 	#  @param active Register thread as active or inactive
 	def register(self, thread, active=True):
 		with self.lock:
-			self.timer[thread] = (
-					active, # is active
-					0, # timer seconds
-					time.perf_counter()) # unpaused timestamp
+			self.timer[thread] = ThreadActivity(active)
+			self.last[thread] = 0.0
+
+	## Stop timing a finished thread
+	#  @param thread Identifier
+	def unregister(self, thread):
+		with self.lock:
+			self.timer.pop(thread, None)
+			self.last.pop(thread, None)
 
 	## Mark a thread as inactive and add active seconds
 	#  @param thread Identifier
+	#  @note Must be called by the timed thread only
 	def inactive(self, thread):
-		with self.lock:
-			if self.timer[thread][0]:
-				self.timer[thread] = (
-						False,
-						self.timer[thread][1] + time.perf_counter() - self.timer[thread][2],
-						None)
-			else:
-				raise UtilError('Timer for thread {} is already inactive'.format(thread))
+		timer = self.timer[thread]
+		active, seconds, since = timer.state
+		if not active:
+			raise UtilError('Timer for thread {} is already inactive'.format(thread))
+		timer.state = (False, seconds + time.perf_counter() - since, None)
 
 	## Mark a thread as active and log timestamp
 	#  @param thread Identifier
+	#  @note Must be called by the timed thread only
 	def active(self, thread):
-		with self.lock:
-			if not self.timer[thread][0]:
-				self.timer[thread] = (
-						True,
-						self.timer[thread][1],
-						time.perf_counter())
-			else:
-				raise UtilError('Timer for thread {} is already inactive'.format(thread))
-
-	## Extract active seconds exactly and reset active threads
-	#  @return Average thread workload between 0 and 1
+		timer = self.timer[thread]
+		active, seconds, since = timer.state
+		if active:
+			raise UtilError('Timer for thread {} is already active'.format(thread))
+		timer.state = (True, seconds, time.perf_counter())
+
+	## Extract active seconds since the last read
+	#  @return Tuple of average thread workload between 0 and 1 and dict of min, p10, p50, p90 and max workload
+	#  @note Must not be called concurrently
 	def read(self):
 		# Calculate total time delta
 		perf_counter = time.perf_counter()
 		total_delta = perf_counter - self.read_timestamp
 		self.read_timestamp = perf_counter
 
-		# Calculate workload
+		# Calculate workload per thread from accumulated seconds, without touching thread states,
+		# the lock keeps unregistered threads out of the last seconds
 		workload = list()
 		with self.lock:
-			for thread in self.timer:
-				active = self.timer[thread][0]
+			for thread, timer in self.timer.items():
+				active, seconds, since = timer.state
 				if active:
-					self.inactive(thread)
-				workload.append(self.timer[thread][1] / total_delta)
-				logging.info('Workload of thread {} is {}s/{}s = {}'.format(thread, round(self.timer[thread][1]), round(total_delta), workload[-1]))
-				self.register(thread, active)
+					seconds += perf_counter - since
+				last = self.last.get(thread, 0.0)
+				self.last[thread] = seconds
+				workload.append(min(max((seconds - last) / total_delta, 0), 1))
+		if not workload:
+			return 0, dict()
+		workload.sort()
+		average = sum(workload) / len(workload)
+		distribution = {
+				'min': workload[0],
+				'p10': workload[int(0.1 * (len(workload) - 1))],
+				'p50': workload[int(0.5 * (len(workload) - 1))],
+				'p90': workload[int(0.9 * (len(workload) - 1))],
+				'max': workload[-1]}
+		logging.info('Overall workload of {} threads is {}, distribution {}'.format(len(workload), average, distribution))
+		return average, distribution
+
+## Activity state of one thread
+class ThreadActivity:
+	__slots__ = ('state',)
+
+	## Start timing
+	#  @param active Whether the thread starts as active
+	def __init__(self, active):
+		# Is active, accumulated active seconds, timestamp of last activation
+		self.state = (active, 0.0, time.perf_counter() if active else None)
+
+## Counts of Reasons per context, each thread counts into its own arrays without locking and the reader merges them
+#  @note Contexts are strings or tuples, written as leading CSV columns; counts of finished threads are folded when read
+class ErrorCounter:
+	def __init__(self):
+		self.local = threading.local()
+		self.threads = list()
+		self.retired = dict()
+		self.lock = threading.Lock()
+
+	## Count a failure
+	#  @param context Hashable context, e.g. 'First contact' or a tuple of torrent, URL and request result
+	#  @param reason Reason
+	def count(self, context, reason):
+		try:
+			counts = self.local.counts
+		except AttributeError:
+			counts = self.local.counts = dict()
+			with self.lock:
+				self._retire()
+				self.threads.append((threading.current_thread(), counts))
+		try:
+			row = counts[context]
+		except KeyError:
+			row = counts[context] = array.array('Q', bytes(8 * len(Reason)))
+		row[reason] += 1
+
+	## Merge the counts of all threads
+	#  @return Dict of context and array of counts indexed by Reason
+	def read(self):
+		with self.lock:
+			self._retire()
+			threads = list(self.threads)
+			result = dict()
+			merge_counts(result, self.retired)
+		for thread, counts in threads:
+			merge_counts(result, counts)
+		return result
+
+	## Fold the counts of finished threads into the retired counts
+	#  @note Call with lock held, threads register often enough to bound the kept counts of finished threads
+	def _retire(self):
+		for thread, counts in self.threads:
+			if not thread.is_alive():
+				merge_counts(self.retired, counts)
+		self.threads = [item for item in self.threads if item[0].is_alive()]
+
+	## Merged counts as CSV lines
+	#  @return Lines of context columns, reason label and count
+	def __str__(self):
+		data = list()
+		for context, row in self.read().items():
+			columns = ','.join(str(column) for column in context) if isinstance(context, tuple) else str(context)
+			for reason, count in enumerate(row):
+				if count:
+					data.append('{},{},{}'.format(columns, REASON_LABELS[Reason(reason)], count))
+		return '\n'.join(data)
+
+	def write_csv(self, name):
 		try:
-			workload = sum(workload) / len(workload)
-		except ZeroDivisionError:
-			workload = 0
-		logging.info('Overall thread workload is {}'.format(workload))
-		return workload
+			with open(name, mode='w') as file:
+				file.write(self.__str__())
+		except OSError as err:
+			logging.error('Failed to write error stats: {}'.format(err))
+			logging.info(self.__str__())
+
+# Set of unsigned 64 bit integers with open addressing in a flat array
+# - needs 16 to 32 bytes per item instead of about 70 for a set of ints
+# - is not thread-safe
+class IntegerSet:
+	## Create an empty set
+	#  @param capacity Initial number of slots, power of two
+	def __init__(self, capacity=1024):
+		self.slots = array.array('Q', bytes(8 * capacity))
+		self.used = 0
+		self.zero = False
+
+	def __len__(self):
+		return self.used + self.zero
+
+	def __contains__(self, key):
+		if key == 0:
+			return self.zero
+		slots = self.slots
+		return slots[probe(slots, key)] == key
+
+	def __iter__(self):
+		if self.zero:
+			yield 0
+		for key in self.slots:
+			if key != 0:
+				yield key
+
+	## Add an integer
+	#  @param key Integer between 0 and 2**64-1
+	#  @return True if the key was not in the set before
+	def add(self, key):
+		if key == 0:
+			added = not self.zero
+			self.zero = True
+			return added
+		index = probe(self.slots, key)
+		if self.slots[index] == key:
+			return False
+		self.slots[index] = key
+		self.used += 1
+		if self.used * 2 > len(self.slots):
+			self._grow()
+		return True
+
+	## Double the number of slots, swap the array at once for concurrent readers
+	def _grow(self):
+		slots = array.array('Q', bytes(16 * len(self.slots)))
+		for key in self.slots:
+			if key != 0:
+				slots[probe(slots, key)] = key
+		self.slots = slots
+
+# Mapping of unsigned 64 bit integers to unsigned 64 bit integers in flat arrays
+# - is not thread-safe for writers, a single writer may run concurrently to readers
+class IntegerMap:
+	## Create an empty map
+	#  @param capacity Initial number of slots, power of two
+	def __init__(self, capacity=1024):
+		# Keys and values are swapped together on growth
+		self.table = (array.array('Q', bytes(8 * capacity)), array.array('Q', bytes(8 * capacity)))
+		self.used = 0
+		self.zero = None
+
+	def __len__(self):
+		return self.used + (self.zero is not None)
+
+	def __contains__(self, key):
+		return self.get(key) is not None
+
+	def __getitem__(self, key):
+		value = self.get(key)
+		if value is None:
+			raise KeyError(key)
+		return value
+
+	def __setitem__(self, key, value):
+		if key == 0:
+			self.zero = value
+			return
+		keys, values = self.table
+		index = probe(keys, key)
+		values[index] = value
+		if keys[index] != key:
+			# Publish the key after its value for concurrent readers
+			keys[index] = key
+			self.used += 1
+			if self.used * 2 > len(keys):
+				self._grow()
+
+	## Get a value
+	#  @param key Integer key
+	#  @param default Returned if the key is missing
+	#  @return The value
+	def get(self, key, default=None):
+		if key == 0:
+			return default if self.zero is None else self.zero
+		keys, values = self.table
+		index = probe(keys, key)
+		if keys[index] != key:
+			return default
+		return values[index]
+
+	def items(self):
+		if self.zero is not None:
+			yield 0, self.zero
+		for key, value in zip(*self.table):
+			if key != 0:
+				yield key, value
+
+	## Double the number of slots
+	def _grow(self):
+		old_keys, old_values = self.table
+		keys = array.array('Q', bytes(16 * len(old_keys)))
+		values = array.array('Q', bytes(16 * len(old_keys)))
+		for key, value in zip(old_keys, old_values):
+			if key != 0:
+				index = probe(keys, key)
+				keys[index] = key
+				values[index] = value
+		self.table = (keys, values)
+
+# Registry of evaluated peers, identified by IPv4 address and torrent since ports may change
+# - maps incoming peers to their database key and remembers actively contacted peers
+# - is thread-safe with one writer lock per stripe, lookups read without locking
+class PeerRegistry:
+	## Create an empty registry
+	#  @param stripes Number of independently locked stripes
+	def __init__(self, stripes=16):
+		self.stripes = [(threading.Lock(), IntegerMap(), IntegerSet()) for i in range(stripes)]
+
+	## Get the stripe of an address
+	#  @param equality Packed address and torrent
+	#  @return Tuple of lock, incoming map and outgoing set
+	def _stripe(self, equality):
+		return self.stripes[equality % len(self.stripes)]
+
+	## Number of unique incoming peers, approximate while writers are active
+	def incoming_count(self):
+		return sum(len(incoming) for lock, incoming, outgoing in self.stripes)
+
+	## Look up the database key of a known incoming peer without locking
+	#  @param ip_address IPv4 address as string
+	#  @param torrent Torrent key
+	#  @return Database key or None
+	def incoming_key(self, ip_address, torrent):
+		equality = pack_address(ip_address, torrent)
+		return self._stripe(equality)[1].get(equality)
+
+	## Remember an incoming peer
+	#  @param ip_address IPv4 address as string
+	#  @param torrent Torrent key
+	#  @param key Database key
+	def add_incoming(self, ip_address, torrent, key):
+		equality = pack_address(ip_address, torrent)
+		lock, incoming, outgoing = self._stripe(equality)
+		with lock:
+			incoming[equality] = key
+
+	## Check without locking whether a peer was actively contacted
+	#  @param ip_address IPv4 address as string
+	#  @param torrent Torrent key
+	#  @return True if known as outgoing peer
+	def is_outgoing(self, ip_address, torrent):
+		equality = pack_address(ip_address, torrent)
+		return equality in self._stripe(equality)[2]
+
+	## Remember an actively contacted peer
+	#  @param ip_address IPv4 address as string
+	#  @param torrent Torrent key
+	def add_outgoing(self, ip_address, torrent):
+		equality = pack_address(ip_address, torrent)
+		lock, incoming, outgoing = self._stripe(equality)
+		with lock:
+			outgoing.add(equality)
+
+	## Copy all entries, e.g. for checkpoints
+	#  @return Tuple of list of packed address and key tuples of incoming peers and list of packed addresses of outgoing peers
+	def dump(self):
+		incoming_items = list()
+		outgoing_keys = list()
+		for lock, incoming, outgoing in self.stripes:
+			with lock:
+				incoming_items.extend(incoming.items())
+				outgoing_keys.extend(outgoing)
+		return incoming_items, outgoing_keys
+
+	## Add entries by packed address, e.g. from checkpoints
+	#  @param incoming_items Iterable of packed address and key tuples of incoming peers
+	#  @param outgoing_keys Iterable of packed addresses of outgoing peers
+	def restore(self, incoming_items, outgoing_keys):
+		for equality, key in incoming_items:
+			lock, incoming, outgoing = self._stripe(equality)
+			with lock:
+				incoming[equality] = key
+		for equality in outgoing_keys:
+			lock, incoming, outgoing = self._stripe(equality)
+			with lock:
+				outgoing.add(equality)
 
 # This queue
-# - saves each item only once, regarding the item's hash function
+# - saves each item only once, regarding the item's integer key
 # - rejects items which were stored earlier and removed meanwhile
 # - gives feedback whether or not the item has been accepted
 # - allows adding an item with circumvention of these restrictions
-# - uses the heap queue algorithm to release smallest items first
-# - is thread-safe
-# Items must define rich comparison methods and the hash function
+# - uses the heap queue algorithm to release smallest items first per shard
+# - shares get calls between shards by weighted fair queueing, limited by a cap of unfinished items per shard
+# - is thread-safe with one lock per shard
+# Items must define rich comparison methods, the key function must return unique integers between 0 and 2**64-1
 class PrioritySetQueue:
-	def __init__(self):
+	## Create an empty queue
+	#  @param key Function returning the identifying integer of an item
+	#  @param shard Function returning the shard name of an item, equal keys must map to equal shards
+	#  @param ready Function telling whether an item may be processed now, only ready heads are taken
+	#  @param maxsize Number of queued items above which put rejects new items, 0 for no bound
+	def __init__(self, key, shard, ready=lambda item: True, maxsize=0):
+		self.key = key
+		self.maxsize = maxsize
+		self.shard = shard
+		self.ready = ready
+		self.shards = dict()
+		self.order = list()
 		self.mutex = threading.Lock()
-		self.queue = list()
-		self.total = set()
+		self.virtual_time = 0
 
+	## Approximate length, does not lock
 	def __len__(self):
-		with self.mutex:
-			return len(self.queue)
+		return sum(len(shard.queue) for shard in self.order)
 
+	## Check the bound, does not lock
+	#  @return True if put would reject new items
+	def full(self):
+		return 0 < self.maxsize <= len(self)
+
+	## Get or create a shard
+	#  @param name Shard name
+	#  @return QueueShard
+	def _get_shard(self, name):
+		try:
+			return self.shards[name]
+		except KeyError:
+			with self.mutex:
+				if name not in self.shards:
+					self.shards[name] = QueueShard(name)
+					self.order = self.order + [self.shards[name]]
+				return self.shards[name]
+
+	## Set scheduling parameters of a shard
+	#  @param name Shard name
+	#  @param weight Relative share of get calls
+	#  @param cap Maximum number of items taken but not marked done, None for no limit
+	def configure(self, name, weight, cap=None):
+		if weight <= 0:
+			raise UtilError('Shard weight must be positive')
+		shard = self._get_shard(name)
+		shard.weight = weight
+		shard.cap = math.inf if cap is None else cap
+
+	## Queue an item unless its key was queued before
+	#  @param item The item
+	#  @return False if the item is a duplicate
+	#  @exception PrioritySetQueueFull
 	def put(self, item):
-		with self.mutex:
-			if hash(item) in self.total:
+		if self.full():
+			raise PrioritySetQueueFull
+		key = self.key(item)
+		shard = self._get_shard(self.shard(item))
+		with shard.lock:
+			if not shard.total.add(key):
 				return False
-			else:
-				self.total.add(hash(item))
-				heapq.heappush(self.queue, item)
-				return True
+			heapq.heappush(shard.queue, item)
+			return True
 
+	## Queue an item regardless of its key and the bound, used to requeue known items
+	#  @param item The item
 	def force_put(self, item):
-		with self.mutex:
-			self.total.add(hash(item))
-			heapq.heappush(self.queue, item)
+		key = self.key(item)
+		shard = self._get_shard(self.shard(item))
+		with shard.lock:
+			shard.total.add(key)
+			heapq.heappush(shard.queue, item)
 
+	## Pop the ready head of the shard with the smallest virtual finish time
+	#  @note Heads which are not ready stay queued, so the finish times and served counts only charge processed items
+	#  @return Item, which must be passed to task_done after processing
+	#  @exception PrioritySetQueueEmpty if no shard below its cap has a ready head
 	def get(self):
-		with self.mutex:
+		# Choose candidates by peeking at the heads without locking
+		candidates = list()
+		for shard in self.order:
+			if shard.active >= shard.cap:
+				continue
 			try:
-				return heapq.heappop(self.queue)
+				head = shard.queue[0]
 			except IndexError:
-				raise PrioritySetQueueEmpty
+				continue
+			if self.ready(head):
+				candidates.append(shard)
+
+		# Lock only the chosen shard, fall back to the next one on a race
+		candidates.sort(key=lambda shard: max(shard.finish, self.virtual_time))
+		for shard in candidates:
+			with shard.lock:
+				if not shard.queue or not self.ready(shard.queue[0]):
+					continue
+				item = heapq.heappop(shard.queue)
+				start = max(shard.finish, self.virtual_time)
+				shard.finish = start + 1 / shard.weight
+				shard.active += 1
+				shard.served += 1
+			self.virtual_time = start
+			return item
+		raise PrioritySetQueueEmpty
+
+	## Mark an item taken with get as processed
+	#  @param item The item
+	def task_done(self, item):
+		shard = self.shards.get(self.shard(item))
+		if shard is None:
+			return
+		with shard.lock:
+			shard.active -= 1
+
+	## Drop a shard with all its items and known keys
+	#  @param name Shard name
+	#  @return Number of dropped items
+	def remove_shard(self, name):
+		with self.mutex:
+			shard = self.shards.pop(name, None)
+			if shard is None:
+				return 0
+			self.order = [other for other in self.order if other is not shard]
+		with shard.lock:
+			dropped = len(shard.queue)
+			shard.queue = list()
+		return dropped
+
+	## Copy the queue content per shard, e.g. for checkpoints
+	#  @note Items taken but not yet put back are only contained in the known keys
+	#  @return Dict of shard name and tuple of known keys and queued items
+	def snapshot(self):
+		content = dict()
+		for shard in self.order:
+			with shard.lock:
+				content[shard.name] = (list(shard.total), list(shard.queue))
+		return content
+
+	## Add known keys and items, e.g. from checkpoints
+	#  @param content Dict of shard name and tuple of known keys, which put rejects afterwards, and items to queue
+	def restore(self, content):
+		for name, (keys, items) in content.items():
+			shard = self._get_shard(name)
+			with shard.lock:
+				for key in keys:
+					shard.total.add(key)
+				for item in items:
+					shard.total.add(self.key(item))
+					shard.queue.append(item)
+				heapq.heapify(shard.queue)
+
+	## Share of get calls per shard since the last call
+	#  @return Dict of shard name and share between 0 and 1
+	def read_shares(self):
+		served = dict()
+		for shard in self.order:
+			with shard.lock:
+				served[shard.name] = shard.served
+				shard.served = 0
+		total = sum(served.values())
+		return {name: count / total if total else 0 for name, count in served.items()}
+
+## Heap, set of known keys and scheduling state of one PrioritySetQueue shard
+class QueueShard:
+	__slots__ = ('name', 'lock', 'queue', 'total', 'weight', 'cap', 'active', 'finish', 'served')
+
+	def __init__(self, name):
+		self.name = name
+		self.lock = threading.Lock()
+		self.queue = list()
+		self.total = IntegerSet()
+		self.weight = 1
+		self.cap = math.inf
+		self.active = 0
+		self.finish = 0
+		self.served = 0
 
 class PrioritySetQueueEmpty(Exception):
 	pass
 
+class PrioritySetQueueFull(Exception):
+	pass
+
 class RichComparisonMixin:
+	__slots__ = ()
+
 	def __lt__(self, other):
 		raise NotImplementedError
 
@@ -253,12 +1247,12 @@ class DictCounter:
 				data.append('{},{}'.format(item, count))
 		return '\n'.join(data)
 
-	def count(self, item):
+	def count(self, item, amount=1):
 		with self.lock:
 			try:
-				self.counter[item] += 1
+				self.counter[item] += amount
 			except KeyError:
-				self.counter[item] = 1
+				self.counter[item] = amount
 
 	def reset(self, item):
 		with self.lock:
@@ -269,6 +1263,14 @@ class DictCounter:
 				value = 0
 		return value
 
+	## Read all counts and clear the counter
+	#  @return Dict of items and counts
+	def take(self):
+		with self.lock:
+			counter = self.counter
+			self.counter = dict()
+		return counter
+
 	def write_csv(self, name):
 		try:
 			with open(name, mode='w') as file:
@@ -279,6 +1281,55 @@ class DictCounter:
 
 ### METHODS ###
 
+## Add error counts to others
+#  @param target Dict of context and count array, changed
+#  @param source Dict of context and count array
+def merge_counts(target, source):
+	for context, row in list(source.items()):
+		try:
+			target_row = target[context]
+		except KeyError:
+			target[context] = array.array('Q', row)
+		else:
+			for reason, count in enumerate(row):
+				if count:
+					target_row[reason] += count
+
+## Classify an error with the taxonomy
+#  @param err Exception, explicitly chained causes are followed
+#  @param default Reason of errors without known cause
+#  @return Reason
+def classify_error(err, default=Reason.other):
+	while err is not None:
+		reason = getattr(err, 'reason', None)
+		if isinstance(reason, Reason):
+			return reason
+		if isinstance(err, urllib.error.HTTPError):
+			return Reason.http_status
+		if isinstance(err, urllib.error.URLError) and isinstance(err.reason, OSError):
+			err = err.reason
+		if isinstance(err, socket.timeout):
+			return Reason.timeout
+		if isinstance(err, socket.gaierror):
+			return Reason.name_resolution
+		if isinstance(err, OSError):
+			return ERRNO_REASONS.get(err.errno, Reason.other_network)
+		if isinstance(err, http.client.HTTPException):
+			return Reason.bad_response
+		err = err.__cause__
+	return default
+
+## Add histograms to others
+#  @param target Dict of key and LogHistogram, changed
+#  @param source Dict of key and LogHistogram
+def merge_histograms(target, source):
+	for key, histogram in list(source.items()):
+		try:
+			target[key].merge(histogram)
+		except KeyError:
+			target[key] = LogHistogram()
+			target[key].merge(histogram)
+
 ## Convert bytes to hex string
 #  @param data Input bytes
 #  @return Hex string
@@ -364,6 +1415,70 @@ def plot_receive_duration(data, outfile):
 		bbox_inches = 'tight')
 	matplotlib.pyplot.close()
 
+## Find the slot of a key in an open addressing table with linear probing
+#  @param slots Array of keys with a power of two length, zero marks empty slots
+#  @param key Non-zero integer
+#  @return Index of the key or of the empty slot to insert it
+def probe(slots, key):
+	mask = len(slots) - 1
+	index = ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32 & mask
+	while True:
+		slot = slots[index]
+		if slot == key or slot == 0:
+			return index
+		index = (index + 1) & mask
+
+## Pack an IPv4 address and a torrent key into one integer
+#  @param ip_address IPv4 address as string
+#  @param torrent Torrent key below 2**16
+#  @return Integer below 2**48
+def pack_address(ip_address, torrent):
+	return torrent << 32 | struct.unpack('!I', socket.inet_aton(ip_address))[0]
+
+## Pack an IPv4 endpoint and a torrent key into one integer
+#  @param ip_address IPv4 address as string
+#  @param port Port number
+#  @param torrent Torrent key below 2**16
+#  @return Integer below 2**64
+def pack_endpoint(ip_address, port, torrent):
+	return pack_address(ip_address, torrent) << 16 | port
+
+## Unpack an integer created by pack_endpoint
+#  @param endpoint Packed endpoint
+#  @return Tuple of IPv4 address as string, port and torrent key
+def unpack_endpoint(endpoint):
+	ip_address = socket.inet_ntoa(struct.pack('!I', endpoint >> 16 & 0xffffffff))
+	return ip_address, endpoint & 0xffff, endpoint >> 48
+
+## Parses bytes to ip addresses and ports
+#  @param ip_bytes Input block
+#  @return list of ip port tuples
+def parse_ips(ip_bytes):
+	peers_count = int(len(ip_bytes) / 6)
+	ips = list()
+	for peer in range(0, peers_count):
+		offset = peer * 6
+		try:
+			peer_ip = str(ipaddress.ip_address(ip_bytes[offset:offset+4]))
+		except ValueError as err:
+			logging.warning('Received invalid ip address: {}'.format(err))
+			continue
+		peer_port = struct.unpack("!H", ip_bytes[offset+4:offset+6])[0]
+		ips.append((peer_ip, peer_port))
+	return ips
+
+## Wake up threads blocking on a socket and close it
+#  @param sock The socket to abort
+def abort_socket(sock):
+	try:
+		sock.shutdown(socket.SHUT_RDWR)
+	except OSError:
+		pass
+	try:
+		sock.close()
+	except OSError:
+		pass
+
 ## Get the host via reverse DNS
 #  @param ip_address The address in question
 #  @return Hostname with TLD and SLD or empty string or None